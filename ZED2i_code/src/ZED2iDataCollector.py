@@ -15,6 +15,11 @@ parent_dir = os.path.abspath(os.path.join(current_dir, '..', '..'))
 sys.path.append(parent_dir)
 
 from shared_sensor_code.TimeSync import TimeSync
+from shared_sensor_code.metrics_registry import Counter, Gauge, Histogram, start_metrics_server
+from shared_sensor_code.start_sync import wait_for_start
+
+sys.path.append(os.path.join(parent_dir, 'ZED2i_code', 'zed_data_analysis_python'))
+from body_json_stream2csv import convert_json_to_zbody
 
 # Constants
 HOME_DIR = os.path.expanduser("~")
@@ -25,6 +30,14 @@ LOG_DIR = f"{HOME_DIR}/labx_master/ZED2i_code/logs"
 
 os.makedirs(LOG_DIR, exist_ok=True)
 
+ZED_PROCESS_UP = Gauge('labx_zed_process_up', '1 while the ZED executable is running.')
+SEGMENTS_WRITTEN = Counter('labx_zed_segments_written_total', 'Body tracking JSON segments written by the ZED executable.')
+BYTES_WRITTEN = Counter('labx_zed_bytes_written_total', 'Bytes of body tracking JSON segments written.')
+SEGMENT_ROTATIONS = Counter('labx_zed_segment_rotations_total', 'ROTATE commands sent to the ZED executable.')
+EXECUTABLE_ERRORS = Counter('labx_zed_executable_error_lines_total', 'Lines the ZED executable printed on stderr.')
+CONVERSION_SECONDS = Histogram('labx_zed_conversion_seconds', 'Time to convert one segment to .zbody.',
+                               buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
 
 logging.basicConfig(
     filename=os.path.join(LOG_DIR, f"zed_collector_log_{datetime.now().strftime('%Y%m%d_%H%M%S%f')[:-3]}.log"),
@@ -60,6 +73,10 @@ def parse_arguments():
     parser.add_argument('--central_server_url', type=str, default=default_central_server_url, help='URL of the central server to send data')
     parser.add_argument('--no-gui', default=True, action='store_true', help='Run the ZED executable in headless mode without GUI')
     parser.add_argument('--batch_duration', type=int, default=300, help='Duration of each data batch in seconds')
+    parser.add_argument('--convert_to_binary', action='store_true', help='Also write each finished segment in the memory-mappable .zbody format')
+    parser.add_argument('--wait_for_start', action='store_true', help="Open the ZED, print READY and wait for 'START <timestamp>' on stdin")
+    parser.add_argument('--metrics_port', type=int, default=0, help="Port for the Prometheus metrics endpoint (0 disables it)")
+    parser.add_argument('--time_sync_transport', type=str, choices=['json', 'binary'], default='json', help="TimeSync wire format: JSON over HTTP or binary telemetry")
     return parser.parse_args()
 
 class ZEDDataCollector:
@@ -72,7 +89,10 @@ class ZEDDataCollector:
         capture_duration=None,
         base_filename='zed_default_data',
         no_gui=True,
-        batch_duration=300
+        batch_duration=300,
+        convert_to_binary=False,
+        time_sync_transport='json',
+        wait_for_start=False
     ):
         # Configuration
         self.deployed_sensor_id = deployed_sensor_id
@@ -85,14 +105,23 @@ class ZEDDataCollector:
         self.stop_event = stop_event
         self.no_gui = no_gui
         self.batch_duration = batch_duration
+        self.convert_to_binary = convert_to_binary
+        self.time_sync_transport = time_sync_transport
+        self.wait_for_start = wait_for_start
+        self.zed_ready = threading.Event()  # Set when the executable has opened the camera and models
 
         # TimeSync object
         self.time_sync = TimeSync(
             deployed_sensor_id=self.deployed_sensor_id,
             central_server_url=self.central_server_url,
-            sync_polling_interval=self.sync_polling_interval
+            sync_polling_interval=self.sync_polling_interval,
+            transport=self.time_sync_transport
         )
 
+        # Threads forwarding the ZED executable's stdout and stderr
+        self.output_threads = []
+        self.conversion_threads = []
+
         # Thread for data collection
         self.collect_thread = threading.Thread(target=self.collect_zed_data, daemon=True)
 
@@ -109,77 +138,108 @@ class ZEDDataCollector:
         logging.info("ZED Data Collector started.")
 
     def collect_zed_data(self):
-        """Collect data from the ZED camera in batches."""
+        """Run one persistent ZED process and rotate its output file every batch."""
         logging.info("Starting ZED data collection.")
         capture_start_time = time.time()
 
+        output_file = self.next_output_file(self.planned_batch_duration(0))
+        process = self.launch_zed_executable(output_file)
+        if process is None:
+            logging.info("ZED data collection stopped.")
+            return
+
+        if self.wait_for_start:
+            if not self.arm_and_start(process):
+                self.stop_zed_executable(process)
+                logging.info("ZED data collection stopped before start.")
+                return
+            capture_start_time = time.time()
+
+        batch_start_time = capture_start_time
         while not self.stop_event.is_set():
-            # Calculate remaining capture time
-            if self.capture_duration:
-                elapsed_capture_time = time.time() - capture_start_time
-                remaining_capture_time = self.capture_duration - elapsed_capture_time
-                if remaining_capture_time <= 0:
-                    logging.info(f"Reached total capture duration of {self.capture_duration} seconds.")
-                    break
-                current_batch_duration = min(self.batch_duration, remaining_capture_time)
-            else:
-                current_batch_duration = self.batch_duration
-
-            # Run ZED executable for current_batch_duration seconds
-            output_file = self.run_zed_executable(int(current_batch_duration))
-
-            if output_file:
-                logging.info(f"Data saved to {output_file}")
-                print(f"Data saved to {output_file}")
+            if process.poll() is not None:
+                logging.error(f"ZED executable exited unexpectedly with code {process.returncode}.")
+                break
 
-            if self.capture_duration and (time.time() - capture_start_time) >= self.capture_duration:
+            now = time.time()
+            elapsed_capture_time = now - capture_start_time
+            if self.capture_duration and elapsed_capture_time >= self.capture_duration:
                 logging.info(f"Reached total capture duration of {self.capture_duration} seconds.")
                 break
 
+            if now - batch_start_time >= self.batch_duration:
+                output_file = self.next_output_file(self.planned_batch_duration(elapsed_capture_time))
+                self.send_control_command(process, f"ROTATE {output_file}")
+                SEGMENT_ROTATIONS.inc()
+                logging.info(f"Rotated ZED output to {output_file}")
+                batch_start_time = now
+
+            # Wake up for the next rotation, the end of the capture, or a stop request
+            next_deadline = batch_start_time + self.batch_duration
+            if self.capture_duration:
+                next_deadline = min(next_deadline, capture_start_time + self.capture_duration)
+            self.stop_event.wait(max(0.0, min(next_deadline - time.time(), 1.0)))
+
+        self.stop_zed_executable(process)
         logging.info("ZED data collection stopped.")
 
-    def run_zed_executable(self, duration):
+    def arm_and_start(self, process):
+        """Wait for the executable to load, report ready, then release it at the synchronized start time."""
+        # Loading the body tracking model can take a while; stop waiting if the process dies
+        while not self.zed_ready.wait(1.0):
+            if process.poll() is not None or self.stop_event.is_set():
+                logging.error("ZED executable exited before it was ready.")
+                return False
+        if wait_for_start(self.stop_event) is None:
+            return False
+        # The armed executable has not grabbed anything yet; name the first segment after the real start
+        self.send_control_command(process, f"ROTATE {self.next_output_file(self.planned_batch_duration(0))}")
+        self.send_control_command(process, "START")
+        return True
+
+    def planned_batch_duration(self, elapsed_capture_time):
+        """Length of the next segment, shortened to fit the remaining capture time."""
+        if self.capture_duration:
+            return max(1, int(min(self.batch_duration, self.capture_duration - elapsed_capture_time)))
+        return self.batch_duration
+
+    def next_output_file(self, duration):
+        # Millisecond resolution, like the camera and radar segments, so quick rotations do not collide
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S%f')[:-3]
+        return os.path.join(
+            self.data_output_directory,
+            f"{self.base_filename}_{timestamp}_{duration}s.json"
+        )
+
+    def launch_zed_executable(self, output_file):
         """
-        Run the ZED C++ executable for body tracking data collection.
+        Start the ZED C++ executable once in control mode.
+
+        The process keeps the camera, body tracking model and positional tracking open
+        for the whole capture; segments are rotated through ROTATE commands on stdin.
 
         Args:
-            duration (int): Duration in seconds for which to run the ZED executable.
+            output_file (str): Path of the first output segment.
 
         Returns:
-            str or None: Path to the output file if successful, else None.
+            subprocess.Popen or None: The running process, or None if it could not start.
         """
-        try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_file = os.path.join(
-                self.data_output_directory,
-                f"{self.base_filename}_{timestamp}_{duration}s.json"
-            )
-            logging.info(f"Running ZED executable: {ZED_EXECUTABLE_PATH}")
-
-            # Construct the command with optional --no-gui flag
-            command = [
-                ZED_EXECUTABLE_PATH,
-                output_file,
-                str(duration)
-            ]
-
-            if self.no_gui:
-                command.insert(1, "--no-gui")  # Insert after executable path
-
-            logging.info(f"Executing command: {' '.join(command)}")
+        command = [ZED_EXECUTABLE_PATH, "--control", output_file, "0"]
+        if self.wait_for_start:
+            command.insert(2, "--armed")  # Hold off grabbing until START
+        if self.no_gui:
+            command.insert(1, "--no-gui")  # Insert after executable path
 
-            result = subprocess.run(
+        logging.info(f"Executing command: {' '.join(command)}")
+        try:
+            process = subprocess.Popen(
                 command,
-                check=True,
-                capture_output=True,
-                text=True
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                bufsize=1
             )
-            logging.info("ZED executable completed successfully.")
-            logging.info(f"ZED executable output: {result.stdout}")
-            return output_file
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Error running ZED executable: {e.stderr}")
-            return None
         except FileNotFoundError:
             logging.error(f"ZED executable not found at path: {ZED_EXECUTABLE_PATH}")
             return None
@@ -187,6 +247,80 @@ class ZEDDataCollector:
             logging.error(f"Unexpected error running ZED executable: {str(e)}")
             return None
 
+        ZED_PROCESS_UP.set(1)
+
+        # Stream output as it arrives instead of buffering it until exit
+        self.output_threads = [
+            threading.Thread(target=self.stream_process_output, args=(process.stdout, logging.INFO), daemon=True),
+            threading.Thread(target=self.stream_process_output, args=(process.stderr, logging.ERROR), daemon=True),
+        ]
+        for thread in self.output_threads:
+            thread.start()
+        return process
+
+    def stream_process_output(self, pipe, level):
+        """Forward each line the ZED executable prints to the log."""
+        for line in iter(pipe.readline, ''):
+            line = line.strip()
+            if not line:
+                continue
+            logging.log(level, f"ZED executable: {line}")
+            if line == "READY":
+                self.zed_ready.set()
+            if level >= logging.ERROR:
+                EXECUTABLE_ERRORS.inc()
+            if line.startswith("Successfully saved body data to "):
+                output_file = line[len("Successfully saved body data to "):]
+                print(f"Data saved to {output_file}")
+                SEGMENTS_WRITTEN.inc()
+                if os.path.exists(output_file):
+                    BYTES_WRITTEN.inc(os.path.getsize(output_file))
+                if self.convert_to_binary:
+                    thread = threading.Thread(target=self.convert_segment, args=(output_file,))
+                    thread.start()
+                    self.conversion_threads.append(thread)
+        pipe.close()
+
+    def convert_segment(self, output_file):
+        """Write the binary keypoint version of a finished JSON segment."""
+        try:
+            with CONVERSION_SECONDS.time():
+                binary_path, num_frames = convert_json_to_zbody(output_file)
+            logging.info(f"Converted {output_file} to {binary_path} ({num_frames} frames)")
+        except Exception as e:
+            logging.error(f"Error converting {output_file} to binary: {e}")
+
+    def send_control_command(self, process, command):
+        try:
+            process.stdin.write(command + "\n")
+            process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            logging.error(f"Could not send '{command}' to ZED executable: {e}")
+
+    def stop_zed_executable(self, process, timeout=60):
+        """Ask the ZED process to write its last segment and exit."""
+        if process.poll() is None:
+            self.send_control_command(process, "STOP")
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                logging.error("ZED executable did not exit after STOP, killing it.")
+                process.kill()
+                process.wait()
+        ZED_PROCESS_UP.set(0)
+        for thread in self.output_threads:
+            thread.join(timeout=5)
+        for thread in self.conversion_threads:
+            thread.join()
+        if process.returncode == 0:
+            logging.info("ZED executable completed successfully.")
+        else:
+            logging.error(f"ZED executable exited with code {process.returncode}.")
+
     def stop(self):
         """Stop time synchronization and any ongoing processes."""
         self.stop_event.set()
@@ -197,13 +331,18 @@ class ZEDDataCollector:
 def main():
     args = parse_arguments()
     stop_event = threading.Event()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
     zed_collector = ZEDDataCollector(
         stop_event=stop_event,
         base_filename=args.base_filename,
         capture_duration=args.capture_duration,
         central_server_url=args.central_server_url,
         no_gui=args.no_gui,
-        batch_duration=args.batch_duration
+        batch_duration=args.batch_duration,
+        convert_to_binary=args.convert_to_binary,
+        time_sync_transport=args.time_sync_transport,
+        wait_for_start=args.wait_for_start
     )
 
     zed_collector.start()
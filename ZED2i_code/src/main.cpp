@@ -3,6 +3,11 @@
 #include <chrono>
 #include <string>
 #include <fstream>
+#include <iomanip>
+#include <thread>
+#include <mutex>
+#include <atomic>
+#include <vector>
 
 // ZED includes
 #include <sl/Camera.hpp>
@@ -16,33 +21,97 @@
 #include "GLViewer.hpp"
 #endif
 
-// Main loop
-int main(int argc, char **argv)
+// Control pipe state shared with the stdin reader thread (--control mode)
+static std::mutex control_mutex;
+static std::string pending_output_filename;
+static std::atomic<bool> stop_requested(false);
+static std::atomic<bool> start_requested(false);
+static std::mutex stdout_mutex;
+
+// Reads commands from stdin: "ROTATE <output_file>" switches to a new output file,
+// "START" begins grabbing when started with --armed, "STOP" (or end of input) ends the capture.
+static void read_control_commands()
 {
-    if (argc < 3)
+    std::string line;
+    while (std::getline(std::cin, line))
     {
-        std::cout << "Usage: " << argv[0] << " [--no-gui] <output_file> <capture_duration_seconds>" << std::endl;
-        return -1;
+        if (line.rfind("ROTATE ", 0) == 0)
+        {
+            std::lock_guard<std::mutex> lock(control_mutex);
+            pending_output_filename = line.substr(7);
+        }
+        else if (line == "START")
+        {
+            start_requested = true;
+        }
+        else if (line == "STOP")
+        {
+            break;
+        }
+    }
+    stop_requested = true;
+}
+
+// Writes one segment of body data to disk.
+static void save_bodies_json(const nlohmann::json &bodies_json, const std::string &output_filename)
+{
+    if (bodies_json.empty())
+    {
+        std::lock_guard<std::mutex> lock(stdout_mutex);
+        std::cout << "No body data to save for " << output_filename << std::endl;
+        return;
     }
+    std::ofstream file_out(output_filename);
+    file_out << std::setw(4) << bodies_json << std::endl;
+    file_out.close();
+    std::lock_guard<std::mutex> lock(stdout_mutex);
+    std::cout << "Successfully saved body data to " << output_filename << std::endl;
+}
+
+// Main loop
+int main(int argc, char **argv)
+{
+    const std::string usage = std::string("Usage: ") + argv[0] +
+                              " [--no-gui] [--control [--armed]] <output_file> <capture_duration_seconds>";
 
     bool no_gui = false;
+    bool control_mode = false;
+    bool armed = false;
     int arg_idx = 1;
 
-    // Check for the '--no-gui' or '--headless' argument
-    if (std::string(argv[1]) == "--no-gui" || std::string(argv[1]) == "--headless")
+    // Leading flags: '--no-gui'/'--headless', '--control' and '--armed'
+    while (arg_idx < argc && std::string(argv[arg_idx]).rfind("--", 0) == 0)
     {
-        no_gui = true;
+        std::string flag(argv[arg_idx]);
+        if (flag == "--no-gui" || flag == "--headless")
+        {
+            no_gui = true;
+        }
+        else if (flag == "--control")
+        {
+            control_mode = true;
+        }
+        else if (flag == "--armed")
+        {
+            armed = true;
+        }
+        else
+        {
+            std::cout << usage << std::endl;
+            return -1;
+        }
         arg_idx++;
     }
 
-    // Ensure there are enough arguments remaining
-    if (argc - arg_idx < 2)
+    // Ensure there are enough arguments remaining; --armed needs the control pipe for START
+    if (argc - arg_idx < 2 || (armed && !control_mode))
     {
-        std::cout << "Usage: " << argv[0] << " [--no-gui] <output_file> <capture_duration_seconds>" << std::endl;
+        std::cout << usage << std::endl;
         return -1;
     }
 
     std::string output_filename = argv[arg_idx++];
+    // In control mode a duration <= 0 runs until STOP is received on stdin
     int capture_duration_seconds = std::stoi(argv[arg_idx++]);
 
     // Initialize the ZED camera
@@ -79,22 +148,67 @@ int main(int argc, char **argv)
 
     nlohmann::json bodies_json;
     sl::Bodies bodies;
+    std::vector<std::thread> writer_threads;
+
+    if (control_mode)
+    {
+        std::thread(read_control_commands).detach();
+        {
+            std::lock_guard<std::mutex> lock(stdout_mutex);
+            std::cout << "READY" << std::endl;
+        }
+
+        // Armed: camera and models are loaded; hold off grabbing until the synchronized START
+        while (armed && !start_requested && !stop_requested)
+        {
+            std::this_thread::sleep_for(std::chrono::microseconds(100));
+        }
+    }
 
     auto start_time = std::chrono::steady_clock::now();
 
+    auto capture_finished = [&]() {
+        if (stop_requested)
+        {
+            return true;
+        }
+        if (control_mode && capture_duration_seconds <= 0)
+        {
+            return false;
+        }
+        auto elapsed_time = std::chrono::steady_clock::now() - start_time;
+        return std::chrono::duration_cast<std::chrono::seconds>(elapsed_time).count() >= capture_duration_seconds;
+    };
+
+    // Hand the finished segment to a writer thread so grabbing continues without a gap
+    auto rotate_if_requested = [&]() {
+        if (!control_mode)
+        {
+            return;
+        }
+        std::string next_output_filename;
+        {
+            std::lock_guard<std::mutex> lock(control_mutex);
+            next_output_filename.swap(pending_output_filename);
+        }
+        if (next_output_filename.empty())
+        {
+            return;
+        }
+        writer_threads.emplace_back(save_bodies_json, std::move(bodies_json), output_filename);
+        bodies_json = nlohmann::json();
+        output_filename = next_output_filename;
+    };
+
     if (!no_gui)
     {
         // GUI Mode: Initialize and use GLViewer
         GLViewer viewer;
         viewer.init(argc, argv);
 
-        while (viewer.isAvailable())
+        while (viewer.isAvailable() && !capture_finished())
         {
-            auto elapsed_time = std::chrono::steady_clock::now() - start_time;
-            if (std::chrono::duration_cast<std::chrono::seconds>(elapsed_time).count() >= capture_duration_seconds)
-            {
-                break;
-            }
+            rotate_if_requested();
 
             if (zed.grab() == sl::ERROR_CODE::SUCCESS)
             {
@@ -108,13 +222,9 @@ int main(int argc, char **argv)
     else
     {
         // Headless Mode: Run without GUI
-        while (true)
+        while (!capture_finished())
         {
-            auto elapsed_time = std::chrono::steady_clock::now() - start_time;
-            if (std::chrono::duration_cast<std::chrono::seconds>(elapsed_time).count() >= capture_duration_seconds)
-            {
-                break;
-            }
+            rotate_if_requested();
 
             if (zed.grab() == sl::ERROR_CODE::SUCCESS)
             {
@@ -129,17 +239,11 @@ int main(int argc, char **argv)
     // Close the ZED camera
     zed.close();
 
-    // Save the collected body data to a JSON file
-    if (!bodies_json.empty())
-    {
-        std::ofstream file_out(output_filename);
-        file_out << std::setw(4) << bodies_json << std::endl;
-        file_out.close();
-        std::cout << "Successfully saved body data to " << output_filename << std::endl;
-    }
-    else
+    // Save the last segment and wait for pending segment writes
+    save_bodies_json(bodies_json, output_filename);
+    for (auto &writer : writer_threads)
     {
-        std::cout << "No body data to save." << std::endl;
+        writer.join();
     }
 
     return EXIT_SUCCESS;
@@ -0,0 +1,148 @@
+import os
+import json
+import argparse
+import numpy as np
+
+# A binary body file is a directory holding one .npy array per column plus meta.json.
+# Every array is uncompressed so np.load(..., mmap_mode='r') gives instant random access.
+BINARY_EXTENSION = '.zbody'
+FORMAT_VERSION = 2  # 2 added body_valid; version 1 files derive it from body_ids >= 0
+
+
+def frame_bodies_from_json(json_data):
+    """Yield (timestamp_ms, body_list) for every frame of a ZED JSON export, sorted by time."""
+    for timestamp_str in sorted(json_data, key=int):
+        yield int(timestamp_str), json_data[timestamp_str].get('body_list', [])
+
+
+def _padded_array(values, shape):
+    """Convert a (possibly null-filled) nested list to a float32 array of `shape` padded with NaN."""
+    out = np.full(shape, np.nan, dtype=np.float32)
+    if values:
+        # None (JSON null) becomes NaN in the float32 conversion
+        arr = np.asarray(values, dtype=np.float32)[tuple(slice(0, n) for n in shape)]
+        out[tuple(slice(0, n) for n in arr.shape)] = arr
+    return out
+
+
+def frames_to_columns(frames, num_keypoints=None):
+    """
+    Pack (timestamp_ms, body_list) frames into fixed-shape column arrays.
+
+    Returns:
+        dict: timestamps (F,), body_ids (F, B), body_valid (F, B), body_confidence (F, B),
+              keypoints (F, B, K, 3) and keypoint_confidence (F, B, K).
+              Missing bodies have body_valid False and are padded with id -1 and NaN values;
+              the ZED also reports untracked bodies with id -1, so only body_valid tells them apart.
+    """
+    frames = list(frames)
+    max_bodies = max((len(bodies) for _, bodies in frames), default=0)
+    if num_keypoints is None:
+        num_keypoints = max((len(body.get('keypoint', [])) for _, bodies in frames for body in bodies), default=0)
+
+    num_frames = len(frames)
+    columns = {
+        'timestamps': np.empty(num_frames, dtype=np.int64),
+        'body_ids': np.full((num_frames, max_bodies), -1, dtype=np.int32),
+        'body_valid': np.zeros((num_frames, max_bodies), dtype=bool),
+        'body_confidence': np.full((num_frames, max_bodies), np.nan, dtype=np.float32),
+        'keypoints': np.full((num_frames, max_bodies, num_keypoints, 3), np.nan, dtype=np.float32),
+        'keypoint_confidence': np.full((num_frames, max_bodies, num_keypoints), np.nan, dtype=np.float32),
+    }
+
+    for frame_idx, (timestamp_ms, bodies) in enumerate(frames):
+        columns['timestamps'][frame_idx] = timestamp_ms
+        for body_idx, body in enumerate(bodies):
+            columns['body_ids'][frame_idx, body_idx] = body.get('id', -1)
+            columns['body_valid'][frame_idx, body_idx] = True
+            confidence = body.get('confidence')
+            if confidence is not None:
+                columns['body_confidence'][frame_idx, body_idx] = confidence
+            columns['keypoints'][frame_idx, body_idx] = _padded_array(body.get('keypoint'), (num_keypoints, 3))
+            columns['keypoint_confidence'][frame_idx, body_idx] = _padded_array(
+                body.get('keypoint_confidence'), (num_keypoints,))
+    return columns
+
+
+def write_binary_bodies(columns, output_path, source=None):
+    """Write column arrays to a .zbody directory."""
+    os.makedirs(output_path, exist_ok=True)
+    for name, array in columns.items():
+        np.save(os.path.join(output_path, f'{name}.npy'), array)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'num_frames': int(columns['timestamps'].shape[0]),
+        'max_bodies': int(columns['body_ids'].shape[1]),
+        'num_keypoints': int(columns['keypoints'].shape[2]),
+        'timestamp_unit': 'ms',
+        'source': source,
+    }
+    with open(os.path.join(output_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=4)
+    return output_path
+
+
+def convert_json_to_binary(json_path, output_path=None):
+    """Convert one ZED body tracking JSON export to the binary format and return its path."""
+    if output_path is None:
+        output_path = os.path.splitext(json_path)[0] + BINARY_EXTENSION
+    with open(json_path, 'r') as f:
+        json_data = json.load(f)
+    columns = frames_to_columns(frame_bodies_from_json(json_data))
+    return write_binary_bodies(columns, output_path, source=os.path.basename(json_path))
+
+
+class BodyKeypointData:
+    """Memory-mapped view of a .zbody directory with lookups by timestamp."""
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.timestamps = np.load(os.path.join(path, 'timestamps.npy'), mmap_mode=mmap_mode)
+        self.body_ids = np.load(os.path.join(path, 'body_ids.npy'), mmap_mode=mmap_mode)
+        valid_path = os.path.join(path, 'body_valid.npy')
+        self.body_valid = np.load(valid_path, mmap_mode=mmap_mode) if os.path.exists(valid_path) else self.body_ids >= 0
+        self.body_confidence = np.load(os.path.join(path, 'body_confidence.npy'), mmap_mode=mmap_mode)
+        self.keypoints = np.load(os.path.join(path, 'keypoints.npy'), mmap_mode=mmap_mode)
+        self.keypoint_confidence = np.load(os.path.join(path, 'keypoint_confidence.npy'), mmap_mode=mmap_mode)
+
+    def __len__(self):
+        return self.timestamps.shape[0]
+
+    def frame_index_at(self, timestamp_ms):
+        """Index of the last frame at or before timestamp_ms (0 if it precedes the file)."""
+        return max(int(np.searchsorted(self.timestamps, timestamp_ms, side='right')) - 1, 0)
+
+    def time_slice(self, start_ms, end_ms):
+        """Slice of frame indices with start_ms <= timestamp < end_ms."""
+        start = int(np.searchsorted(self.timestamps, start_ms, side='left'))
+        end = int(np.searchsorted(self.timestamps, end_ms, side='left'))
+        return slice(start, end)
+
+
+def load_binary_bodies(path, mmap=True):
+    return BodyKeypointData(path, mmap=mmap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert ZED body tracking JSON exports to the binary .zbody format')
+    parser.add_argument('json_files', nargs='+', help='ZED JSON export(s) to convert')
+    parser.add_argument('--output_dir', type=str, default=None, help='Directory for the .zbody outputs (default: next to each JSON)')
+    args = parser.parse_args()
+
+    for json_file in args.json_files:
+        output_path = None
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(json_file))[0]
+            output_path = os.path.join(args.output_dir, stem + BINARY_EXTENSION)
+        output_path = convert_json_to_binary(json_file, output_path)
+        json_size = os.path.getsize(json_file)
+        binary_size = sum(entry.stat().st_size for entry in os.scandir(output_path))
+        print(f'{json_file} -> {output_path} ({json_size / 1e6:.1f} MB -> {binary_size / 1e6:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
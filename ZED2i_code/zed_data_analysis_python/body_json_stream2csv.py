@@ -0,0 +1,243 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from body_json2bin import BINARY_EXTENSION, frames_to_columns, write_binary_bodies
+
+# Keypoint names for the two ZED body formats used in the lab
+BODY_18_KEYPOINTS = [
+    'nose', 'neck', 'right_shoulder', 'right_elbow', 'right_wrist', 'left_shoulder', 'left_elbow',
+    'left_wrist', 'right_hip', 'right_knee', 'right_ankle', 'left_hip', 'left_knee', 'left_ankle',
+    'right_eye', 'left_eye', 'right_ear', 'left_ear'
+]
+
+BODY_38_KEYPOINTS = [
+    'pelvis', 'spine_1', 'spine_2', 'spine_3', 'neck', 'nose', 'left_eye', 'right_eye', 'left_ear',
+    'right_ear', 'left_clavicle', 'right_clavicle', 'left_shoulder', 'right_shoulder', 'left_elbow',
+    'right_elbow', 'left_wrist', 'right_wrist', 'left_hip', 'right_hip', 'left_knee', 'right_knee',
+    'left_ankle', 'right_ankle', 'left_big_toe', 'right_big_toe', 'left_small_toe', 'right_small_toe',
+    'left_heel', 'right_heel', 'left_hand_thumb_4', 'right_hand_thumb_4', 'left_hand_index_1',
+    'right_hand_index_1', 'left_hand_middle_4', 'right_hand_middle_4', 'left_hand_pinky_1',
+    'right_hand_pinky_1'
+]
+
+KEYPOINT_LAYOUTS = {18: BODY_18_KEYPOINTS, 38: BODY_38_KEYPOINTS}
+
+READ_CHUNK_SIZE = 1 << 20  # 1 MB of text per read
+ROWS_PER_CHUNK = 4096      # Frames packed into one column chunk
+
+
+def iter_json_frames(json_path, read_chunk_size=READ_CHUNK_SIZE):
+    """
+    Incrementally parse a ZED export ({"<timestamp>": {...}, ...}) one frame at a time.
+
+    Only the current frame and one read chunk are held in memory, so memory use is
+    bounded by the size of a single frame rather than the whole file.
+
+    Yields:
+        (timestamp_ms, body_list) in file order.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_path, 'r') as f:
+        buffer = f.read(read_chunk_size)
+        eof = not buffer
+        pos = 0
+
+        def skip_whitespace_and(chars):
+            """Advance past whitespace and at most one of `chars`; returns the char consumed, if any."""
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer, pos = buffer[pos:] + f.read(read_chunk_size), 0
+                eof = pos >= len(buffer)
+            if pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+                return buffer[pos - 1]
+            return None
+
+        def decode_value():
+            nonlocal buffer, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # A number at the end of the buffer may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                more = f.read(read_chunk_size)
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+
+        if skip_whitespace_and('{') != '{':
+            raise ValueError(f'{json_path} is not a ZED JSON export (expected a top-level object)')
+        if skip_whitespace_and('}') == '}':
+            return
+
+        while True:
+            timestamp_str = decode_value()
+            if skip_whitespace_and(':') != ':':
+                raise ValueError(f'Malformed ZED JSON export {json_path}: expected ":" after {timestamp_str!r}')
+            skip_whitespace_and('')
+            frame = decode_value()
+            yield int(timestamp_str), frame.get('body_list', [])
+
+            separator = skip_whitespace_and(',}')
+            if separator == '}':
+                return
+            if separator is None:
+                raise ValueError(f'Malformed ZED JSON export {json_path}: truncated after {timestamp_str!r}')
+            skip_whitespace_and('')
+
+
+def iter_frame_chunks(json_path, rows_per_chunk=ROWS_PER_CHUNK):
+    """Group streamed frames into lists of at most rows_per_chunk frames."""
+    frames = []
+    for frame in iter_json_frames(json_path):
+        frames.append(frame)
+        if len(frames) >= rows_per_chunk:
+            yield frames
+            frames = []
+    if frames:
+        yield frames
+
+
+def detect_num_keypoints(json_path):
+    """Return the keypoint count of the first body in the export (18, 38, ...), or 0 if none."""
+    for _, bodies in iter_json_frames(json_path):
+        for body in bodies:
+            if body.get('keypoint'):
+                return len(body['keypoint'])
+    return 0
+
+
+def csv_header(num_keypoints):
+    names = KEYPOINT_LAYOUTS.get(num_keypoints, [f'Keypoint_{i}' for i in range(num_keypoints)])
+    return ['Time', 'Frame'] + [f'{name}_{axis}' for name in names for axis in ['x', 'y', 'z']]
+
+
+def convert_json_to_csv(json_path, output_path=None, rows_per_chunk=ROWS_PER_CHUNK):
+    """
+    Stream one ZED export to CSV with one row per detected body.
+
+    Each chunk is flattened with NumPy and written in a single np.savetxt call instead of
+    building Python lists row by row.
+    """
+    if output_path is None:
+        output_path = os.path.splitext(json_path)[0] + '.csv'
+    num_keypoints = detect_num_keypoints(json_path)
+
+    frame_number = 1
+    rows_written = 0
+    with open(output_path, 'w', newline='') as f:
+        f.write(','.join(csv_header(num_keypoints)) + '\n')
+        for frames in iter_frame_chunks(json_path, rows_per_chunk):
+            columns = frames_to_columns(frames, num_keypoints=num_keypoints)
+            # Keep every reported body (untracked ones included), in frame order, like the original per-row writer
+            frame_idx, body_idx = np.nonzero(columns['body_valid'])
+            if frame_idx.size == 0:
+                continue
+            keypoints = columns['keypoints'][frame_idx, body_idx].reshape(frame_idx.size, -1)
+            table = np.column_stack([
+                columns['timestamps'][frame_idx].astype(np.float64),
+                np.arange(frame_number, frame_number + frame_idx.size, dtype=np.float64),
+                keypoints.astype(np.float64),
+            ])
+            fmt = ['%d', '%d'] + ['%.9g'] * keypoints.shape[1]
+            np.savetxt(f, table, fmt=fmt, delimiter=',')
+            frame_number += frame_idx.size
+            rows_written += frame_idx.size
+    return output_path, rows_written
+
+
+def convert_json_to_zbody(json_path, output_path=None, rows_per_chunk=ROWS_PER_CHUNK):
+    """Stream one ZED export to the binary .zbody format without loading the whole JSON."""
+    if output_path is None:
+        output_path = os.path.splitext(json_path)[0] + BINARY_EXTENSION
+    num_keypoints = detect_num_keypoints(json_path)
+
+    chunks = [frames_to_columns(frames, num_keypoints=num_keypoints)
+              for frames in iter_frame_chunks(json_path, rows_per_chunk)]
+    if not chunks:
+        chunks = [frames_to_columns([], num_keypoints=num_keypoints)]
+
+    # Chunks can differ in body count; pad to the widest before concatenating
+    max_bodies = max(chunk['body_ids'].shape[1] for chunk in chunks)
+    columns = {}
+    for name in chunks[0]:
+        parts = []
+        for chunk in chunks:
+            array = chunk[name]
+            if array.ndim > 1 and array.shape[1] < max_bodies:
+                pad = [(0, 0)] * array.ndim
+                pad[1] = (0, max_bodies - array.shape[1])
+                fill = {'body_ids': -1, 'body_valid': False}.get(name, np.nan)
+                array = np.pad(array, pad, constant_values=fill)
+            parts.append(array)
+        columns[name] = np.concatenate(parts, axis=0)
+
+    # Lookups by time need sorted timestamps; exports are normally already in order
+    if np.any(np.diff(columns['timestamps']) < 0):
+        order = np.argsort(columns['timestamps'], kind='stable')
+        columns = {name: array[order] for name, array in columns.items()}
+    write_binary_bodies(columns, output_path, source=os.path.basename(json_path))
+    return output_path, int(columns['timestamps'].shape[0])
+
+
+OUTPUT_CONVERTERS = {'csv': convert_json_to_csv, 'zbody': convert_json_to_zbody}
+
+
+def _convert_one(json_path, output_format, output_dir):
+    output_path = None
+    if output_dir:
+        stem = os.path.splitext(os.path.basename(json_path))[0]
+        extension = '.csv' if output_format == 'csv' else BINARY_EXTENSION
+        output_path = os.path.join(output_dir, stem + extension)
+    return json_path, OUTPUT_CONVERTERS[output_format](json_path, output_path)
+
+
+def convert_directory(input_dir, output_format='csv', output_dir=None, workers=None):
+    """Convert every .json segment in input_dir in parallel, one process per segment."""
+    json_files = sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir) if name.endswith('.json')
+    )
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_convert_one, path, output_format, output_dir) for path in json_files]
+        for future in as_completed(futures):
+            json_path, (output_path, count) = future.result()
+            print(f'{json_path} -> {output_path} ({count} rows)')
+            results.append((json_path, output_path, count))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream ZED body tracking JSON exports to CSV or .zbody with bounded memory')
+    parser.add_argument('inputs', nargs='+', help='ZED JSON export(s) or directories of segments')
+    parser.add_argument('--format', choices=sorted(OUTPUT_CONVERTERS), default='csv', help='Output format')
+    parser.add_argument('--output_dir', type=str, default=None, help='Directory for outputs (default: next to each JSON)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for directories (default: all cores)')
+    args = parser.parse_args()
+
+    for path in args.inputs:
+        if os.path.isdir(path):
+            convert_directory(path, args.format, args.output_dir, args.workers)
+        else:
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+            json_path, (output_path, count) = _convert_one(path, args.format, args.output_dir)
+            print(f'{json_path} -> {output_path} ({count} rows)')
+
+
+if __name__ == '__main__':
+    main()
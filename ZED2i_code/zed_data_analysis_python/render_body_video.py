@@ -0,0 +1,190 @@
+import os
+import argparse
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+from body_json2bin import BINARY_EXTENSION, frames_to_columns, load_binary_bodies
+from body_json_stream2csv import iter_json_frames
+
+# Bone lists for the ZED BODY_38 (see viz_body_json.py) and BODY_18 layouts
+SKELETON_CONNECTIONS_38 = [
+    (0, 1), (1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 8), (5, 7), (7, 9),
+    (4, 10), (10, 12), (12, 14), (14, 16), (16, 30), (16, 32), (16, 34), (16, 36),
+    (4, 11), (11, 13), (13, 15), (15, 17), (17, 31), (17, 33), (17, 35), (17, 37),
+    (0, 18), (18, 20), (20, 22), (22, 24), (22, 26), (22, 28),
+    (0, 19), (19, 21), (21, 23), (23, 25), (23, 27), (23, 29),
+]
+
+SKELETON_CONNECTIONS_18 = [
+    (0, 1), (1, 2), (2, 3), (3, 4), (1, 5), (5, 6), (6, 7), (1, 8), (8, 9), (9, 10),
+    (1, 11), (11, 12), (12, 13), (0, 14), (14, 16), (0, 15), (15, 17),
+]
+
+SKELETON_CONNECTIONS = {18: SKELETON_CONNECTIONS_18, 38: SKELETON_CONNECTIONS_38}
+
+# Coordinate pairs (horizontal, vertical) for each 2D view; the ZED exports Y up
+VIEW_AXES = {'front': (0, 1), 'side': (2, 1), 'top': (0, 2)}
+
+FRAME_SIZE_INCHES = (8, 6)
+FRAME_DPI = 100
+
+
+def load_keypoint_columns(path):
+    """Load timestamps and keypoints (F, B, K, 3) from a .zbody directory or a ZED JSON export."""
+    if path.endswith(BINARY_EXTENSION) or os.path.isdir(path):
+        data = load_binary_bodies(path)
+        return np.asarray(data.timestamps), np.asarray(data.keypoints)
+    columns = frames_to_columns(iter_json_frames(path))
+    timestamps, keypoints = columns['timestamps'], columns['keypoints']
+    # JSON keys are not guaranteed to be in time order; .zbody files are sorted when written
+    if np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, keypoints = timestamps[order], keypoints[order]
+    return timestamps, keypoints
+
+
+def precompute_geometry(keypoints, view='front'):
+    """
+    Project every frame to 2D and build all bone endpoints in one vectorized pass.
+
+    Returns:
+        segments (F, B * C, 2, 2), points (F, B * K, 2) and the (xmin, xmax, ymin, ymax) limits.
+        Invalid keypoints stay NaN, which matplotlib skips when drawing.
+    """
+    num_keypoints = keypoints.shape[2]
+    connections = np.array(SKELETON_CONNECTIONS.get(num_keypoints, []), dtype=np.intp).reshape(-1, 2)
+    horizontal, vertical = VIEW_AXES[view]
+    projected = keypoints[..., [horizontal, vertical]]
+
+    # Centre on the first valid pose so the subject starts in the middle, as viz_body_json.py does
+    valid = np.isfinite(projected).all(axis=-1)
+    if valid.any():
+        first_frame = np.argmax(valid.any(axis=(1, 2)))
+        projected = projected - np.nanmean(projected[first_frame][valid[first_frame]], axis=0)
+
+    num_frames, num_bodies = projected.shape[:2]
+    segments = np.stack([projected[:, :, connections[:, 0]], projected[:, :, connections[:, 1]]], axis=3)
+    segments = segments.reshape(num_frames, num_bodies * len(connections), 2, 2)
+    points = projected.reshape(num_frames, num_bodies * num_keypoints, 2)
+
+    finite = points[np.isfinite(points).all(axis=-1)]
+    if finite.size:
+        low, high = np.percentile(finite, [1, 99], axis=0)
+        margin = 0.15 * max(high - low)
+        limits = (low[0] - margin, high[0] + margin, low[1] - margin, high[1] + margin)
+    else:
+        limits = (-1000, 1000, -1000, 1000)
+    return segments.astype(np.float32), points.astype(np.float32), limits
+
+
+def render_frame_range(geometry_dir, timestamps, limits, start, end, output_path, fps):
+    """Render frames [start, end) by updating persistent artists and piping raw RGBA into ffmpeg."""
+    segments = np.load(os.path.join(geometry_dir, 'segments.npy'), mmap_mode='r')
+    points = np.load(os.path.join(geometry_dir, 'points.npy'), mmap_mode='r')
+
+    fig, ax = plt.subplots(figsize=FRAME_SIZE_INCHES, dpi=FRAME_DPI)
+    ax.set_xlim(limits[0], limits[1])
+    ax.set_ylim(limits[2], limits[3])
+    ax.set_aspect('equal', adjustable='box')
+    bones = LineCollection([], colors='red', linewidths=2)
+    ax.add_collection(bones)
+    joints, = ax.plot([], [], 'o', color='blue', markersize=3)
+    title = ax.set_title('')
+    for artist in (bones, joints, title):
+        artist.set_animated(True)
+
+    # Draw the static axes once and only redraw the animated artists on top of it
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    width, height = fig.canvas.get_width_height()
+
+    encoder = subprocess.Popen(
+        ['ffmpeg', '-y', '-loglevel', 'error',
+         '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+         '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-preset', 'veryfast', output_path],
+        stdin=subprocess.PIPE
+    )
+    try:
+        for frame_idx in range(start, end):
+            bones.set_segments(segments[frame_idx])
+            joints.set_data(points[frame_idx, :, 0], points[frame_idx, :, 1])
+            title.set_text(f"Frame at timestamp {timestamps[frame_idx]} ms")
+            fig.canvas.restore_region(background)
+            ax.draw_artist(bones)
+            ax.draw_artist(joints)
+            ax.draw_artist(title)
+            encoder.stdin.write(fig.canvas.buffer_rgba())
+    finally:
+        encoder.stdin.close()
+        encoder.wait()
+        plt.close(fig)
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed while encoding {output_path}")
+    return output_path
+
+
+def render_body_video(input_path, output_filename, fps=30, view='front', workers=None):
+    """Render a ZED body tracking recording to video, splitting the timeline across processes."""
+    timestamps, keypoints = load_keypoint_columns(input_path)
+    num_frames = len(timestamps)
+    if num_frames == 0:
+        raise ValueError(f"No frames found in {input_path}")
+    segments, points, limits = precompute_geometry(keypoints, view)
+
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, num_frames))
+    bounds = np.linspace(0, num_frames, workers + 1).astype(int)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Workers memory-map the precomputed geometry instead of receiving it pickled
+        np.save(os.path.join(temp_dir, 'segments.npy'), segments)
+        np.save(os.path.join(temp_dir, 'points.npy'), points)
+        part_paths = [os.path.join(temp_dir, f'part_{i:03d}.mp4') for i in range(workers)]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(render_frame_range, temp_dir, timestamps, limits,
+                                int(bounds[i]), int(bounds[i + 1]), part_paths[i], fps)
+                for i in range(workers)
+            ]
+            for future in futures:
+                future.result()
+
+        if workers == 1:
+            shutil.move(part_paths[0], output_filename)
+        else:
+            concat_list = os.path.join(temp_dir, 'parts.txt')
+            with open(concat_list, 'w') as f:
+                f.writelines(f"file '{path}'\n" for path in part_paths)
+            subprocess.run(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                 '-i', concat_list, '-c', 'copy', output_filename],
+                check=True
+            )
+
+    print(f"Animation saved as {output_filename} ({num_frames} frames, {workers} workers)")
+    return output_filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fast 2D skeleton video renderer for ZED body tracking data')
+    parser.add_argument('input_path', help='ZED JSON export or .zbody directory')
+    parser.add_argument('--output', type=str, default=None, help='Output video path (default: next to the input)')
+    parser.add_argument('--fps', type=int, default=30, help='Output video frame rate')
+    parser.add_argument('--view', choices=sorted(VIEW_AXES), default='front', help='Projection plane')
+    parser.add_argument('--workers', type=int, default=None, help='Render processes (default: all cores)')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.input_path.rstrip(os.sep))[0] + '.mp4'
+    render_body_video(args.input_path, output, fps=args.fps, view=args.view, workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ import time
 import cv2
 import signal
 import argparse
+import json
 from datetime import datetime
 from queue import Queue, Empty
 
@@ -15,6 +16,9 @@ parent_dir = os.path.abspath(os.path.join(current_dir, '..', '..'))
 sys.path.append(parent_dir)
 
 from shared_sensor_code.TimeSync import TimeSync
+from shared_sensor_code.metrics_registry import Counter, Gauge, Histogram, start_metrics_server
+from shared_sensor_code.start_sync import sleep_until, wait_for_start
+from PreviewPublisher import PreviewPublisher
 
 import logging
 
@@ -36,12 +40,26 @@ logging.info("Starting Camera Data Collector script.")
 
 VIDEO_CAPTURE_LENGTH = 30  # Default capture length for the whole session
 FRAME_RATE = 30
+MOTION_DETECT_SIZE = (80, 60)  # Downscaled (width, height) used for frame differencing
+MAX_STALE_FRAMES = 8  # Frames the driver may have queued while the collector waited to start
+
+FRAMES_READ = Counter('labx_camera_frames_read_total', 'Frames read from the camera.')
+FRAMES_KEPT = Counter('labx_camera_frames_kept_total', 'Frames kept for recording after motion gating.')
+READ_ERRORS = Counter('labx_camera_read_errors_total', 'Failed camera reads.')
+RECORDING_FPS = Gauge('labx_camera_recording_fps', 'Current recording rate (drops to the keep-alive rate when gated).')
+SAVE_QUEUE_DEPTH = Gauge('labx_camera_save_queue_depth', 'Video batches waiting for the saving thread.')
+FILES_WRITTEN = Counter('labx_camera_files_written_total', 'Video segment files written.')
+BYTES_WRITTEN = Counter('labx_camera_bytes_written_total', 'Bytes of video segment files written.')
+SAVE_SECONDS = Histogram('labx_camera_save_seconds', 'Time to encode and write one video segment.',
+                         buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
 
 class CameraDataCollector:
     def __init__(self, stop_event, deployed_sensor_id="CAM001", central_server_url='http://192.168.68.130:5000/receive_data',
                  sync_polling_interval=10, base_filename='default_name_video',
                  delayed_start_timestamp=None, capture_duration=None, camera_index=None,
-                 batch_duration=10, disable_data_sync=False):
+                 batch_duration=10, disable_data_sync=False, motion_gating=False, keepalive_fps=1.0,
+                 motion_threshold=4.0, motion_hold_seconds=2.0, preview_server=None, preview_fps=1.0,
+                 time_sync_transport='json', wait_for_start=False):
         # Configuration
         self.deployed_sensor_id = deployed_sensor_id
         logging.info(f"CameraDataCollector initialized with SBC ID: {self.deployed_sensor_id}")
@@ -54,11 +72,25 @@ class CameraDataCollector:
         self.batch_duration = batch_duration
         self.stop_event = stop_event
         self.disable_data_sync = disable_data_sync
+        self.time_sync_transport = time_sync_transport
+        self.wait_for_start = wait_for_start
+
+        # Motion gating: record at FRAME_RATE while the scene moves, keepalive_fps otherwise
+        self.motion_gating = motion_gating
+        self.keepalive_fps = keepalive_fps
+        self.motion_threshold = motion_threshold
+        self.motion_hold_seconds = motion_hold_seconds
+        self._previous_motion_frame = None
+        self._last_motion_time = None
+        if self.motion_gating:
+            logging.info(f"Motion gating enabled: threshold {self.motion_threshold}, "
+                         f"keep-alive {self.keepalive_fps} fps, hold {self.motion_hold_seconds} s")
 
         self.data_output_directory = os.path.expanduser(f'~/labx_master/camera_code/data/{self.base_filename}')
         os.makedirs(self.data_output_directory, exist_ok=True)
 
         self.data_queue = Queue()  # Queue for producer-consumer model
+        SAVE_QUEUE_DEPTH.set_function(self.data_queue.qsize)
 
         if self.camera_index is None:
             self.camera_index = self.find_working_camera()
@@ -70,7 +102,18 @@ class CameraDataCollector:
             self.time_sync = TimeSync(
                 deployed_sensor_id=self.deployed_sensor_id,
                 central_server_url=self.central_server_url,
-                sync_polling_interval=self.sync_polling_interval
+                sync_polling_interval=self.sync_polling_interval,
+                transport=self.time_sync_transport
+            )
+
+        # Optional low-resolution live preview to the central server
+        self.preview_publisher = None
+        if preview_server:
+            self.preview_publisher = PreviewPublisher(
+                deployed_sensor_id=self.deployed_sensor_id,
+                server_address=preview_server,
+                stop_event=self.stop_event,
+                preview_fps=preview_fps
             )
 
         self.camera_thread = threading.Thread(target=self.collect_camera_data, daemon=True)
@@ -96,6 +139,9 @@ class CameraDataCollector:
         self.camera_thread.start()
         self.save_thread.start()
 
+        if self.preview_publisher is not None:
+            self.preview_publisher.start()
+
         if not self.disable_data_sync:
             self.time_sync.start()
             logging.info("Time synchronization started.")
@@ -108,10 +154,18 @@ class CameraDataCollector:
             logging.error(f"Cannot open camera at index {self.camera_index}")
             return
 
-        # Handle delayed start if specified
-        if self.delayed_start_timestamp is not None:
-            while time.time() < self.delayed_start_timestamp and not self.stop_event.is_set():
-                time.sleep(0.01)
+        # Two-phase start (camera already open) or a fixed delayed start
+        if self.wait_for_start:
+            if wait_for_start(self.stop_event) is None:
+                logging.info("Capture cancelled before start.")
+                cap.release()
+                return
+            self._drop_stale_frames(cap)
+        elif self.delayed_start_timestamp is not None:
+            if sleep_until(self.delayed_start_timestamp, self.stop_event) is None:
+                cap.release()
+                return
+            self._drop_stale_frames(cap)
 
         capture_start_time = time.time()
         batch_start_time = capture_start_time
@@ -119,6 +173,11 @@ class CameraDataCollector:
         logging.info(f"Camera data collection started at {batch_start_datetime}")
 
         frame_buffer = []  # Local buffer for this batch
+        frame_timestamps = []  # Capture time of every frame kept in the batch
+        current_rate = FRAME_RATE
+        RECORDING_FPS.set(current_rate)
+        rate_timeline = [{'frame_index': 0, 'timestamp': batch_start_time, 'fps': current_rate}]
+        last_kept_time = None
 
         while not self.stop_event.is_set():
             elapsed_capture_time = time.time() - capture_start_time
@@ -128,16 +187,41 @@ class CameraDataCollector:
 
             ret, frame = cap.read()
             if ret:
-                frame_buffer.append(frame)
+                frame_time = time.time()
+                FRAMES_READ.inc()
+                if self.preview_publisher is not None:
+                    self.preview_publisher.offer(frame, frame_time)
+                if self.motion_gating:
+                    new_rate = self._update_motion_rate(frame, frame_time)
+                    if new_rate != current_rate:
+                        logging.info(f"Motion gate switched recording rate from {current_rate} to {new_rate} fps.")
+                        current_rate = new_rate
+                        RECORDING_FPS.set(current_rate)
+                        rate_timeline.append({'frame_index': len(frame_buffer), 'timestamp': frame_time, 'fps': current_rate})
+                    keep_frame = (current_rate == FRAME_RATE or last_kept_time is None
+                                  or frame_time - last_kept_time >= 1.0 / current_rate)
+                else:
+                    keep_frame = True
+
+                if keep_frame:
+                    frame_buffer.append(frame)
+                    frame_timestamps.append(frame_time)
+                    last_kept_time = frame_time
+                    FRAMES_KEPT.inc()
+
                 elapsed_batch_time = time.time() - batch_start_time
                 if elapsed_batch_time >= self.batch_duration:
                     logging.info(f"Batch duration of {self.batch_duration} seconds reached. Sending batch to queue.")
-                    self.data_queue.put((frame_buffer.copy(), batch_start_datetime))  # Add to queue
+                    segment_metadata = self._build_segment_metadata(batch_start_time, frame_timestamps, rate_timeline)
+                    self.data_queue.put((frame_buffer.copy(), batch_start_datetime, segment_metadata))  # Add to queue
                     frame_buffer.clear()  # Clear local buffer
+                    frame_timestamps = []
                     batch_start_time = time.time()
                     batch_start_datetime = datetime.now()
+                    rate_timeline = [{'frame_index': 0, 'timestamp': batch_start_time, 'fps': current_rate}]
             else:
                 logging.error("Error reading frame from camera.")
+                READ_ERRORS.inc()
                 break
 
         cap.release()
@@ -146,33 +230,81 @@ class CameraDataCollector:
         # Enqueue remaining frames
         if frame_buffer:
             logging.info("Enqueuing remaining frames.")
-            self.data_queue.put((frame_buffer.copy(), batch_start_datetime))
+            segment_metadata = self._build_segment_metadata(batch_start_time, frame_timestamps, rate_timeline)
+            self.data_queue.put((frame_buffer.copy(), batch_start_datetime, segment_metadata))
+
+    def _drop_stale_frames(self, cap):
+        """Discard frames queued by the driver during the wait, so the first frame kept is captured after the start time."""
+        for _ in range(MAX_STALE_FRAMES):
+            grab_start = time.perf_counter()
+            cap.grab()
+            # A queued frame returns at once; a fresh one needs about a frame period
+            if time.perf_counter() - grab_start > 0.5 / FRAME_RATE:
+                break
+
+    def _update_motion_rate(self, frame, frame_time):
+        """Return the recording rate for the current frame based on a downscaled frame difference."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, MOTION_DETECT_SIZE, interpolation=cv2.INTER_AREA)
+        if self._previous_motion_frame is None:
+            self._last_motion_time = frame_time
+        elif cv2.absdiff(small, self._previous_motion_frame).mean() >= self.motion_threshold:
+            self._last_motion_time = frame_time
+        self._previous_motion_frame = small
+
+        if frame_time - self._last_motion_time < self.motion_hold_seconds:
+            return FRAME_RATE
+        return self.keepalive_fps
+
+    def _build_segment_metadata(self, batch_start_time, frame_timestamps, rate_timeline):
+        """Describe the frame timing of a segment so gated video can be aligned on playback."""
+        return {
+            'deployed_sensor_id': self.deployed_sensor_id,
+            'batch_start_time': batch_start_time,
+            'nominal_fps': FRAME_RATE,
+            'motion_gating': self.motion_gating,
+            'rate_timeline': list(rate_timeline),
+            'frame_timestamps': list(frame_timestamps),
+        }
 
     def save_buffered_data(self):
         while not self.stop_event.is_set() or not self.data_queue.empty():
             try:
-                frame_buffer, batch_start_datetime = self.data_queue.get(timeout=1)
+                frame_buffer, batch_start_datetime, segment_metadata = self.data_queue.get(timeout=1)
                 if frame_buffer:
-                    self._save_to_file(frame_buffer, batch_start_datetime)
+                    self._save_to_file(frame_buffer, batch_start_datetime, segment_metadata)
                     self.data_queue.task_done()
             except Empty:
                 continue
 
-    def _save_to_file(self, frame_buffer, batch_start_datetime):
+    def _save_to_file(self, frame_buffer, batch_start_datetime, segment_metadata):
         # Format batch start time and calculate duration
         batch_start_timestamp = batch_start_datetime.strftime('%Y%m%d_%H%M%S%f')[:-3]
-        duration_ms = len(frame_buffer) * (1000 // FRAME_RATE)
+        if self.motion_gating:
+            # Gated segments hold fewer frames than their wall-clock span, so use the capture times
+            frame_timestamps = segment_metadata['frame_timestamps']
+            duration_ms = int((frame_timestamps[-1] - segment_metadata['batch_start_time']) * 1000) + (1000 // FRAME_RATE)
+        else:
+            duration_ms = len(frame_buffer) * (1000 // FRAME_RATE)
 
         # Format filename
         output_filename = f'{self.base_filename}_{batch_start_timestamp}_{duration_ms}ms.avi'
         video_path = os.path.join(self.data_output_directory, output_filename)
 
         # Save video
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        out = cv2.VideoWriter(video_path, fourcc, FRAME_RATE, (640, 480))
-        for frame in frame_buffer:
-            out.write(frame)
-        out.release()
+        with SAVE_SECONDS.time():
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            out = cv2.VideoWriter(video_path, fourcc, FRAME_RATE, (640, 480))
+            for frame in frame_buffer:
+                out.write(frame)
+            out.release()
+        FILES_WRITTEN.inc()
+        BYTES_WRITTEN.inc(os.path.getsize(video_path))
+
+        # Sidecar with the rate timeline and per-frame capture times
+        metadata_path = os.path.splitext(video_path)[0] + '.json'
+        with open(metadata_path, 'w') as f:
+            json.dump(segment_metadata, f)
 
         logging.info(f"Video batch saved to {video_path}")
         print(f"Video batch saved to {video_path}")
@@ -184,10 +316,13 @@ class CameraDataCollector:
 
         # Save any remaining frames in the queue
         while not self.data_queue.empty():
-            frame_buffer, batch_start_datetime = self.data_queue.get()
-            self._save_to_file(frame_buffer, batch_start_datetime)
+            frame_buffer, batch_start_datetime, segment_metadata = self.data_queue.get()
+            self._save_to_file(frame_buffer, batch_start_datetime, segment_metadata)
             self.data_queue.task_done()
 
+        if self.preview_publisher is not None:
+            self.preview_publisher.stop()
+
         if not self.disable_data_sync:
             self.time_sync.stop()
 
@@ -213,6 +348,15 @@ def main():
     parser.add_argument('--batch_duration', type=int, default=10, help="Duration of each video batch in seconds")
     parser.add_argument('--disable_data_sync', action='store_true', help="Disable data synchronization with central server, but allow capture to occur")
     parser.add_argument('--central_server_url', type=str, required=False , help="Central Server Url for time sync monitoring")
+    parser.add_argument('--time_sync_transport', type=str, choices=['json', 'binary'], default='json', help="TimeSync wire format: JSON over HTTP or binary telemetry")
+    parser.add_argument('--wait_for_start', action='store_true', help="Open the camera, print READY and wait for 'START <timestamp>' on stdin")
+    parser.add_argument('--metrics_port', type=int, default=0, help="Port for the Prometheus metrics endpoint (0 disables it)")
+    parser.add_argument('--motion_gating', action='store_true', help="Drop to a keep-alive frame rate while the scene is static")
+    parser.add_argument('--keepalive_fps', type=float, default=1.0, help="Frame rate recorded while no motion is detected")
+    parser.add_argument('--motion_threshold', type=float, default=4.0, help="Mean absolute pixel difference (0-255) that counts as motion")
+    parser.add_argument('--motion_hold_seconds', type=float, default=2.0, help="Seconds to stay at full rate after the last detected motion")
+    parser.add_argument('--preview_server', type=str, default=None, help="host:port of the central server preview receiver")
+    parser.add_argument('--preview_fps', type=float, default=1.0, help="Frame rate of the live preview stream")
     args = parser.parse_args()
 
     if args.central_server_url:
@@ -222,6 +366,12 @@ def main():
     if args.capture_duration <= 0:
         raise ValueError("Duration must be greater than 0 seconds.")
 
+    if args.motion_gating and args.keepalive_fps <= 0:
+        raise ValueError("Keep-alive frame rate must be greater than 0 fps.")
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
     # Initialize Camera Data Collector with stop_event
     camera_collector = CameraDataCollector(
         stop_event=stop_event,
@@ -233,7 +383,15 @@ def main():
         capture_duration=args.capture_duration,
         camera_index=args.camera_index,
         batch_duration=args.batch_duration,  # Use batch duration in seconds
-        disable_data_sync=args.disable_data_sync  # Pass the flag for disabling data sync
+        disable_data_sync=args.disable_data_sync,  # Pass the flag for disabling data sync
+        time_sync_transport=args.time_sync_transport,
+        wait_for_start=args.wait_for_start,
+        motion_gating=args.motion_gating,
+        keepalive_fps=args.keepalive_fps,
+        motion_threshold=args.motion_threshold,
+        motion_hold_seconds=args.motion_hold_seconds,
+        preview_server=args.preview_server,
+        preview_fps=args.preview_fps
     )
     camera_collector.start()
 
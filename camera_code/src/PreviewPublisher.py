@@ -0,0 +1,123 @@
+import socket
+import struct
+import threading
+import time
+import logging
+from queue import Queue, Empty, Full
+
+import cv2
+
+# Wire format shared with central_server_code/src/preview_server.py:
+# magic, sensor id length, JPEG length, capture timestamp, then the sensor id and JPEG bytes.
+PREVIEW_MAGIC = b'LXPV'
+PREVIEW_HEADER = struct.Struct('!4sHId')
+
+
+class PreviewPublisher:
+    """Publishes a downscaled JPEG preview of the camera feed to the central server.
+
+    The capture thread only hands frames over through ``offer``, which rate limits and
+    replaces any frame still waiting in a one-slot queue (drop-oldest). Resizing, encoding
+    and network I/O all happen on the publisher thread, so a slow or absent server never
+    costs capture frames.
+    """
+
+    def __init__(self, deployed_sensor_id, server_address, stop_event, preview_fps=1.0,
+                 preview_width=320, jpeg_quality=40, reconnect_interval=5):
+        self.deployed_sensor_id = deployed_sensor_id
+        host, port = server_address.rsplit(':', 1)
+        self.server_address = (host, int(port))
+        self.stop_event = stop_event
+        self.preview_interval = 1.0 / preview_fps
+        self.preview_width = preview_width
+        self.jpeg_quality = jpeg_quality
+        self.reconnect_interval = reconnect_interval
+
+        self.frame_queue = Queue(maxsize=1)
+        self._last_offer_time = 0.0
+        self._sock = None
+        self._last_connect_attempt = 0.0
+        self.thread = threading.Thread(target=self._publish_loop, daemon=True)
+
+        logging.info(f"PreviewPublisher initialized for {self.deployed_sensor_id} -> {server_address}")
+
+    def start(self):
+        self.thread.start()
+        logging.info("Preview publisher started.")
+
+    def stop(self):
+        self.thread.join()
+        self._close()
+        logging.info("Preview publisher stopped.")
+
+    def offer(self, frame, timestamp):
+        """Hand a captured frame to the preview path. Never blocks the caller."""
+        if timestamp - self._last_offer_time < self.preview_interval:
+            return
+        self._last_offer_time = timestamp
+        try:
+            self.frame_queue.put_nowait((frame, timestamp))
+        except Full:
+            # Drop the stale frame so the preview always shows the newest one
+            try:
+                self.frame_queue.get_nowait()
+            except Empty:
+                pass
+            try:
+                self.frame_queue.put_nowait((frame, timestamp))
+            except Full:
+                pass
+
+    def _publish_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                frame, timestamp = self.frame_queue.get(timeout=1)
+            except Empty:
+                continue
+
+            payload = self._encode(frame)
+            if payload is None or not self._ensure_connected():
+                continue
+
+            sensor_id = self.deployed_sensor_id.encode()
+            header = PREVIEW_HEADER.pack(PREVIEW_MAGIC, len(sensor_id), len(payload), timestamp)
+            try:
+                self._sock.sendall(header + sensor_id + payload)
+            except OSError as e:
+                logging.warning(f"Preview send failed, dropping connection: {e}")
+                self._close()
+
+    def _encode(self, frame):
+        height, width = frame.shape[:2]
+        preview_height = int(height * self.preview_width / width)
+        small = cv2.resize(frame, (self.preview_width, preview_height), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            logging.error("Failed to JPEG-encode preview frame.")
+            return None
+        return encoded.tobytes()
+
+    def _ensure_connected(self):
+        if self._sock is not None:
+            return True
+        now = time.time()
+        if now - self._last_connect_attempt < self.reconnect_interval:
+            return False
+        self._last_connect_attempt = now
+        try:
+            self._sock = socket.create_connection(self.server_address, timeout=2)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            logging.info(f"Preview connection established to {self.server_address}")
+            return True
+        except OSError as e:
+            logging.warning(f"Could not connect to preview server {self.server_address}: {e}")
+            self._sock = None
+            return False
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
@@ -1,9 +1,13 @@
 # auto_data_collector.py
 import os
-import paramiko
 import getpass
 import logging
 
+from ssh_session_manager import SSHSessionManager
+from data_pull_engine import DataPullEngine
+from file_catalog import FileCatalog
+from create_database import DEFAULT_DB_PATH
+
 CENTRAL_USERNAME = getpass.getuser()
 LOG_FILE = f"/home/{CENTRAL_USERNAME}/labx_master/central_server_code/logs/auto_data_collector.log"
 
@@ -14,50 +18,79 @@ logging.basicConfig(
 )
 
 class AutoDataCollector:
-    def __init__(self):
+    def __init__(self, ssh_sessions=None):
         self.dest_root = f"/home/{CENTRAL_USERNAME}/labx_master/pulled_data"
         os.makedirs(self.dest_root, exist_ok=True)
+        # Reuse the caller's pooled SSH sessions (e.g. the GUI's) when given
+        self.owns_sessions = ssh_sessions is None
+        self.ssh_sessions = ssh_sessions or SSHSessionManager()
 
-    def pull_previous_data(self, devices, folder_name="previous_capture"):
-        """
-        Pull data from a 'previous_capture' folder on each remote device.
-        'devices' is a list of dicts, each containing 'ip_address', 'username', 'sensor_type', etc.
-        """
+    def build_jobs(self, devices, folder_name):
+        """DataPullEngine jobs copying each device's capture folder into pulled_data/<folder_name>."""
+        # Make local subfolder
+        local_subfolder = os.path.join(self.dest_root, folder_name)
+        os.makedirs(local_subfolder, exist_ok=True)
+
+        jobs = []
         for device in devices:
-            host = device["ip_address"]
             username = device["username"]
             sensor_type = device["sensor_type"]
-            
+
             if sensor_type == 'body_tracking':
                 sensor_type = 'ZED2i'
 
             # Construct remote folder path
             base_remote_path = f"/home/{username}/labx_master/{sensor_type}_code/data"
-            remote_folder_path = os.path.join(base_remote_path,folder_name)
-
-            # Make local subfolder
-            local_subfolder = os.path.join(self.dest_root,folder_name)
-            os.makedirs(local_subfolder, exist_ok=True)
-
-            try:
-                # Connect via SSH & SFTP
-                ssh = paramiko.SSHClient()
-                ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-                ssh.connect(hostname=host, username=username)
-                sftp = ssh.open_sftp()
-
-                # Copy files
-                for item in sftp.listdir(remote_folder_path):
-                    remote_file = os.path.join(remote_folder_path, item)
-                    local_file = os.path.join(local_subfolder, item)
-                    sftp.get(remote_file, local_file)
-
-                sftp.close()
-                ssh.close()
-
-                logging.info(f"Pulled data from {host} into {local_subfolder}")
-                print(f"Data pulled from {host} -> {local_subfolder}")
-
-            except Exception as e:
-                logging.error(f"Error pulling data from {host}: {e}")
-                print(f"ERROR: Could not pull data from {host}. Reason: {e}")
\ No newline at end of file
+            jobs.append({
+                'host': device["ip_address"],
+                'username': username,
+                'remote_path': os.path.join(base_remote_path, folder_name),
+                'local_path': local_subfolder,
+                'deployed_sensor_id': device.get("deployed_sensor_id"),
+                'sensor_type': device["sensor_type"],
+            })
+        return jobs
+
+    def pull_previous_data(self, devices, folder_name="previous_capture", transfer_mode="sftp",
+                           catalog_db_path=DEFAULT_DB_PATH):
+        """
+        Pull data from a 'previous_capture' folder on each remote device.
+        'devices' is a list of dicts, each containing 'ip_address', 'username', 'sensor_type', etc.
+        Devices are pulled in parallel and files already pulled (e.g. trickled during the
+        capture) are skipped. transfer_mode 'archive' streams the files compressed
+        (see DataPullEngine). The pulled segments are then catalogued in catalog_db_path
+        (None skips this).
+        """
+        local_subfolder = os.path.join(self.dest_root, folder_name)
+        jobs = self.build_jobs(devices, folder_name)
+
+        results, summary = DataPullEngine(self.ssh_sessions, transfer_mode=transfer_mode).pull(jobs)
+        for result in results:
+            if result['error']:
+                print(f"ERROR: Could not pull data from {result['host']}. Reason: {result['error']}")
+            else:
+                print(f"Data pulled from {result['host']} -> {local_subfolder} "
+                      f"({result['files']} new, {result['skipped']} up to date, {result['failed']} failed)")
+        print(f"Pulled {summary['bytes'] / 1e6:.1f} MB in {summary['seconds']:.1f} s ({summary['mb_per_s']:.1f} MB/s)")
+
+        if catalog_db_path:
+            self.catalog_pulled_files(jobs, results, folder_name, catalog_db_path)
+
+        if self.owns_sessions:
+            self.ssh_sessions.close_all()
+
+    def catalog_pulled_files(self, jobs, results, folder_name, catalog_db_path):
+        """Record each device's pulled segments under its deployed_sensor_id in the file catalog."""
+        files = [
+            (os.path.join(job['local_path'], path), job['deployed_sensor_id'], job['sensor_type'])
+            for job, result in zip(jobs, results) for path in result['paths']
+        ]
+        try:
+            catalog = FileCatalog(catalog_db_path)
+            counts = catalog.ingest(folder_name, files)
+            catalog.close()
+        except Exception as e:
+            logging.error(f"Could not catalog {folder_name} in {catalog_db_path}: {e}")
+            print(f"ERROR: Could not catalog the pulled data. Reason: {e}")
+            return
+        print(f"Catalogued {counts['added']} new segments ({counts['unchanged']} already catalogued) in {catalog_db_path}")
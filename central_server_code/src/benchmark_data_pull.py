@@ -0,0 +1,268 @@
+import os
+import time
+import random
+import shutil
+import socket
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+import paramiko
+
+from ssh_session_manager import SSHSessionManager
+from data_pull_engine import DataPullEngine, FILES_PER_HOST
+
+# Throughput benchmark for the capture data pull path.
+#
+# By default a stand-in SSH server (paramiko, exec + SFTP, any password) is started on
+# localhost in a child process, so it does not share the client's GIL, and serves generated
+# files from a temporary directory. --latency_ms routes it through a proxy that delays every
+# packet, to show the effect of round trips on a LAN.
+# Point --host/--port/--remote_path at a real sshd to measure against a device instead.
+
+
+# --------------------------------------
+# Stand-in SSH server
+# --------------------------------------
+
+class _StandInHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _StandInSFTP(paramiko.SFTPServerInterface):
+    def open(self, path, flags, attr):
+        handle = _StandInHandle(flags)
+        handle.readfile = open(path, 'rb')
+        handle.filename = path
+        return handle
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+    lstat = stat
+
+    def list_folder(self, path):
+        return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, name)), name) for name in os.listdir(path)]
+
+
+class _StandInServer(paramiko.ServerInterface):
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        def feed_stdin(process):
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    break
+                process.stdin.write(data)
+            process.stdin.close()
+
+        def run():
+            time.sleep(0.01)  # Let the exec reply go out before the channel closes
+            process = subprocess.Popen(command.decode(), shell=True, stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            threading.Thread(target=feed_stdin, args=(process,), daemon=True).start()
+            stderr = []
+            stderr_reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+            stderr_reader.start()
+            for chunk in iter(lambda: process.stdout.read1(262144), b''):
+                channel.sendall(chunk)
+            stderr_reader.join()
+            channel.sendall_stderr(stderr[0])
+            channel.send_exit_status(process.wait())
+            channel.close()
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+
+def start_stand_in_server():
+    """Serve SSH on a free localhost port from daemon threads; returns the port."""
+    host_key = paramiko.RSAKey.generate(2048)
+    listener = socket.create_server(('127.0.0.1', 0))
+
+    def serve(connection):
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _StandInSFTP)
+        transport.start_server(server=_StandInServer())
+        channels = []  # Keep accepted channels referenced while the transport lives
+        while transport.is_active():
+            channels.append(transport.accept(1))
+
+    def accept_loop():
+        while True:
+            connection, _ = listener.accept()
+            threading.Thread(target=serve, args=(connection,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def start_latency_proxy(target_port, latency_ms, bandwidth_mbit=0):
+    """TCP proxy adding latency_ms / 2 in each direction and optionally capping bandwidth; returns its port."""
+    listener = socket.create_server(('127.0.0.1', 0))
+    delay = latency_ms / 2000.0
+    bytes_per_s = bandwidth_mbit * 1e6 / 8
+
+    def pump(source, destination):
+        pending = []  # [(due time, data)]
+        condition = threading.Condition()
+
+        def sender():
+            link_free = 0.0  # When the simulated link finishes sending the previous chunk
+            while True:
+                with condition:
+                    while not pending:
+                        condition.wait()
+                    due, data = pending.pop(0)
+                if bytes_per_s and data:
+                    link_free = max(link_free, time.perf_counter()) + len(data) / bytes_per_s
+                    due = max(due, link_free)
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                if data is None:
+                    destination.shutdown(socket.SHUT_WR)
+                    return
+                destination.sendall(data)
+
+        threading.Thread(target=sender, daemon=True).start()
+        while True:
+            data = source.recv(262144)
+            with condition:
+                pending.append((time.perf_counter() + delay, data or None))
+                condition.notify()
+            if not data:
+                return
+
+    def accept_loop():
+        while True:
+            client, _ = listener.accept()
+            upstream = socket.create_connection(('127.0.0.1', target_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=pump, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=pump, args=(upstream, client), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener.getsockname()[1]
+
+
+def serve_stand_in(port_queue, latency_ms, bandwidth_mbit):
+    """Child process: run the stand-in (behind the latency proxy if requested) and report its port."""
+    port = start_stand_in_server()
+    if latency_ms > 0 or bandwidth_mbit > 0:
+        port = start_latency_proxy(port, latency_ms, bandwidth_mbit)
+    port_queue.put(port)
+    threading.Event().wait()
+
+
+# --------------------------------------
+# Benchmark runs
+# --------------------------------------
+
+def generate_data(size, compressible):
+    """Random bytes (like compressed .npz), or ZED-style JSON body frames with noisy coordinates."""
+    if not compressible:
+        return os.urandom(size)
+    frames = []
+    total = 0
+    timestamp = 1700000000000
+    while total < size:
+        keypoints = ', '.join(f"[{random.uniform(-1, 1):.4f}, {random.uniform(0, 2):.4f}, {random.uniform(1, 4):.4f}]"
+                              for _ in range(38))
+        frame = f'"{timestamp}": {{"body_list": [{{"id": 0, "confidence": {random.uniform(50, 99):.2f}, "keypoint": [{keypoints}]}}]}},\n'
+        frames.append(frame)
+        total += len(frame)
+        timestamp += 33
+    return ''.join(frames).encode()[:size]
+
+
+def run_plain_get(ssh_sessions, args, local_path):
+    """The previous pull path: one pooled SFTP client, sftp.get() per file, one file at a time."""
+    sftp = ssh_sessions.open_sftp(args.host, args.username, args.password)
+    total = 0
+    start = time.perf_counter()
+    for name in sorted(sftp.listdir(args.remote_path)):
+        sftp.get(os.path.join(args.remote_path, name), os.path.join(local_path, name))
+        total += os.path.getsize(os.path.join(local_path, name))
+    return total, time.perf_counter() - start
+
+
+def run_engine(ssh_sessions, args, local_path, files_per_host, prefetch, transfer_mode='sftp'):
+    engine = DataPullEngine(ssh_sessions, max_workers=1, files_per_host=files_per_host,
+                            prefetch=prefetch, transfer_mode=transfer_mode)
+    job = {'host': args.host, 'username': args.username, 'password': args.password,
+           'remote_path': args.remote_path, 'local_path': local_path}
+    _, summary = engine.pull([job])
+    if summary['failed'] or summary['errors']:
+        raise RuntimeError(f"Pull failed: {summary}")
+    return summary['bytes'], summary['seconds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark capture data pulls against a local SSH server stand-in")
+    parser.add_argument("--files", type=int, default=4, help="Generated files served by the stand-in")
+    parser.add_argument("--file_size_mb", type=float, default=64, help="Size of each generated file")
+    parser.add_argument("--latency_ms", type=float, default=2.0, help="Round-trip latency added by the proxy (0 disables it)")
+    parser.add_argument("--bandwidth_mbit", type=float, default=0, help="Link speed simulated by the proxy, e.g. 100 for Wi-Fi (0 is unlimited)")
+    parser.add_argument("--files_per_host", type=int, nargs='+', default=[1, FILES_PER_HOST], help="Parallel files per host to measure")
+    parser.add_argument("--compressible", action="store_true", help="Generate JSON body frames instead of random bytes")
+    parser.add_argument("--verbose", action="store_true", help="Log per-file and per-batch transfer details")
+    parser.add_argument("--host", type=str, default=None, help="Real SSH server to pull from instead of the stand-in")
+    parser.add_argument("--port", type=int, default=22, help="SSH port of --host")
+    parser.add_argument("--username", type=str, default=os.environ.get('USER', 'labx'), help="SSH username")
+    parser.add_argument("--password", type=str, default=None, help="SSH password (keys are used if omitted)")
+    parser.add_argument("--remote_path", type=str, default=None, help="Folder to pull from --host")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    work_dir = tempfile.mkdtemp(prefix='labx_pull_bench_')
+    try:
+        if args.host is None:
+            args.remote_path = os.path.join(work_dir, 'remote')
+            os.makedirs(args.remote_path)
+            for i in range(args.files):
+                with open(os.path.join(args.remote_path, f"capture_{i:03d}.{'json' if args.compressible else 'npz'}"), 'wb') as f:
+                    f.write(generate_data(int(args.file_size_mb * 1e6), args.compressible))
+            args.host, args.password = '127.0.0.1', 'stand-in'
+            port_queue = multiprocessing.Queue()
+            multiprocessing.Process(target=serve_stand_in, args=(port_queue, args.latency_ms, args.bandwidth_mbit), daemon=True).start()
+            args.port = port_queue.get(timeout=30)
+            print(f"Stand-in SSH server on port {args.port}: {args.files} x {args.file_size_mb:.0f} MB, "
+                  f"{args.latency_ms:.1f} ms added RTT, "
+                  f"{f'{args.bandwidth_mbit:.0f} Mbit/s link' if args.bandwidth_mbit else 'unlimited bandwidth'}")
+
+        runs = [('sftp.get, sequential', lambda path: run_plain_get(ssh_sessions, args, path))]
+        runs.append(('engine, no prefetch', lambda path: run_engine(ssh_sessions, args, path, 1, False)))
+        for files_per_host in args.files_per_host:
+            runs.append((f"engine, prefetch, {files_per_host} files/host",
+                         lambda path, n=files_per_host: run_engine(ssh_sessions, args, path, n, True)))
+        runs.append(('engine, tar | gzip archive stream', lambda path: run_engine(ssh_sessions, args, path, 1, False, 'archive')))
+
+        ssh_sessions = SSHSessionManager(port=args.port)
+        ssh_sessions.get_client(args.host, args.username, args.password)  # Handshake outside the timings
+        for name, run in runs:
+            local_path = os.path.join(work_dir, 'local')
+            shutil.rmtree(local_path, ignore_errors=True)
+            os.makedirs(local_path)
+            total_bytes, seconds = run(local_path)
+            print(f"{name:<45} {total_bytes / 1e6:8.1f} MB in {seconds:6.2f} s  {total_bytes / 1e6 / seconds:7.1f} MB/s")
+        ssh_sessions.close_all()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,199 +1,563 @@
-from flask import Flask, request, jsonify
-import threading
+import asyncio
+import json
 import time
-import math
-import csv
 import os
 import logging
 import argparse
+import signal
+import sys
+import math
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
 from datetime import datetime
 
-app = Flask(__name__)
-
-# Data storage
-offset_data = {}  # {sbc_id: (timestamp, data)}
-data_lock = threading.Lock()
-
-# Parse command-line arguments
-parser = argparse.ArgumentParser(description="Central Server Script")
-parser.add_argument("--base_filename", type=str, required=True, help="Base filename for the CSV")
-parser.add_argument("--duration", type=int, required=True, help="Duration of the capture in ms")
-parser.add_argument("--log_file", type=str, required=True, help="Log filepath for GUI")
-parser.add_argument("--ip_address", type=str, required=True, help="IP address to host the central server")
-parser.add_argument("--port", type=int, required=True, help="Port to host the central server")
-parser.add_argument("--sync_metrics_dir", type=str, required=True, help="Port to host the central server")
-args = parser.parse_args()
-
-# Configure Flask app to use the specified IP and port
-app_host = args.ip_address
-app_port = args.port
-
-# Set up logging using the passed log file
-logging.basicConfig(
-    filename=args.log_file,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
+from sync_metrics import SyncMetricsEngine
+from metrics_store import CSV_FIELDNAMES, MetricsStore
+from drift_monitor import DriftMonitor
+from create_database import DEFAULT_DB_PATH
+
+# Add the repository root to sys.path to import shared modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..', '..'))
+sys.path.append(parent_dir)
+from shared_sensor_code.telemetry_protocol import (
+    ACK, ACK_ERROR, ACK_OK, BATCH_HEADER, DEFAULT_TELEMETRY_PORT, RECORD, TelemetryProtocolError,
+    decode_batch_header, decode_records, parse_chronyc_output
 )
-logging.info("Starting Central Server.")
-
-# Generate a timestamp with microsecond accuracy
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S%f')
-duration_ms = 1000 * int(args.duration)
-
-# Generate the CSV file path
-CSV_FILE = f'/{args.sync_metrics_dir}/{args.base_filename}_{timestamp}_{duration_ms}ms.csv'
-
-# Ensure the CSV file exists and has a header
-if not os.path.isfile(CSV_FILE):
-    os.makedirs(os.path.dirname(CSV_FILE), exist_ok=True)
-    with open(CSV_FILE, 'w', newline='') as csvfile:
-        fieldnames = ['timestamp', 'max_offset_ms', 'mean_offset_ms', 'jitter_ms', 'mean_root_dispersion_ms', 'max_root_dispersion_ms']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-
-logging.info(f"Initialized CSV file: {CSV_FILE}")
+from shared_sensor_code.metrics_registry import Counter, Gauge, Histogram, start_metrics_server
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024      # chronyc tracking output is well under 1 KB
+KEEPALIVE_TIMEOUT = 75          # Seconds an idle sensor connection is kept open
+FLUSH_INTERVAL = 1.0            # Seconds between metric/CSV flushes
+MAX_PENDING_SAMPLES = 100000    # Bound on samples waiting for the flush task
+MAX_METRICS_POINTS = 1000       # Most fleet rows returned by one /metrics response
+STREAM_KEEPALIVE = 15           # Seconds between SSE keep-alive comments
+SHUTDOWN_TIMEOUT = 2.0          # Seconds to wait for closed connections' handlers on shutdown
+
+REPORTS_RECEIVED = Counter('labx_server_reports_total', 'Time sync reports queued, by transport.', ['transport'])
+REPORTS_REJECTED = Counter('labx_server_rejected_total', 'Rejected requests and telemetry records, by transport.', ['transport'])
+PENDING_SAMPLES = Gauge('labx_server_pending_samples', 'Samples waiting for the flush task.')
+FLUSH_SECONDS = Histogram('labx_server_flush_seconds', 'Time to apply and persist one batch of samples.')
+FLUSHED_SAMPLES = Counter('labx_server_flushed_samples_total', 'Samples applied to the metrics and written to the store.')
+SENSORS = Gauge('labx_server_sensors', 'Sensors that have reported at least once.')
+SENSOR_OFFSET_SECONDS = Gauge('labx_sensor_offset_seconds', 'Latest reported system time offset per sensor.', ['sensor'])
+SENSOR_ROOT_DISPERSION_SECONDS = Gauge('labx_sensor_root_dispersion_seconds', 'Latest reported root dispersion per sensor.', ['sensor'])
+FLEET_MAX_OFFSET_SECONDS = Gauge('labx_fleet_max_offset_seconds', 'Largest pairwise offset between sensors.')
+FLEET_JITTER_SECONDS = Gauge('labx_fleet_jitter_seconds', 'Standard deviation of pairwise offsets between sensors.')
+ACTIVE_ALERTS = Gauge('labx_server_active_alerts', 'Sync alerts currently active.')
+STREAM_SUBSCRIBERS = Gauge('labx_server_stream_subscribers', 'Open /metrics/stream connections.')
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                408: 'Request Timeout', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """Rejected request; carries the HTTP status and the message returned to the sensor."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def validate_payload(body):
+    """Validate a /receive_data body and return (deployed_sensor_id, timestamp, chrony_data)."""
+    try:
+        data = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise RequestError(400, 'Invalid JSON')
+    if not isinstance(data, dict):
+        raise RequestError(400, 'Invalid data')
 
-@app.route('/receive_data', methods=['POST'])
-def receive_data():
-    """Receive and process data from sensors."""
-    data = request.get_json()
     deployed_sensor_id = data.get('deployed_sensor_id')
-    entry = data.get('data')  # Adjusted from 'entries' to 'entry'
-
+    entry = data.get('data')
     if deployed_sensor_id is None or entry is None:
-        logging.error("Invalid data received: Missing 'deployed_sensor_id' or 'data'")
-        return jsonify({'status': 'error', 'message': 'Invalid data'}), 400
-
-    with data_lock:
-        # Ensure that entry is a dictionary
-        if not isinstance(entry, dict):
-            logging.error("Invalid entry format received.")
-            return jsonify({'status': 'error', 'message': 'Invalid entry format'}), 400
-
-        timestamp = entry.get('timestamp')
-        chronyc_output = entry.get('chronyc_output')
-        if timestamp is None or chronyc_output is None:
-            logging.error("Missing 'timestamp' or 'chronyc_output' in data.")
-            return jsonify({'status': 'error', 'message': 'Missing timestamp or chronyc_output'}), 400
-
-        # Parse metrics from chronyc_output
-        chrony_data = parse_chronyc_output(chronyc_output)
-        if not chrony_data:
-            logging.error("Failed to parse chronyc output.")
-            return jsonify({'status': 'error', 'message': 'Failed to parse chronyc output'}), 400
-
-        # Print the parsed values in a structured format
-        print("\n--- Received Data ---")
-        print(f"Deployed Sensor ID: {deployed_sensor_id}")
-        print(f"Timestamp: {timestamp}")
-        print(f"Reference ID: {chrony_data.get('reference_id', 'N/A')}")
-        print(f"Stratum: {chrony_data.get('stratum', 'N/A')}")
-        print(f"System Time Offset: {chrony_data.get('system_time_offset', 'N/A')} seconds")
-        print(f"Root Dispersion: {chrony_data.get('root_dispersion', 'N/A')} seconds")
-        print(f"Root Delay: {chrony_data.get('root_delay', 'N/A')} seconds")
-        print("--- End of Data ---\n")
-
-        # Log the received data
-        logging.info(f"Received data from sensor {deployed_sensor_id}: {chrony_data}")
-
-        # Store the parsed data
-        offset_data[deployed_sensor_id] = (timestamp, chrony_data)
-
-    # After receiving new data, calculate synchronization metrics and save them immediately
-    calculate_synchronization_metrics()
-
-    return jsonify({'status': 'success'}), 200
-
-def parse_chronyc_output(chronyc_output):
-    """Extract required metrics from chronyc output."""
-    data = {}
-    try:
-        for line in chronyc_output.strip().split('\n'):
-            if "System time" in line:
-                offset_str = line.split()[3]
-                offset_value = ''.join(filter(lambda c: c.isdigit() or c == '.' or c == '-' or c == '+', offset_str))
-                data['system_time_offset'] = float(offset_value)
-            elif "Root dispersion" in line:
-                disp_str = line.split()[3]
-                disp_value = ''.join(filter(lambda c: c.isdigit() or c == '.' or c == '-' or c == '+', disp_str))
-                data['root_dispersion'] = float(disp_value)
-            elif "Root delay" in line:
-                delay_str = line.split()[3]
-                delay_value = ''.join(filter(lambda c: c.isdigit() or c == '.' or c == '-' or c == '+', delay_str))
-                data['root_delay'] = float(delay_value)
-            elif "Reference ID" in line:
-                data['reference_id'] = line.split(":")[1].strip()
-            elif "Stratum" in line:
-                data['stratum'] = int(line.split(":")[1].strip())
-    except Exception as e:
-        logging.error(f"Error parsing chronyc output: {e}")
-        return None
-    return data
-
-def calculate_synchronization_metrics():
-    """Calculate and log synchronization metrics."""
-    with data_lock:
-        if len(offset_data) < 2:
-            logging.warning("Not enough data to calculate synchronization metrics.")
+        raise RequestError(400, 'Invalid data')
+    if not isinstance(entry, dict):
+        raise RequestError(400, 'Invalid entry format')
+
+    timestamp = entry.get('timestamp')
+    chronyc_output = entry.get('chronyc_output')
+    if timestamp is None or chronyc_output is None:
+        raise RequestError(400, 'Missing timestamp or chronyc_output')
+    if not isinstance(chronyc_output, str) or not isinstance(timestamp, (int, float)):
+        raise RequestError(400, 'Invalid entry format')
+
+    chrony_data = parse_chronyc_output(chronyc_output)
+    if not chrony_data or 'system_time_offset' not in chrony_data or 'root_dispersion' not in chrony_data:
+        raise RequestError(400, 'Failed to parse chronyc output')
+    return str(deployed_sensor_id), timestamp, chrony_data
+
+
+class SyncIngestionServer:
+    """
+    Asyncio HTTP/1.1 server for the sensors' TimeSync reports.
+
+    The request handler only validates the payload, parses the chronyc text and appends the
+    sample to an in-memory queue. A background task drains the queue every flush_interval,
+    feeds each sample to the incremental SyncMetricsEngine and hands the sensor samples plus
+    one fleet metrics row to the MetricsStore, which writes them to SQLite in one transaction.
+    A CSV is exported only when csv_file is given, at shutdown. With a database_path, every
+    sample also goes through the DriftMonitor, which writes drift and loss-of-sync alerts to
+    the Lab in a Box `alerts` table under the capture recorded as base_filename.
+
+    With a telemetry_port, sensors using TimeSync's binary transport send batches of packed
+    records over a persistent TCP connection instead (see shared_sensor_code/telemetry_protocol);
+    they join the same queue without any text parsing.
+
+    The GUI reads metrics from the same process: GET /metrics?since=<cursor> returns fleet rows
+    newer than the cursor plus per-sensor status, and GET /metrics/stream pushes the same
+    deltas as server-sent events after every flush.
+    """
+
+    def __init__(self, host, port, db_file, csv_file=None, flush_interval=FLUSH_INTERVAL, database_path=None,
+                 telemetry_port=None, metrics_port=None, base_filename=None):
+        self.host = host
+        self.port = port
+        self.telemetry_port = telemetry_port
+        self.metrics_port = metrics_port
+        self.db_file = db_file
+        self.database_path = database_path
+        self.base_filename = base_filename
+        self.csv_file = csv_file
+        self.flush_interval = flush_interval
+
+        self.offset_data = {}  # {deployed_sensor_id: (timestamp, chrony_data)}
+        self.metrics_engine = SyncMetricsEngine()
+        self.pending_samples = deque()
+        self.received_count = 0
+        self.rejected_count = 0
+        self.server = None
+        self.telemetry_server = None
+        self.metrics_store = None
+        self.drift_monitor = None
+        self.stream_queues = set()
+        self.client_connections = {}  # {writer: handler task} for open connections, closed on shutdown
+
+        PENDING_SAMPLES.set_function(lambda: len(self.pending_samples))
+        SENSORS.set_function(lambda: len(self.offset_data))
+        STREAM_SUBSCRIBERS.set_function(lambda: len(self.stream_queues))
+        ACTIVE_ALERTS.set_function(lambda: len(self.drift_monitor.active_alerts) if self.drift_monitor else 0)
+
+    # --------------------------------------
+    # HTTP handling
+    # --------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        """Serve keep-alive requests from one sensor until it disconnects or idles out."""
+        self.client_connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send_response(writer, 400, {'status': 'error', 'message': 'Header too large'}, False)
+                    break
+
+                try:
+                    method, path, version, headers = self.parse_head(head)
+                    keep_alive = self.wants_keep_alive(version, headers)
+                    body = await self.read_body(reader, headers)
+                    if urlsplit(path).path == '/metrics/stream':
+                        if method != 'GET':
+                            raise RequestError(405, 'Method not allowed')
+                        await self.stream_metrics(writer, path, headers)
+                        break
+                    status, response = self.dispatch(method, path, body)
+                except RequestError as e:
+                    self.rejected_count += 1
+                    REPORTS_REJECTED.labels('json').inc()
+                    logging.error(f"Rejected request from {writer.get_extra_info('peername')}: {e.message}")
+                    await self.send_response(writer, e.status, {'status': 'error', 'message': e.message}, False)
+                    break
+
+                await self.send_response(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.client_connections.pop(writer, None)
+            writer.close()
+
+    def parse_head(self, head):
+        try:
+            lines = head.decode('latin-1').split('\r\n')
+            method, path, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise RequestError(400, 'Malformed request line')
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise RequestError(400, 'Malformed header')
+            headers[name.strip().lower()] = value.strip()
+        return method, path, version, headers
+
+    def wants_keep_alive(self, version, headers):
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    async def read_body(self, reader, headers):
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise RequestError(400, 'Chunked bodies are not supported')
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            raise RequestError(400, 'Invalid Content-Length')
+        if length < 0:
+            raise RequestError(400, 'Invalid Content-Length')
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, 'Payload too large')
+        try:
+            return await asyncio.wait_for(reader.readexactly(length), KEEPALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RequestError(408, 'Timed out reading body')
+
+    def dispatch(self, method, path, body):
+        url = urlsplit(path)
+        if url.path == '/receive_data':
+            if method != 'POST':
+                raise RequestError(405, 'Method not allowed')
+            return self.receive_data(body)
+        if url.path == '/metrics':
+            if method != 'GET':
+                raise RequestError(405, 'Method not allowed')
+            cursor, limit = self.parse_cursor(url.query)
+            return 200, self.metrics_since(cursor, limit)
+        raise RequestError(404, 'Not found')
+
+    def parse_cursor(self, query, default_cursor=0):
+        params = parse_qs(query)
+        try:
+            cursor = int(params.get('since', [default_cursor])[0])
+            limit = int(params.get('limit', [MAX_METRICS_POINTS])[0])
+        except ValueError:
+            raise RequestError(400, 'Invalid since or limit')
+        return cursor, max(1, min(limit, MAX_METRICS_POINTS))
+
+    def receive_data(self, body):
+        """Validate one TimeSync report and queue it for the flush task. O(1) per request."""
+        deployed_sensor_id, timestamp, chrony_data = validate_payload(body)
+        if len(self.pending_samples) >= MAX_PENDING_SAMPLES:
+            raise RequestError(503, 'Server busy')
+        self.pending_samples.append((deployed_sensor_id, timestamp, chrony_data))
+        self.received_count += 1
+        REPORTS_RECEIVED.labels('json').inc()
+        logging.debug(f"Received data from sensor {deployed_sensor_id}: {chrony_data}")
+        return 200, {'status': 'success'}
+
+    async def send_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode('latin-1')
+        writer.write(head + body)
+        await writer.drain()
+
+    # --------------------------------------
+    # Binary telemetry
+    # --------------------------------------
+
+    async def handle_telemetry(self, reader, writer):
+        """Read binary batches from one sensor's persistent connection and ACK each one."""
+        peer = writer.get_extra_info('peername')
+        self.client_connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    header = await asyncio.wait_for(reader.readexactly(BATCH_HEADER.size), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    break
+                try:
+                    id_length, count = decode_batch_header(header)
+                    frame = await asyncio.wait_for(reader.readexactly(id_length + count * RECORD.size), KEEPALIVE_TIMEOUT)
+                    deployed_sensor_id = frame[:id_length].decode()
+                except (TelemetryProtocolError, UnicodeDecodeError, asyncio.TimeoutError) as e:
+                    # The stream cannot be resynchronised after a bad frame, so drop the connection
+                    self.rejected_count += 1
+                    REPORTS_REJECTED.labels('binary').inc()
+                    logging.error(f"Rejected telemetry from {peer}: {e}")
+                    writer.write(ACK.pack(ACK_ERROR, 0))
+                    break
+
+                accepted = self.receive_records(deployed_sensor_id, frame[id_length:], count)
+                writer.write(ACK.pack(ACK_OK if accepted == count else ACK_ERROR, accepted))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.client_connections.pop(writer, None)
+            writer.close()
+
+    def receive_records(self, deployed_sensor_id, payload, count):
+        """Queue a batch of packed records for the flush task; returns how many were accepted."""
+        if len(self.pending_samples) + count > MAX_PENDING_SAMPLES:
+            return 0
+        samples = [
+            (deployed_sensor_id, timestamp, chrony_data) for timestamp, chrony_data in decode_records(payload)
+            if not math.isnan(chrony_data['system_time_offset']) and not math.isnan(chrony_data['root_dispersion'])
+        ]
+        self.pending_samples.extend(samples)
+        self.received_count += len(samples)
+        self.rejected_count += count - len(samples)
+        REPORTS_RECEIVED.labels('binary').inc(len(samples))
+        REPORTS_REJECTED.labels('binary').inc(count - len(samples))
+        logging.debug(f"Received {len(samples)} binary samples from sensor {deployed_sensor_id}")
+        return len(samples)
+
+    # --------------------------------------
+    # Metrics query and push API
+    # --------------------------------------
+
+    def sensor_status(self):
+        """Latest report of every sensor, with its age in seconds."""
+        now = time.time()
+        return {
+            deployed_sensor_id: {
+                'timestamp': timestamp,
+                'age_s': now - timestamp,
+                'system_time_offset_ms': chrony_data['system_time_offset'] * 1000,
+                'root_dispersion_ms': chrony_data['root_dispersion'] * 1000,
+                'root_delay_ms': chrony_data['root_delay'] * 1000 if 'root_delay' in chrony_data else None,
+                'stratum': chrony_data.get('stratum'),
+                'reference_id': chrony_data.get('reference_id'),
+                'alerts': self.drift_monitor.alerts_for(deployed_sensor_id) if self.drift_monitor else [],
+            }
+            for deployed_sensor_id, (timestamp, chrony_data) in self.offset_data.items()
+        }
+
+    def metrics_since(self, cursor, limit=MAX_METRICS_POINTS):
+        """Fleet rows with id > cursor (newest `limit` of them) and the current sensor status."""
+        rows = self.metrics_store.fleet_since(cursor, limit)
+        return {
+            'cursor': self.metrics_store.last_fleet_id,
+            'fields': ['id'] + CSV_FIELDNAMES,
+            'points': [list(row) for row in rows],
+            'sensors': self.sensor_status(),
+        }
+
+    def notify_streams(self, closing=False):
+        """Wake every stream subscriber; each one sends whatever is newer than its own cursor."""
+        for queue in self.stream_queues:
+            if queue.empty():
+                queue.put_nowait(not closing)
+            elif closing:
+                queue.get_nowait()
+                queue.put_nowait(False)
+
+    async def stream_metrics(self, writer, path, headers):
+        """
+        Server-sent events: one `metrics` event per flush, resuming from ?since= or Last-Event-ID.
+
+        The per-subscriber queue only carries wake-ups, so a slow client never misses rows: it
+        receives everything after its own cursor (up to `limit` rows) when it catches up.
+        """
+        try:
+            last_event_id = int(headers.get('last-event-id') or 0)
+        except ValueError:
+            last_event_id = 0
+        cursor, limit = self.parse_cursor(urlsplit(path).query, default_cursor=last_event_id)
+        queue = asyncio.Queue(maxsize=1)
+        self.stream_queues.add(queue)
+        peer = writer.get_extra_info('peername')
+        logging.info(f"Metrics stream opened by {peer}")
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n"
+            )
+            running = True
+            while running:
+                event = self.metrics_since(cursor, limit)
+                cursor = event['cursor']
+                writer.write(f"id: {cursor}\nevent: metrics\ndata: {json.dumps(event)}\n\n".encode())
+                await writer.drain()
+                while True:
+                    try:
+                        running = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE)
+                        break
+                    except asyncio.TimeoutError:
+                        writer.write(b": keepalive\n\n")
+                        await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.stream_queues.discard(queue)
+            logging.info(f"Metrics stream closed by {peer}")
+
+    # --------------------------------------
+    # Metrics and persistence
+    # --------------------------------------
+
+    def open_store(self):
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        self.metrics_store = MetricsStore(self.db_file)
+        if self.database_path:
+            os.makedirs(os.path.dirname(self.database_path), exist_ok=True)
+            self.drift_monitor = DriftMonitor(self.database_path, base_filename=self.base_filename)
+
+    def close_store(self):
+        if self.metrics_store is None:
             return
+        if self.csv_file:
+            self.metrics_store.export_csv(self.csv_file)
+        self.metrics_store.close()
+        self.metrics_store = None
+        if self.drift_monitor is not None:
+            self.drift_monitor.close()
+            self.drift_monitor = None
+
+    def flush(self):
+        """Apply queued samples in arrival order, record one fleet row and write everything in one batch."""
+        if not self.pending_samples:
+            # Sensors that stopped reporting still need to be flagged
+            if self.drift_monitor is not None:
+                self.drift_monitor.check_stale()
+                self.drift_monitor.flush()
+            return None
+        flush_start = time.perf_counter()
+        sample_count = len(self.pending_samples)
+        while self.pending_samples:
+            deployed_sensor_id, timestamp, chrony_data = self.pending_samples.popleft()
+            self.offset_data[deployed_sensor_id] = (timestamp, chrony_data)
+            SENSOR_OFFSET_SECONDS.labels(deployed_sensor_id).set(chrony_data['system_time_offset'])
+            SENSOR_ROOT_DISPERSION_SECONDS.labels(deployed_sensor_id).set(chrony_data['root_dispersion'])
+            self.metrics_engine.update(
+                deployed_sensor_id, chrony_data['system_time_offset'], chrony_data['root_dispersion']
+            )
+            self.metrics_store.record_sensor(deployed_sensor_id, timestamp, chrony_data)
+            if self.drift_monitor is not None:
+                self.drift_monitor.update(deployed_sensor_id, timestamp, chrony_data)
 
-        # Collect the latest metrics from each SBC
-        metrics = {sbc_id: data for sbc_id, (timestamp, data) in offset_data.items()}
-
-        deployed_sensor_ids = list(metrics.keys())
         current_time = time.time()
+        row = self.metrics_engine.metrics(current_time)
+        if row is not None:
+            self.metrics_store.record_fleet(row)
+        self.metrics_store.flush()
+        if self.drift_monitor is not None:
+            self.drift_monitor.check_stale(current_time)
+            self.drift_monitor.flush()
+        self.notify_streams()
+        FLUSH_SECONDS.observe(time.perf_counter() - flush_start)
+        FLUSHED_SAMPLES.inc(sample_count)
+        if row is None:
+            logging.warning("Not enough data to calculate synchronization metrics.")
+            return None
+        FLEET_MAX_OFFSET_SECONDS.set(row['max_offset_ms'] / 1000)
+        FLEET_JITTER_SECONDS.set(row['jitter_ms'] / 1000)
+        logging.info(
+            f"Synchronization Metrics at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time))}: "
+            f"Max Offset: {row['max_offset_ms']:.3f} ms, Mean Offset: {row['mean_offset_ms']:.3f} ms, "
+            f"Jitter: {row['jitter_ms']:.3f} ms, Root Dispersion Mean: {row['mean_root_dispersion_ms']:.3f} ms, "
+            f"Max: {row['max_root_dispersion_ms']:.3f} ms ({sample_count} samples, {len(self.offset_data)} sensors)"
+        )
+        return row
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    # --------------------------------------
+    # Lifecycle
+    # --------------------------------------
+
+    async def close_connections(self):
+        """
+        Stop accepting, close every open connection and wait briefly for the handlers to exit.
+
+        Since Python 3.12, leaving `async with self.server` waits for all connections to finish,
+        so idle keep-alive sensors would otherwise hold shutdown for up to KEEPALIVE_TIMEOUT.
+        """
+        self.server.close()
+        if self.telemetry_server is not None:
+            self.telemetry_server.close()
+        handlers = list(self.client_connections.values())
+        for writer in list(self.client_connections):
+            writer.close()
+        if handlers:
+            await asyncio.wait(handlers, timeout=SHUTDOWN_TIMEOUT)
+
+    async def serve(self):
+        self.open_store()
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES, reuse_address=True
+        )
+        if self.telemetry_port:
+            self.telemetry_server = await asyncio.start_server(
+                self.handle_telemetry, self.host, self.telemetry_port, reuse_address=True
+            )
+            logging.info(f"Accepting binary telemetry on {self.host}:{self.telemetry_port}")
+        if self.metrics_port:
+            start_metrics_server(self.metrics_port, self.host)
+        flush_task = asyncio.create_task(self.flush_loop())
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop_event.set)
+        logging.info(f"Starting server at http://{self.host}:{self.port}/receive_data")
+        try:
+            async with self.server:
+                await stop_event.wait()
+                self.notify_streams(closing=True)
+                await self.close_connections()
+        finally:
+            if self.telemetry_server is not None:
+                self.telemetry_server.close()
+            flush_task.cancel()
+            self.flush()
+            self.close_store()
+            logging.info(f"Central server stopped after {self.received_count} samples ({self.rejected_count} rejected).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Central Server Script")
+    parser.add_argument("--base_filename", type=str, required=True, help="Base filename for the sync metrics files")
+    parser.add_argument("--duration", type=int, required=True, help="Duration of the capture in ms")
+    parser.add_argument("--log_file", type=str, required=True, help="Log filepath for GUI")
+    parser.add_argument("--ip_address", type=str, required=True, help="IP address to host the central server")
+    parser.add_argument("--port", type=int, required=True, help="Port to host the central server")
+    parser.add_argument("--sync_metrics_dir", type=str, required=True, help="Directory for the sync metrics database")
+    parser.add_argument("--export_csv", action="store_true", help="Also export the fleet metrics to CSV on shutdown")
+    parser.add_argument("--database_path", type=str, default=DEFAULT_DB_PATH, help="Lab in a Box database that receives sync alerts")
+    parser.add_argument("--flush_interval", type=float, default=FLUSH_INTERVAL, help="Seconds between batched metric writes")
+    parser.add_argument("--telemetry_port", type=int, default=DEFAULT_TELEMETRY_PORT, help="Port for binary time sync telemetry (0 disables it)")
+    parser.add_argument("--metrics_port", type=int, default=0, help="Port for the Prometheus metrics endpoint (0 disables it)")
+    args = parser.parse_args()
+
+    # Set up logging using the passed log file
+    logging.basicConfig(
+        filename=args.log_file,
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    logging.info("Starting Central Server.")
+
+    # Generate a timestamp with microsecond accuracy
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S%f')
+    duration_ms = 1000 * int(args.duration)
+
+    # Generate the metrics database path; the optional CSV export sits next to it
+    file_stem = f'/{args.sync_metrics_dir}/{args.base_filename}_{timestamp}_{duration_ms}ms'
+    csv_file = f'{file_stem}.csv' if args.export_csv else None
+
+    server = SyncIngestionServer(args.ip_address, args.port, f'{file_stem}.db', csv_file=csv_file,
+                                 flush_interval=args.flush_interval, database_path=args.database_path,
+                                 telemetry_port=args.telemetry_port, metrics_port=args.metrics_port,
+                                 base_filename=args.base_filename)
+    asyncio.run(server.serve())
 
-        # Calculate time offsets between SBCs
-        time_offsets = []
-        for i in range(len(deployed_sensor_ids)):
-            for j in range(i + 1, len(deployed_sensor_ids)):
-                sbc_a = deployed_sensor_ids[i]
-                sbc_b = deployed_sensor_ids[j]
-                offset_a = metrics[sbc_a]['system_time_offset']
-                offset_b = metrics[sbc_b]['system_time_offset']
-                time_offsets.append(abs(offset_a - offset_b))
-
-        if time_offsets:
-            max_offset = max(time_offsets)
-            mean_offset = sum(time_offsets) / len(time_offsets)
-            stddev_offset = math.sqrt(sum((x - mean_offset) ** 2 for x in time_offsets) / len(time_offsets))
-
-            max_offset_ms = max_offset * 1000
-            mean_offset_ms = mean_offset * 1000
-            jitter_ms = stddev_offset * 1000
-
-            logging.info(f"Synchronization Metrics at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time))}:")
-            logging.info(f"  Max Offset: {max_offset_ms:.3f} ms, Mean Offset: {mean_offset_ms:.3f} ms, Jitter: {jitter_ms:.3f} ms")
-
-            # Print synchronization metrics
-            print(f"\nSynchronization Metrics at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(current_time))}:")
-            print(f"  Max Offset Between SBCs: {max_offset_ms:.3f} ms")
-            print(f"  Mean Offset Between SBCs: {mean_offset_ms:.3f} ms")
-            print(f"  Jitter (Std Dev of Offsets): {jitter_ms:.3f} ms")
-
-            root_dispersions = [metrics[deployed_sensor_id]['root_dispersion'] for deployed_sensor_id in deployed_sensor_ids]
-            mean_root_dispersion = sum(root_dispersions) / len(root_dispersions)
-            max_root_dispersion = max(root_dispersions)
-
-            logging.info(f"  Root Dispersion Metrics: Mean: {mean_root_dispersion * 1000:.3f} ms, Max: {max_root_dispersion * 1000:.3f} ms")
-
-            try:
-                with open(CSV_FILE, 'a', newline='') as csvfile:
-                    fieldnames = ['timestamp', 'max_offset_ms', 'mean_offset_ms', 'jitter_ms', 'mean_root_dispersion_ms', 'max_root_dispersion_ms']
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writerow({
-                        'timestamp': current_time,
-                        'max_offset_ms': max_offset_ms,
-                        'mean_offset_ms': mean_offset_ms,
-                        'jitter_ms': jitter_ms,
-                        'mean_root_dispersion_ms': mean_root_dispersion * 1000,
-                        'max_root_dispersion_ms': max_root_dispersion * 1000
-                    })
-            except IOError as e:
-                logging.error(f"Error saving data to CSV: {e}")
-        else:
-            logging.warning("No offsets to calculate metrics.")
 
 if __name__ == '__main__':
-    logging.info(f"Starting server at http://{app_host}:{app_port}/receive_data")
-    app.run(host=app_host, port=app_port)
+    main()
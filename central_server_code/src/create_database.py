@@ -1,12 +1,11 @@
 import sqlite3
 import os
+import argparse
 
 # Define the path for the SQLite database file
-db_path = "/home/daniel/labx_master/central_server_code/data/database/lab_in_a_box.db"
-
-# Connect to the SQLite database (creates it if it doesn't exist)
-conn = sqlite3.connect(db_path)
-cursor = conn.cursor()
+DEFAULT_DB_PATH = os.path.join(
+    os.path.expanduser("~/labx_master"), "central_server_code", "data", "database", "lab_in_a_box.db"
+)
 
 # SQL statements to create tables based on the provided schema
 create_tables_sql = [
@@ -36,6 +35,7 @@ create_tables_sql = [
         room_id INTEGER,
         description TEXT,
         nlp_server TEXT,
+        base_filename TEXT,
         FOREIGN KEY (participant_id) REFERENCES participants(participant_id),
         FOREIGN KEY (activity_id) REFERENCES activities(activity_id),
         FOREIGN KEY (room_id) REFERENCES rooms(room_id)
@@ -50,6 +50,7 @@ create_tables_sql = [
         alert_type TEXT,
         description TEXT,
         resolved BOOLEAN,
+        sensor_name TEXT,
         FOREIGN KEY (deployed_sensor_id) REFERENCES deployed_sensors(deployed_sensor_id),
         FOREIGN KEY (capture_id) REFERENCES data_captures(capture_id)
     )
@@ -64,6 +65,12 @@ create_tables_sql = [
         created_at TIMESTAMP,
         capture_id INTEGER,
         deployed_sensor_id INTEGER,
+        path TEXT,
+        sensor_type TEXT,
+        start_time REAL,
+        end_time REAL,
+        frame_count INTEGER,
+        checksum TEXT,
         FOREIGN KEY (capture_id) REFERENCES data_captures(capture_id),
         FOREIGN KEY (deployed_sensor_id) REFERENCES deployed_sensors(deployed_sensor_id)
     )
@@ -120,12 +127,62 @@ create_tables_sql = [
     """
 ]
 
-# Execute each SQL statement to create the tables
-for create_table_sql in create_tables_sql:
-    cursor.execute(create_table_sql)
+# Columns added after the first release; databases created before them are migrated in place
+added_columns = {
+    'data_captures': [('base_filename', 'TEXT')],
+    'alerts': [('sensor_name', 'TEXT')],
+    'files': [('path', 'TEXT'), ('sensor_type', 'TEXT'), ('start_time', 'REAL'), ('end_time', 'REAL'),
+              ('frame_count', 'INTEGER'), ('checksum', 'TEXT')],
+}
+
+# Indexes for the file catalog: time-window lookups per sensor, per capture, and re-ingest by path
+create_indexes_sql = [
+    "CREATE INDEX IF NOT EXISTS idx_files_sensor_start ON files(deployed_sensor_id, start_time)",
+    "CREATE INDEX IF NOT EXISTS idx_files_capture ON files(capture_id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_files_path ON files(path)",
+    "CREATE INDEX IF NOT EXISTS idx_data_captures_base_filename ON data_captures(base_filename)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_capture_sensor ON alerts(capture_id, sensor_name, alert_type)",
+]
+
+
+def create_tables(conn):
+    """Create any missing Lab in a Box tables, columns and indexes on an open connection."""
+    cursor = conn.cursor()
+    for create_table_sql in create_tables_sql:
+        cursor.execute(create_table_sql)
+    for table, columns in added_columns.items():
+        existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns:
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+    for create_index_sql in create_indexes_sql:
+        cursor.execute(create_index_sql)
+    conn.commit()
+
+
+def capture_id_for(conn, base_filename):
+    """capture_id of the capture recorded under base_filename, created if it is new."""
+    row = conn.execute("SELECT capture_id FROM data_captures WHERE base_filename = ?", (base_filename,)).fetchone()
+    if row is not None:
+        return row[0]
+    with conn:
+        cursor = conn.execute("INSERT INTO data_captures (base_filename) VALUES (?)", (base_filename,))
+    return cursor.lastrowid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the Lab in a Box database")
+    parser.add_argument("--db_path", type=str, default=DEFAULT_DB_PATH, help="Path of the SQLite database file")
+    args = parser.parse_args()
+
+    # Connect to the SQLite database (creates it if it doesn't exist)
+    os.makedirs(os.path.dirname(args.db_path), exist_ok=True)
+    conn = sqlite3.connect(args.db_path)
+    create_tables(conn)
+    conn.close()
+
+    print(f"Database created at {args.db_path}")
 
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
 
-print(f"Database created at {db_path}")
+if __name__ == "__main__":
+    main()
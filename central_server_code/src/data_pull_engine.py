@@ -0,0 +1,426 @@
+# data_pull_engine.py
+import os
+import re
+import time
+import shlex
+import tarfile
+import hashlib
+import logging
+import threading
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4  # Hosts pulled at the same time
+FILES_PER_HOST = 2  # Files streamed in parallel from each host, each on its own SFTP channel
+CHUNK_SIZE = 1024 * 1024  # Bytes read from SFTP per call
+READ_REQUEST_SIZE = 32768  # paramiko's SFTP read request size
+MAX_ATTEMPTS = 2  # Tries per file before it is reported as failed
+HASH_SEPARATOR = '--hashes--'
+
+# Archive mode: files stream as one gzip'd tar per batch over an exec channel
+ARCHIVE_BATCH_BYTES = 64 * 1024 * 1024  # Uncompressed bytes per tar stream; the level is re-tuned between batches
+DEFAULT_ARCHIVE_LEVEL = 1  # Start fast; raised while the network rather than the CPU is the bottleneck
+CPU_BOUND_FRACTION = 0.85  # Remote compressor busy this share of the wall time: the Pi's CPU is the bottleneck
+NETWORK_BOUND_FRACTION = 0.5  # Busy less than this: the compressor waits on the network, so compress harder
+
+
+class DataPullEngine:
+    """
+    Delta sync of capture folders from many devices over the pooled SSH sessions.
+
+    Each job is a dict with 'host', 'username', 'password' (optional), 'remote_path' and
+    'local_path'. Jobs run concurrently on a bounded pool. Every job first lists its remote
+    folder in one exec round trip (relative path, size, mtime and, with verify_hashes, a
+    SHA-256), then downloads only files that are missing locally or differ in size or mtime.
+    Downloads go to a '.part' file named after the remote version, so an interrupted pull
+    resumes where it stopped. A file is renamed into place only after its size (and hash)
+    matched, and gets the remote mtime so the next run can skip it.
+
+    Reads are pipelined: with prefetch, every read request of a file is queued up front, as
+    sftp.get does, instead of waiting one round trip per 32 KiB, and files_per_host files
+    stream from each host at once, each on its own SFTP channel.
+
+    With transfer_mode='archive' the changed files are instead sent by 'tar | gzip' on the
+    device over one exec channel per batch and unpacked on the fly here, which moves far
+    fewer bytes for radar and ZED JSON data (see pull_archive).
+
+    For pulls during a capture, min_age_s skips files modified in the last min_age_s seconds
+    (segments still being written), and throttle(host, nbytes) is called before each chunk
+    is read so the caller can enforce a bandwidth budget by blocking.
+    """
+
+    def __init__(self, ssh_sessions, max_workers=MAX_WORKERS, verify_hashes=False, files_per_host=FILES_PER_HOST,
+                 prefetch=True, transfer_mode='sftp', min_age_s=0, throttle=None):
+        if transfer_mode not in ('sftp', 'archive'):
+            raise ValueError(f"Unknown transfer mode: {transfer_mode}")
+        self.ssh_sessions = ssh_sessions
+        self.max_workers = max_workers
+        self.verify_hashes = verify_hashes
+        self.files_per_host = files_per_host
+        self.prefetch = prefetch
+        self.transfer_mode = transfer_mode
+        self.min_age_s = min_age_s
+        self.throttle = throttle
+        self.archive_levels = {}  # {host: gzip level}, carried over between batches and pulls
+        self.file_locks = {}  # {local file: Lock}, so two jobs never write the same '.part' at once
+        self.file_locks_guard = threading.Lock()
+
+    # --------------------------------------
+    # Remote manifest
+    # --------------------------------------
+
+    def build_manifest(self, job):
+        """Return {relative path: (size, mtime, sha256 or None)} for every file under remote_path."""
+        remote_path = shlex.quote(job['remote_path'])
+        command = f"cd {remote_path} && find . -type f -printf '%P\\t%s\\t%T@\\n'"
+        if self.verify_hashes:
+            command += f" && echo {HASH_SEPARATOR} && find . -type f -print0 | xargs -0 -r sha256sum"
+        exit_status, stdout_lines, stderr_lines = self.ssh_sessions.run(
+            job['host'], job['username'], command, password=job.get('password')
+        )
+        if exit_status != 0:
+            raise RuntimeError(f"Listing {job['remote_path']} failed: {' '.join(stderr_lines).strip()}")
+
+        manifest = {}
+        hashes = {}
+        in_hashes = False
+        for line in stdout_lines:
+            if line == HASH_SEPARATOR:
+                in_hashes = True
+            elif in_hashes:
+                digest, _, path = line.partition('  ')
+                hashes[os.path.normpath(path)] = digest
+            else:
+                parts = line.rsplit('\t', 2)
+                if len(parts) == 3:
+                    manifest[parts[0]] = (int(parts[1]), float(parts[2]))
+        return {path: (size, mtime, hashes.get(path)) for path, (size, mtime) in manifest.items()}
+
+    # --------------------------------------
+    # Transfers
+    # --------------------------------------
+
+    @staticmethod
+    def is_current(local_file, size, mtime):
+        """True if the local copy has the remote size and (whole-second) mtime."""
+        try:
+            stat = os.stat(local_file)
+        except FileNotFoundError:
+            return False
+        return stat.st_size == size and int(stat.st_mtime) == int(mtime)
+
+    @staticmethod
+    def part_path(local_file, size, mtime):
+        """Partial download path, unique per remote version so a changed file never resumes a stale part."""
+        directory, name = os.path.split(local_file)
+        return os.path.join(directory, f".{name}.{size}-{int(mtime)}.part")
+
+    def file_lock(self, local_file):
+        """Lock serialising every write to one local file across jobs and workers."""
+        with self.file_locks_guard:
+            return self.file_locks.setdefault(os.path.abspath(local_file), threading.Lock())
+
+    def download(self, sftp, remote_file, local_file, size, mtime, sha256=None, host=None):
+        """Fetch one file, resuming a matching '.part'; returns the bytes transferred."""
+        with self.file_lock(local_file):
+            # Another job for the same destination may have finished it while we waited
+            if self.is_current(local_file, size, mtime):
+                return 0
+            return self._download(sftp, remote_file, local_file, size, mtime, sha256, host)
+
+    def _download(self, sftp, remote_file, local_file, size, mtime, sha256, host):
+        os.makedirs(os.path.dirname(local_file), exist_ok=True)
+        part_file = self.part_path(local_file, size, mtime)
+        offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        if offset > size:
+            os.remove(part_file)
+            offset = 0
+
+        digest = hashlib.sha256() if sha256 else None
+        if digest is not None and offset:
+            with open(part_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+
+        transferred = 0
+        with sftp.open(remote_file, 'rb') as remote, open(part_file, 'ab') as local:
+            remote.seek(offset)
+            if self.prefetch and self.throttle is None and offset < size:
+                # Queue the reads for the rest of the file; read() then consumes the responses.
+                # No request limit: paramiko's limited prefetch can end early and fall back to
+                # one synchronous round trip per 32 KiB.
+                remote.prefetch(size)
+            while offset + transferred < size:
+                length = min(CHUNK_SIZE, size - offset - transferred)
+                if self.throttle is not None:
+                    # Budgeted: pipeline one chunk at a time, so nothing is fetched ahead of the budget
+                    self.throttle(host, length)
+                    position = offset + transferred
+                    chunk = b''.join(remote.readv([(position + i, min(READ_REQUEST_SIZE, length - i))
+                                                   for i in range(0, length, READ_REQUEST_SIZE)]))
+                else:
+                    chunk = remote.read(length)
+                if not chunk:
+                    break
+                local.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                transferred += len(chunk)
+
+        received = os.path.getsize(part_file)
+        if received != size or (digest is not None and digest.hexdigest() != sha256):
+            os.remove(part_file)
+            raise IOError(f"{remote_file} failed verification ({received} of {size} bytes"
+                          f"{', hash mismatch' if digest is not None and received == size else ''})")
+        os.replace(part_file, local_file)
+        os.utime(local_file, (mtime, mtime))
+        return transferred
+
+    def pull_job(self, job):
+        """Delta-sync one remote folder; returns the job's statistics."""
+        stats = {'host': job['host'], 'remote_path': job['remote_path'], 'files': 0, 'skipped': 0,
+                 'failed': 0, 'bytes': 0, 'seconds': 0.0, 'error': None, 'paths': []}
+        start = time.perf_counter()
+        try:
+            manifest = self.build_manifest(job)
+            if self.min_age_s:
+                # Leave out segments still being written and the collectors' hidden temporary files
+                settled = time.time() - self.min_age_s
+                manifest = {path: entry for path, entry in manifest.items()
+                            if entry[1] <= settled and not os.path.basename(path).startswith('.')}
+            stats['paths'] = sorted(manifest)  # Tells callers which device each local file came from
+            pending = {path: entry for path, entry in manifest.items()
+                       if not self.is_current(os.path.join(job['local_path'], path), *entry[:2])}
+            stats['skipped'] = len(manifest) - len(pending)
+            logging.info(f"{job['host']}:{job['remote_path']}: {len(manifest)} files, "
+                         f"{len(pending)} new or changed ({sum(e[0] for e in pending.values()) / 1e6:.1f} MB)")
+
+            if self.transfer_mode == 'archive':
+                self.pull_archive(job, pending, stats)
+                stats['seconds'] = time.perf_counter() - start
+                return stats
+
+            # Largest files first, so a big file does not start last and run alone
+            queue = Queue()
+            for path, entry in sorted(pending.items(), key=lambda item: -item[1][0]):
+                queue.put((path,) + entry)
+            stats_lock = threading.Lock()
+            workers = [
+                threading.Thread(target=self._file_worker, args=(job, queue, stats, stats_lock), daemon=True)
+                for _ in range(min(self.files_per_host, len(pending)))
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        except Exception as e:
+            stats['error'] = str(e)
+            logging.error(f"Error pulling {job['remote_path']} from {job['host']}: {e}")
+        stats['seconds'] = time.perf_counter() - start
+        return stats
+
+    def _file_worker(self, job, queue, stats, stats_lock):
+        """Pull files from the job's queue over a private SFTP channel until it is empty."""
+        try:
+            sftp = self.ssh_sessions.open_bulk_sftp(job['host'], job['username'], job.get('password'))
+        except Exception as e:
+            with stats_lock:
+                stats['error'] = str(e)
+            logging.error(f"Could not open SFTP to {job['host']}: {e}")
+            return
+        try:
+            while True:
+                try:
+                    path, size, mtime, sha256 = queue.get_nowait()
+                except Empty:
+                    return
+                transferred, ok = self._pull_file(sftp, job, path, size, mtime, sha256)
+                with stats_lock:
+                    stats['bytes'] += transferred
+                    stats['files' if ok else 'failed'] += 1
+        finally:
+            sftp.close()
+
+    def _pull_file(self, sftp, job, path, size, mtime, sha256):
+        """Download with retries; returns (bytes transferred, success)."""
+        remote_file = os.path.join(job['remote_path'], path)
+        local_file = os.path.join(job['local_path'], path)
+        transferred = 0
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            start = time.perf_counter()
+            try:
+                file_bytes = self.download(sftp, remote_file, local_file, size, mtime, sha256, host=job['host'])
+            except (IOError, OSError) as e:
+                logging.warning(f"{job['host']}:{remote_file} attempt {attempt} failed: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            transferred += file_bytes
+            logging.info(f"{job['host']}:{remote_file}: {file_bytes / 1e6:.1f} MB in {elapsed:.2f} s "
+                         f"({file_bytes / 1e6 / elapsed if elapsed > 0 else 0.0:.1f} MB/s)")
+            return transferred, True
+        return transferred, False
+
+    # --------------------------------------
+    # Compressed archive streaming
+    # --------------------------------------
+
+    @staticmethod
+    def next_archive_level(level, cpu_fraction):
+        """
+        Pick the gzip level for the next batch from how busy the device's compressor was.
+
+        A compressor busy nearly all the time is what limits the transfer, so compress less;
+        one that mostly waited for the channel to drain has CPU to spare for a better ratio.
+        """
+        if cpu_fraction >= CPU_BOUND_FRACTION:
+            return max(1, level - 2)  # Cost rises steeply at high levels; back off faster
+        if cpu_fraction < NETWORK_BOUND_FRACTION:
+            return min(9, level + 1)
+        return level
+
+    @staticmethod
+    def _parse_child_cpu_seconds(stderr_text):
+        """User + system CPU of the pipeline from the shell's 'times' output (its last line)."""
+        for line in reversed(stderr_text.strip().splitlines()):
+            values = re.findall(r'(\d+)m([\d.]+)s', line)
+            if len(values) == 2:
+                return sum(int(minutes) * 60 + float(seconds) for minutes, seconds in values)
+        return None
+
+    def pull_archive(self, job, pending, stats):
+        """Stream the pending files in batches of ARCHIVE_BATCH_BYTES, re-tuning the level after each."""
+        batch, batch_bytes = [], 0
+        for path, entry in sorted(pending.items()):
+            batch.append((path,) + entry)
+            batch_bytes += entry[0]
+            if batch_bytes >= ARCHIVE_BATCH_BYTES:
+                self._pull_archive_batch(job, batch, stats)
+                batch, batch_bytes = [], 0
+        if batch:
+            self._pull_archive_batch(job, batch, stats)
+
+    def _pull_archive_batch(self, job, batch, stats):
+        level = self.archive_levels.get(job['host'], DEFAULT_ARCHIVE_LEVEL)
+        # The file list arrives on stdin; 'times' reports the pipeline's CPU use on stderr
+        command = (
+            f"cd {shlex.quote(job['remote_path'])} || exit 1; "
+            f"tar -cf - --null -T - | gzip -{level}; status=$?; times >&2; exit $status"
+        )
+        expected = {path: (size, mtime, sha256) for path, size, mtime, sha256 in batch}
+        received = set()
+        counter = _CountingReader(None, None if self.throttle is None else lambda n: self.throttle(job['host'], n))
+
+        start = time.perf_counter()
+        channel = self.ssh_sessions.open_exec_channel(job['host'], job['username'], command, job.get('password'))
+        try:
+            channel.sendall(b''.join(path.encode() + b'\0' for path in expected))
+            channel.shutdown_write()
+            counter.stream = channel.makefile('rb')
+            with tarfile.open(fileobj=counter, mode='r|gz') as archive:
+                for member in archive:
+                    entry = expected.get(member.name)
+                    if not member.isfile() or entry is None:
+                        continue  # Only files that were asked for, never paths chosen by the archive
+                    if self._extract_member(archive, member, job, entry):
+                        received.add(member.name)
+                        stats['bytes'] += member.size
+            channel.status_event.wait(10)
+            stderr_text = channel.makefile_stderr('rb').read().decode(errors='replace')
+        except (tarfile.TarError, OSError, EOFError) as e:
+            logging.error(f"Archive stream from {job['host']} failed: {e}")
+            stderr_text = ''
+        finally:
+            channel.close()
+        elapsed = time.perf_counter() - start
+
+        stats['files'] += len(received)
+        stats['failed'] += len(expected) - len(received)
+        raw_bytes = sum(expected[path][0] for path in received)
+        cpu_seconds = self._parse_child_cpu_seconds(stderr_text)
+        cpu_fraction = cpu_seconds / elapsed if cpu_seconds is not None and elapsed > 0 else None
+        if cpu_fraction is not None:
+            self.archive_levels[job['host']] = self.next_archive_level(level, cpu_fraction)
+        logging.info(
+            f"{job['host']}: archive batch of {len(received)}/{len(expected)} files at gzip -{level}, "
+            f"{raw_bytes / 1e6:.1f} MB as {counter.count / 1e6:.1f} MB "
+            f"(ratio {raw_bytes / counter.count if counter.count else 0.0:.2f}) in {elapsed:.2f} s, "
+            f"{raw_bytes / 1e6 / elapsed if elapsed > 0 else 0.0:.1f} MB/s effective, "
+            f"device compressor busy {'?' if cpu_fraction is None else f'{cpu_fraction:.0%}'}, "
+            f"next level {self.archive_levels.get(job['host'], level)}"
+        )
+
+    def _extract_member(self, archive, member, job, entry):
+        """Write one archive member through a '.part' file; returns True if it matched the manifest."""
+        local_file = os.path.join(job['local_path'], member.name)
+        with self.file_lock(local_file):
+            return self._write_member(archive, member, job, entry, local_file)
+
+    def _write_member(self, archive, member, job, entry, local_file):
+        size, mtime, sha256 = entry
+        os.makedirs(os.path.dirname(local_file), exist_ok=True)
+        part_file = self.part_path(local_file, size, mtime)
+        digest = hashlib.sha256() if sha256 else None
+        source = archive.extractfile(member)
+        with open(part_file, 'wb') as local:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                local.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+        if member.size != size or (digest is not None and digest.hexdigest() != sha256):
+            os.remove(part_file)
+            logging.warning(f"{job['host']}:{member.name} changed or was corrupted in the archive stream")
+            return False
+        os.replace(part_file, local_file)
+        os.utime(local_file, (mtime, mtime))
+        return True
+
+    def pull(self, jobs):
+        """Run all jobs on the worker pool; returns (per-job statistics, aggregate summary)."""
+        # The same folder listed twice would only be copied twice, so pull each destination once
+        unique_jobs = {}
+        for job in jobs:
+            key = (job['host'], job['remote_path'], job['local_path'])
+            if key in unique_jobs:
+                logging.warning(f"Skipping duplicate pull job {job['host']}:{job['remote_path']} -> {job['local_path']}")
+            else:
+                unique_jobs[key] = job
+        jobs = list(unique_jobs.values())
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.pull_job, jobs))
+        elapsed = time.perf_counter() - start
+
+        total_bytes = sum(r['bytes'] for r in results)
+        summary = {
+            'files': sum(r['files'] for r in results),
+            'skipped': sum(r['skipped'] for r in results),
+            'failed': sum(r['failed'] for r in results),
+            'errors': sum(1 for r in results if r['error']),
+            'bytes': total_bytes,
+            'seconds': elapsed,
+            'mb_per_s': total_bytes / 1e6 / elapsed if elapsed > 0 else 0.0,
+        }
+        for r in results:
+            rate = r['bytes'] / 1e6 / r['seconds'] if r['seconds'] > 0 else 0.0
+            logging.info(f"{r['host']}:{r['remote_path']}: {r['files']} pulled, {r['skipped']} up to date, "
+                         f"{r['failed']} failed, {r['bytes'] / 1e6:.1f} MB at {rate:.1f} MB/s")
+        logging.info(f"Pull finished: {summary['files']} files ({total_bytes / 1e6:.1f} MB) in {elapsed:.1f} s, "
+                     f"{summary['mb_per_s']:.1f} MB/s aggregate, {summary['skipped']} up to date, "
+                     f"{summary['failed']} failed, {summary['errors']} hosts with errors")
+        return results, summary
+
+
+class _CountingReader:
+    """File-like wrapper counting (and optionally budgeting) the compressed bytes read from the channel."""
+
+    def __init__(self, stream, throttle=None):
+        self.stream = stream
+        self.throttle = throttle
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        if self.throttle is not None and data:
+            self.throttle(len(data))
+        return data
@@ -0,0 +1,222 @@
+import time
+import sqlite3
+import logging
+from collections import deque
+from datetime import datetime
+
+from create_database import capture_id_for, create_tables
+
+HISTORY_SIZE = 360                # Samples of history kept per sensor (1 h at 10 s polling)
+EWMA_ALPHA = 0.1                  # Weight of the newest sample in the EWMA statistics
+WARMUP_SAMPLES = 10               # Samples before robust z-scores are trusted
+Z_THRESHOLD = 6.0                 # Robust z-score that counts as a sudden offset step
+MIN_SCALE_S = 20e-6               # Floor on the offset scale so a very quiet sensor does not alert on noise
+MAX_OFFSET_S = 1e-3               # |System time offset| above this is drift regardless of history
+MAX_ROOT_DISPERSION_S = 10e-3     # Root dispersion above this means the clock estimate is unreliable
+STALE_AFTER_S = 35                # No report for this long (3+ polls at 10 s) means the sensor is lost
+UNSYNCHRONISED_STRATUM = 16
+UNSYNCHRONISED_REFERENCE_IDS = {'00000000', '7F7F0101'}  # chrony's "no source" and local-clock references
+
+# Conversion from mean absolute deviation to standard deviation for normal data
+MEAN_ABS_DEV_TO_STD = 1.2533
+
+
+class SensorDriftState:
+    """Rolling history and streaming statistics for one sensor, updated in O(1) per sample."""
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history = deque(maxlen=history_size)  # (timestamp, offset_s, root_dispersion_s, stratum)
+        self.sample_count = 0
+        self.offset_ewma = 0.0
+        self.offset_abs_dev_ewma = 0.0
+        self.dispersion_ewma = 0.0
+        self.stratum = None
+        self.reference_id = None
+        self.last_timestamp = None
+        self.last_z = 0.0
+
+    def update(self, timestamp, offset, root_dispersion, alpha=EWMA_ALPHA):
+        """Add a sample and return its robust z-score against the statistics before it."""
+        self.history.append((timestamp, offset, root_dispersion, self.stratum))
+        if self.sample_count == 0:
+            self.offset_ewma = offset
+            self.dispersion_ewma = root_dispersion
+            z = 0.0
+        else:
+            deviation = offset - self.offset_ewma
+            scale = max(MEAN_ABS_DEV_TO_STD * self.offset_abs_dev_ewma, MIN_SCALE_S)
+            z = deviation / scale
+            self.offset_ewma += alpha * deviation
+            self.offset_abs_dev_ewma += alpha * (abs(deviation) - self.offset_abs_dev_ewma)
+            self.dispersion_ewma += alpha * (root_dispersion - self.dispersion_ewma)
+        self.sample_count += 1
+        self.last_timestamp = timestamp
+        self.last_z = z
+        return z
+
+
+class DriftMonitor:
+    """
+    Per-sensor drift and loss-of-sync detection feeding the `alerts` table.
+
+    Each sample updates the sensor's EWMA offset, EWMA absolute deviation (a robust scale that
+    one outlier cannot inflate the way a variance would) and rolling history, then checks:
+      - offset_drift:           |offset| > max_offset, or a robust z-score step after warm-up
+      - high_root_dispersion:   root dispersion > max_root_dispersion
+      - loss_of_sync:           stratum 16 or an unsynchronised reference ID
+      - stratum_change / reference_change: the sensor switched time source
+      - sensor_stale:           no report for stale_after seconds (checked by check_stale)
+    Condition alerts are raised once when they start and marked resolved when they clear;
+    change alerts are one-off. Alert rows are queued and written in one transaction by flush().
+
+    Rows belong to the capture given by capture_id, or looked up (and created if needed) in
+    data_captures by base_filename; resolving only touches that capture's alerts, since sensor
+    IDs are reused between captures. The sensor ID is stored as text in `sensor_name`;
+    `deployed_sensor_id` is only set when the ID is a key of the deployed_sensors table.
+    """
+
+    def __init__(self, db_path, capture_id=None, base_filename=None, max_offset=MAX_OFFSET_S,
+                 max_root_dispersion=MAX_ROOT_DISPERSION_S, z_threshold=Z_THRESHOLD,
+                 stale_after=STALE_AFTER_S):
+        self.db_path = db_path
+        self.max_offset = max_offset
+        self.max_root_dispersion = max_root_dispersion
+        self.z_threshold = z_threshold
+        self.stale_after = stale_after
+
+        self.sensors = {}  # {deployed_sensor_id: SensorDriftState}
+        self.active_alerts = {}  # {(deployed_sensor_id, alert_type): description}
+        self.pending_inserts = []
+        self.pending_resolves = []
+        self.sensor_keys = {}  # {deployed_sensor_id: deployed_sensors key or None}
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        create_tables(self.conn)
+        if capture_id is None and base_filename:
+            capture_id = capture_id_for(self.conn, base_filename)
+        self.capture_id = capture_id
+        logging.info(f"Drift monitor writing alerts for capture {capture_id} to {db_path}")
+
+    def update(self, deployed_sensor_id, timestamp, chrony_data):
+        """Evaluate one sample. O(1); returns the alert types raised by it."""
+        state = self.sensors.get(deployed_sensor_id)
+        if state is None:
+            state = self.sensors[deployed_sensor_id] = SensorDriftState()
+
+        offset = chrony_data['system_time_offset']
+        root_dispersion = chrony_data['root_dispersion']
+        stratum = chrony_data.get('stratum')
+        reference_id = chrony_data.get('reference_id')
+        raised = []
+
+        # Source changes are one-off events compared with the previous sample
+        if state.stratum is not None and stratum is not None and stratum != state.stratum:
+            raised += self._raise(deployed_sensor_id, 'stratum_change', timestamp,
+                                  f"Stratum changed from {state.stratum} to {stratum}", one_off=True)
+        # Compare the hex ID only: binary telemetry carries it without chrony's "(name)" suffix
+        reference_code = (reference_id or '').split(' ', 1)[0].upper()
+        if state.reference_id is not None and reference_code and reference_code != state.reference_id.split(' ', 1)[0].upper():
+            raised += self._raise(deployed_sensor_id, 'reference_change', timestamp,
+                                  f"Reference changed from {state.reference_id} to {reference_id}", one_off=True)
+        state.stratum = stratum if stratum is not None else state.stratum
+        state.reference_id = reference_id or state.reference_id
+
+        z = state.update(timestamp, offset, root_dispersion)
+
+        unsynchronised = stratum == UNSYNCHRONISED_STRATUM or reference_code in UNSYNCHRONISED_REFERENCE_IDS
+        raised += self._set_condition(deployed_sensor_id, 'loss_of_sync', unsynchronised, timestamp,
+                                      f"Sensor unsynchronised (stratum {stratum}, reference {reference_id})")
+
+        drifting = abs(offset) > self.max_offset or (
+            state.sample_count > WARMUP_SAMPLES and abs(z) > self.z_threshold
+        )
+        raised += self._set_condition(deployed_sensor_id, 'offset_drift', drifting, timestamp,
+                                      f"Offset {offset * 1000:+.3f} ms (EWMA {state.offset_ewma * 1000:+.3f} ms, z {z:+.1f})")
+
+        raised += self._set_condition(deployed_sensor_id, 'high_root_dispersion',
+                                      root_dispersion > self.max_root_dispersion, timestamp,
+                                      f"Root dispersion {root_dispersion * 1000:.3f} ms")
+
+        # A report means the sensor is no longer stale
+        raised += self._set_condition(deployed_sensor_id, 'sensor_stale', False, timestamp, '')
+        return raised
+
+    def check_stale(self, now=None):
+        """Raise sensor_stale for sensors that stopped reporting. O(n); call once per flush."""
+        now = time.time() if now is None else now
+        raised = []
+        for deployed_sensor_id, state in self.sensors.items():
+            age = now - state.last_timestamp
+            if age > self.stale_after:
+                raised += self._set_condition(deployed_sensor_id, 'sensor_stale', True, now,
+                                              f"No time sync report for {age:.0f} s")
+        return raised
+
+    def _set_condition(self, deployed_sensor_id, alert_type, active, timestamp, description):
+        key = (deployed_sensor_id, alert_type)
+        if active and key not in self.active_alerts:
+            return self._raise(deployed_sensor_id, alert_type, timestamp, description)
+        if not active and key in self.active_alerts:
+            del self.active_alerts[key]
+            self.pending_resolves.append((str(deployed_sensor_id), alert_type, self.capture_id))
+            logging.info(f"Alert resolved for {deployed_sensor_id}: {alert_type}")
+        return []
+
+    def _raise(self, deployed_sensor_id, alert_type, timestamp, description, one_off=False):
+        if not one_off:
+            self.active_alerts[(deployed_sensor_id, alert_type)] = description
+        self.pending_inserts.append((
+            self._sensor_key(deployed_sensor_id), str(deployed_sensor_id), self.capture_id,
+            datetime.fromtimestamp(timestamp).isoformat(), alert_type, description, one_off
+        ))
+        logging.warning(f"Alert for {deployed_sensor_id}: {alert_type} - {description}")
+        return [alert_type]
+
+    def _sensor_key(self, deployed_sensor_id):
+        """deployed_sensors key for a sensor ID, or None for IDs such as 'CAM1' that are not one."""
+        if deployed_sensor_id not in self.sensor_keys:
+            key = None
+            try:
+                row = self.conn.execute("SELECT deployed_sensor_id FROM deployed_sensors WHERE deployed_sensor_id = ?",
+                                        (int(deployed_sensor_id),)).fetchone()
+                key = row[0] if row else None
+            except (TypeError, ValueError):
+                pass
+            self.sensor_keys[deployed_sensor_id] = key
+        return self.sensor_keys[deployed_sensor_id]
+
+    def alerts_for(self, deployed_sensor_id):
+        """Active alert types of one sensor."""
+        return [alert_type for (sensor_id, alert_type) in self.active_alerts if sensor_id == deployed_sensor_id]
+
+    def history(self, deployed_sensor_id):
+        """Rolling (timestamp, offset_s, root_dispersion_s, stratum) history of one sensor, oldest first."""
+        state = self.sensors.get(deployed_sensor_id)
+        return list(state.history) if state else []
+
+    def flush(self):
+        """Write queued alert inserts and resolutions in one transaction."""
+        if not self.pending_inserts and not self.pending_resolves:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO alerts (deployed_sensor_id, sensor_name, capture_id, timestamp, alert_type, "
+                    "description, resolved) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self.pending_inserts
+                )
+                self.conn.executemany(
+                    "UPDATE alerts SET resolved = 1 "
+                    "WHERE sensor_name = ? AND alert_type = ? AND capture_id IS ? AND resolved = 0",
+                    self.pending_resolves
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Error writing alerts to {self.db_path}: {e}")
+            return
+        self.pending_inserts = []
+        self.pending_resolves = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
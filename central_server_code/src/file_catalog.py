@@ -0,0 +1,251 @@
+# file_catalog.py
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import logging
+import zipfile
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from create_database import DEFAULT_DB_PATH, capture_id_for, create_tables
+
+# Add the ZED analysis scripts to sys.path to reuse their streaming JSON parser
+current_dir = os.path.dirname(os.path.abspath(__file__))
+zed_analysis_dir = os.path.abspath(os.path.join(current_dir, '..', '..', 'ZED2i_code', 'zed_data_analysis_python'))
+sys.path.append(zed_analysis_dir)
+from body_json_stream2csv import iter_json_frames
+
+BATCH_SIZE = 500  # Catalog rows written per transaction
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# <base_filename>_<YYYYmmdd_HHMMSS[fff]>_<duration><ms|s>.<ext>, as written by the collectors
+SEGMENT_PATTERN = re.compile(
+    r'^(?P<base>.+)_(?P<stamp>\d{8}_\d{6}(?:\d{3})?)_(?P<duration>\d+)(?P<unit>ms|s)\.(?P<ext>npz|avi|json)$'
+)
+SENSOR_TYPES = {'npz': 'radar', 'avi': 'camera', 'json': 'body_tracking'}
+
+FILE_COLUMNS = ['path', 'filename', 'filetype', 'filesize', 'duration', 'created_at', 'capture_id',
+                'deployed_sensor_id', 'sensor_type', 'start_time', 'end_time', 'frame_count', 'checksum']
+
+
+def parse_segment_name(filename):
+    """(sensor_type, start time, duration s) from a segment filename, or None for other files."""
+    match = SEGMENT_PATTERN.match(filename)
+    if match is None:
+        return None
+    if match['ext'] == 'json' and match['unit'] == 'ms':
+        return None  # Camera sidecar; catalogued with its video
+    stamp = match['stamp']
+    start = datetime.strptime(stamp, '%Y%m%d_%H%M%S%f' if len(stamp) > 15 else '%Y%m%d_%H%M%S').timestamp()
+    duration = int(match['duration']) / (1000.0 if match['unit'] == 'ms' else 1.0)
+    return SENSOR_TYPES[match['ext']], start, duration
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def radar_frame_count(path):
+    """Frames in a radar .npz, read from the array header without loading (or unpickling) the data."""
+    with zipfile.ZipFile(path) as archive, archive.open('frame_timestamps_list.npy') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, _ = np.lib.format.read_array_header_2_0(f)
+    return shape[0]
+
+
+def body_frame_times(path):
+    """Frame times (epoch seconds, file order) of a ZED body JSON, streamed one frame at a time."""
+    return np.array([timestamp_ms / 1000.0 for timestamp_ms, _ in iter_json_frames(path)])
+
+
+def describe_segment(path):
+    """
+    Catalog fields of one segment file: sensor_type, start_time, end_time, frame_count and,
+    for camera video, the deployed_sensor_id from its sidecar. None if it is not a segment.
+
+    Times are epoch seconds. Radar times come from the filename (millisecond resolution);
+    camera times from the sidecar's frame timestamps and ZED times from the body frame keys,
+    falling back to the filename if those cannot be read.
+    """
+    parsed = parse_segment_name(os.path.basename(path))
+    if parsed is None:
+        return None
+    sensor_type, start, duration = parsed
+    segment = {'sensor_type': sensor_type, 'start_time': start, 'end_time': start + duration,
+               'frame_count': None, 'deployed_sensor_id': None}
+    try:
+        if sensor_type == 'radar':
+            segment['frame_count'] = radar_frame_count(path)
+        elif sensor_type == 'camera':
+            sidecar = os.path.splitext(path)[0] + '.json'
+            if os.path.exists(sidecar):
+                with open(sidecar) as f:
+                    metadata = json.load(f)
+                frame_timestamps = metadata.get('frame_timestamps') or []
+                segment['frame_count'] = len(frame_timestamps)
+                segment['deployed_sensor_id'] = metadata.get('deployed_sensor_id')
+                if frame_timestamps:
+                    segment['start_time'] = metadata.get('batch_start_time', frame_timestamps[0])
+                    segment['end_time'] = frame_timestamps[-1] + 1.0 / metadata.get('nominal_fps', 30)
+        else:
+            # A long ZED segment is hundreds of MB of JSON; stream it rather than load it whole
+            frame_times = body_frame_times(path)
+            segment['frame_count'] = len(frame_times)
+            if len(frame_times):
+                segment['start_time'] = float(frame_times.min())
+                segment['end_time'] = float(frame_times.max())
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        logging.warning(f"Could not read {path}; using the times in its name: {e}")
+    return segment
+
+
+class FileCatalog:
+    """
+    Ingest of pulled capture segments into the Lab in a Box `files` table.
+
+    Each segment gets one row with its capture, sensor, start and end time, frame count, size
+    and SHA-256. Rows are written in batches of batch_size per transaction on a WAL database,
+    and files whose size and mtime match their row are skipped, so re-running an ingest after
+    a later pull only reads the new files. The (deployed_sensor_id, start_time) and capture_id
+    indexes created by create_database.create_tables serve the time-window queries.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, batch_size=BATCH_SIZE):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        create_tables(self.conn)
+
+    def capture_id(self, base_filename):
+        """capture_id of the capture recorded under base_filename, created if it is new."""
+        return capture_id_for(self.conn, base_filename)
+
+    def ingest(self, base_filename, files):
+        """
+        Catalog files, an iterable of (local path, deployed_sensor_id, sensor_type), under one capture.
+
+        deployed_sensor_id and sensor_type may be None; they are then taken from the segment
+        itself where possible. Returns {'added', 'unchanged', 'skipped'} counts.
+        """
+        capture_id = self.capture_id(base_filename)
+        known = {path: (size, created_at) for path, size, created_at in self.conn.execute(
+            "SELECT path, filesize, created_at FROM files WHERE capture_id = ?", (capture_id,))}
+        counts = {'added': 0, 'unchanged': 0, 'skipped': 0}
+        batch = []
+        for local_file, deployed_sensor_id, sensor_type in files:
+            path = os.path.abspath(local_file)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                counts['skipped'] += 1
+                continue
+            if known.get(path) == (stat.st_size, stat.st_mtime):
+                counts['unchanged'] += 1
+                continue
+            segment = describe_segment(path)
+            if segment is None:
+                counts['skipped'] += 1
+                continue
+            batch.append((
+                path, os.path.basename(path), os.path.splitext(path)[1].lstrip('.'), stat.st_size,
+                segment['end_time'] - segment['start_time'], stat.st_mtime, capture_id,
+                deployed_sensor_id if deployed_sensor_id is not None else segment['deployed_sensor_id'],
+                sensor_type or segment['sensor_type'], segment['start_time'], segment['end_time'],
+                segment['frame_count'], sha256_file(path),
+            ))
+            if len(batch) >= self.batch_size:
+                counts['added'] += self._write(batch)
+                batch = []
+        counts['added'] += self._write(batch)
+        self._update_capture_times(capture_id)
+        logging.info(f"Catalogued {base_filename}: {counts['added']} added, {counts['unchanged']} unchanged, "
+                     f"{counts['skipped']} skipped")
+        return counts
+
+    def ingest_folder(self, folder, base_filename, deployed_sensor_id=None, sensor_type=None):
+        """Catalog every segment under folder (e.g. a pulled_data/<base_filename> folder)."""
+        files = (
+            (os.path.join(directory, name), deployed_sensor_id, sensor_type)
+            for directory, _, names in os.walk(folder) for name in sorted(names) if not name.startswith('.')
+        )
+        return self.ingest(base_filename, files)
+
+    def _write(self, batch):
+        """Insert or refresh one batch of rows in a single transaction."""
+        if not batch:
+            return 0
+        updates = ', '.join(f"{column} = excluded.{column}" for column in FILE_COLUMNS[1:])
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT INTO files ({', '.join(FILE_COLUMNS)}) VALUES ({', '.join('?' * len(FILE_COLUMNS))}) "
+                    f"ON CONFLICT(path) DO UPDATE SET {updates}",
+                    batch
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Error writing {len(batch)} catalog rows to {self.db_path}: {e}")
+            return 0
+        return len(batch)
+
+    def _update_capture_times(self, capture_id):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE data_captures SET "
+                "start_time = (SELECT MIN(start_time) FROM files WHERE capture_id = ?), "
+                "end_time = (SELECT MAX(end_time) FROM files WHERE capture_id = ?) "
+                "WHERE capture_id = ?",
+                (capture_id, capture_id, capture_id)
+            )
+
+    def segments(self, start, end, deployed_sensor_id=None, capture_id=None):
+        """Rows (path, deployed_sensor_id, sensor_type, start_time, end_time, frame_count) starting in [start, end)."""
+        query = ("SELECT path, deployed_sensor_id, sensor_type, start_time, end_time, frame_count FROM files "
+                 "WHERE start_time >= ? AND start_time < ?")
+        params = [start, end]
+        if deployed_sensor_id is not None:
+            query += " AND deployed_sensor_id = ?"
+            params.append(deployed_sensor_id)
+        if capture_id is not None:
+            query += " AND capture_id = ?"
+            params.append(capture_id)
+        return self.conn.execute(query + " ORDER BY start_time", params).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog pulled capture segments in the Lab in a Box database")
+    parser.add_argument("folder", type=str, help="Folder of pulled segments, e.g. pulled_data/<base_filename>")
+    parser.add_argument("--base_filename", type=str, default=None, help="Capture name (default: the folder name)")
+    parser.add_argument("--deployed_sensor_id", type=str, default=None, help="Sensor that recorded the files, if they came from one device")
+    parser.add_argument("--sensor_type", type=str, default=None, help="radar, camera or body_tracking (default: from the file extension)")
+    parser.add_argument("--db_path", type=str, default=DEFAULT_DB_PATH, help="Path of the SQLite database file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    catalog = FileCatalog(args.db_path)
+    base_filename = args.base_filename or os.path.basename(os.path.normpath(args.folder))
+    counts = catalog.ingest_folder(args.folder, base_filename, args.deployed_sensor_id, args.sensor_type)
+    catalog.close()
+    print(f"{base_filename}: {counts['added']} segments added, {counts['unchanged']} unchanged, "
+          f"{counts['skipped']} other files skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,31 @@
 import tkinter as tk
 from tkinter import messagebox
 import os
+import sys
 import subprocess
-import paramiko
 import socket
 import signal
 import threading
 import logging
 import time
 from datetime import datetime
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd
 import requests
+import json
+from io import BytesIO
+from PIL import Image, ImageTk
 from auto_data_collector import AutoDataCollector
+from ssh_session_manager import SSHSessionManager
+from preview_server import PreviewServer
+from live_plot import LiveSyncPlot
+from trickle_pull_scheduler import TricklePullScheduler
+
+# Add the repository root to sys.path to import shared modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..', '..'))
+sys.path.append(parent_dir)
+from shared_sensor_code.start_sync import READY_MESSAGE, START_COMMAND, ABORT_COMMAND
 
 CENTRAL_SERVER_USERNAME = os.getlogin()
 
@@ -24,6 +36,15 @@ class LabInABoxControlPanel:
     SYNC_METRICS_DIR = os.path.join(LABX_HOME, "central_server_code", "data", "sync_metrics")
     CENTRAL_SERVER_SCRIPT = os.path.join(LABX_HOME, "central_server_code", "src", "central_server_v3.py")
     PORT = 5000
+    PREVIEW_PORT = 5001
+    PREVIEW_WIDTH = 240
+    PLOT_WINDOW = 50  # Most recent fleet metrics rows shown in the live plot
+    SENSOR_PLOT_WINDOW = 360  # Most recent reports per sensor in the per-sensor plots (1 h at 10 s)
+    ARM_TIMEOUT = 120  # Seconds to wait for collectors to open their devices (ZED loads its models)
+    START_LEAD_S = 1.0  # Seconds between sending START and the shared start time
+    COMPLETION_GRACE_S = 10  # Seconds after the capture for collectors to write their last segment
+    # Collectors' Prometheus endpoints, watched by the trickle pull; one port per type so two sensors can share a device
+    COLLECTOR_METRICS_PORTS = {"camera": 9200, "body_tracking": 9201, "radar": 9202}
     SENSOR_TYPES = ["camera", "body_tracking", "radar"]
 
 
@@ -56,8 +77,8 @@ class LabInABoxControlPanel:
         # Configurations list for multiple RPis
         self.configurations = []
 
-        self.max_offset_data = []
-        self.timestamps = []
+        self.pending_fleet_points = []  # (timestamp, max offset ms) received but not yet plotted
+        self.plot_reset = False
         self.plot_running = False
 
                 # Initialize sensor ID counters for consistency
@@ -72,7 +93,27 @@ class LabInABoxControlPanel:
         self.setup_gui_with_plot()
 
         self.central_server_process = None
-        self.current_csv_file = None  # To track the latest CSV file
+        self.capture_thread = None
+        self.trickle_pull_enabled = False
+        # One SSH transport per device, reused for every capture and data pull
+        self.ssh_sessions = SSHSessionManager(key_filename=f"/home/{CENTRAL_SERVER_USERNAME}/.ssh/id_rsa")
+        self.metrics_url = None  # Central server /metrics endpoint for the current capture
+        self.last_metrics_id = 0  # Cursor of the last fleet metrics row received
+        self.sensor_status = {}  # Latest per-sensor status pushed by the central server
+        self.metrics_lock = threading.Lock()
+        self.metrics_updated = False
+        self.metrics_stream_thread = None
+
+        # Live camera previews pushed by the camera collectors
+        self.preview_server = PreviewServer(port=self.PREVIEW_PORT)
+        try:
+            self.preview_server.start()
+        except OSError as e:
+            logging.error(f"Could not start preview server on port {self.PREVIEW_PORT}: {e}")
+        self.preview_labels = {}
+        self.preview_images = {}  # Keep PhotoImage references alive
+        self.preview_timestamps = {}
+        self.root.after(1000, self.update_previews)
 
         # Set up signal handlers
         signal.signal(signal.SIGINT, self.handle_exit_signal)
@@ -122,19 +163,20 @@ class LabInABoxControlPanel:
         # Add live plot to the GUI
         tk.Label(self.root, text="Live Plot:").grid(row=9, column=0, columnspan=4, pady=5)
 
-        self.fig, self.ax = plt.subplots(figsize=(6, 4))  # Increased figsize for better visibility
-        self.ax.set_title("Live Max Offset", fontsize=12)
-        self.ax.set_xlabel("Time (s)", fontsize=10)
-        self.ax.set_ylabel("Max Offset (ms)", fontsize=10)
-        self.line, = self.ax.plot([], [], label="Max Offset (ms)", lw=2)
-        self.ax.legend(fontsize=8)
-        
+        self.fig = Figure(figsize=(6, 6))
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
+        self.live_plot = LiveSyncPlot(self.fig, self.canvas, self.PLOT_WINDOW, self.SENSOR_PLOT_WINDOW)
+
         # Adjust layout to ensure labels are not clipped
-        self.fig.tight_layout(pad=3.0)
+        self.fig.tight_layout(pad=2.0)
 
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
         self.canvas_widget = self.canvas.get_tk_widget()
         self.canvas_widget.grid(row=10, column=0, columnspan=4, pady=10)
+        self.canvas.draw()
+
+        # Per-sensor sync status pushed by the central server
+        self.sensor_status_label = tk.Label(self.root, text="", justify="left", font=("Courier", 9))
+        self.sensor_status_label.grid(row=11, column=0, columnspan=4, pady=5)
 
         # Device List
         tk.Label(self.root, text="Configured Devices:").grid(row=5, column=0, columnspan=4, pady=5)
@@ -161,10 +203,23 @@ class LabInABoxControlPanel:
         start_all_button = tk.Button(self.root, text="Start All Captures", command=self.start_all_captures)
         start_all_button.grid(row=8, column=0, columnspan=4, pady=10)
 
+        # Pull finished segments in the background while the capture runs
+        self.trickle_pull_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.root, text="Pull during capture", variable=self.trickle_pull_var).grid(row=8, column=4, padx=5)
+
         # NEW: "Collect Data" Button
         collect_data_button = tk.Button(self.root, text="Pull Collected Data", command=self.pull_collected_data)
         collect_data_button.grid(row=9, column=0, columnspan=4, pady=10)
 
+        # Also export the sync metrics to CSV when the central server stops
+        self.export_csv_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(self.root, text="Export sync CSV", variable=self.export_csv_var).grid(row=9, column=4, padx=5)
+
+        # Live camera previews
+        tk.Label(self.root, text="Camera Previews:").grid(row=0, column=5, padx=10, pady=5)
+        self.preview_frame = tk.Frame(self.root)
+        self.preview_frame.grid(row=1, column=5, rowspan=10, padx=10, pady=5, sticky="n")
+
 
     def run(self):
         self.root.mainloop()
@@ -198,6 +253,8 @@ class LabInABoxControlPanel:
 
     def handle_exit_signal(self, signum, frame):
         logging.info("Termination signal received. Closing GUI...")
+        self.preview_server.stop()
+        self.ssh_sessions.close_all()
         self.root.quit()
         self.root.destroy()
 
@@ -221,6 +278,10 @@ class LabInABoxControlPanel:
         # Flash the status indicator
         self.flash_status_indicator("green" if is_reachable else "red")
 
+        # Authenticate now so starting a capture only has to open a channel
+        if is_reachable:
+            self.ssh_sessions.warm_up(ip_address, username)
+
         # Assign a unique deployed_sensor_id
         deployed_sensor_id = self.generate_deployed_sensor_id(sensor_type)
 
@@ -312,7 +373,7 @@ class LabInABoxControlPanel:
             tk.messagebox.showinfo("Cancelled", "Data collection cancelled.")
             return
 
-        collector = AutoDataCollector()
+        collector = AutoDataCollector(ssh_sessions=self.ssh_sessions)
         collector.pull_previous_data(self.configurations, folder_name=folder_name)
         tk.messagebox.showinfo("Collection Complete", f"Pulled data from '{folder_name}' on all devices.")
 
@@ -333,7 +394,7 @@ class LabInABoxControlPanel:
             logging.info("Starting the central server.")
 
             # Pass filename and duration as arguments
-            subprocess.Popen([
+            command = [
                 "python3", self.CENTRAL_SERVER_SCRIPT,
                 "--base_filename", base_filename,
                 "--duration", str(duration),
@@ -341,9 +402,13 @@ class LabInABoxControlPanel:
                 "--ip_address", central_server_ip_address,
                 "--port", str(self.PORT),
                 "--sync_metrics_dir", self.SYNC_METRICS_DIR
-            ])
+            ]
+            if self.export_csv_var.get():
+                command.append("--export_csv")
+            subprocess.Popen(command)
             logging.info(f"Central server launched at http://{central_server_ip_address}:{self.PORT}/receive_data")
             self.central_server_url = f"http://{central_server_ip_address}:{self.PORT}/receive_data"  # Store the URL for live data fetching
+            self.reset_metrics(f"http://{central_server_ip_address}:{self.PORT}/metrics")
             logging.info(f"Central server URL launched successfully at {self.central_server_url}.")
             time.sleep(0.5)  # Allow time for server initialization
             return True
@@ -414,32 +479,30 @@ class LabInABoxControlPanel:
             self.update_recording_status("gray")  # Revert to gray if server fails
             return  # Exit if the server fails to start
 
-        threads = []
-
-        # Create and start a thread for each device
-        for config in self.configurations:
-            thread = threading.Thread(
-                target=self.start_remote_capture,
-                args=(
-                    config["ip_address"],
-                    config["username"],
-                    config["sensor_type"],
-                    config["deployed_sensor_id"],  # Use consistent naming
-                    base_filename,
-                    int(capture_duration)
-                ),
-                daemon=True
-            )
-            threads.append(thread)
-            thread.start()
+        # Tk variables must be read on the GUI thread
+        self.trickle_pull_enabled = self.trickle_pull_var.get()
+
+        # Arm every device, then start them together on one timestamp (see run_synchronized_capture)
+        self.capture_thread = threading.Thread(
+            target=self.run_synchronized_capture,
+            args=(base_filename, int(capture_duration)),
+            daemon=True
+        )
+        self.capture_thread.start()
 
         # Start live plotting in a separate thread
         if not self.plot_running:
             self.plot_running = True
             threading.Thread(target=self.start_plot, daemon=True).start()
 
-        # Use after() to schedule completion handling instead of thread.join()
-        self.root.after(int(capture_duration) * 1000, self.complete_all_captures)
+        # Poll from the Tk loop instead of joining, so the GUI stays responsive
+        self.root.after(1000, self.check_captures_complete)
+
+    def check_captures_complete(self):
+        if self.capture_thread is not None and self.capture_thread.is_alive():
+            self.root.after(500, self.check_captures_complete)
+            return
+        self.complete_all_captures()
 
     def complete_all_captures(self):
         """Handle the completion of all captures and stop live plotting."""
@@ -449,73 +512,151 @@ class LabInABoxControlPanel:
         # Show capture completed popup
         messagebox.showinfo("Capture Completed", "All captures have finished.")
 
-    def start_remote_capture(self, ip_address, username, sensor_type, deployed_sensor_id, base_filename, capture_duration):
-        """Execute the remote capture command on a remote device."""
-        logging.info(f"Starting remote capture for IP: {ip_address}, Username: {username}, "
-                     f"Sensor Type: {sensor_type}, Sensor ID: {deployed_sensor_id}")
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        private_key_path = f"/home/{CENTRAL_SERVER_USERNAME}/.ssh/id_rsa"
+    def build_capture_command(self, username, sensor_type, deployed_sensor_id, base_filename, capture_duration,
+                              metrics_port=None):
+        """Collector command line for one device, started armed (--wait_for_start); None for unknown sensor types."""
+        # Map sensor type to the correct command, including deployed_sensor_id
+        if sensor_type == "camera":
+            command = (
+                f"/home/{username}/labx_master/camera_code/labx_env/bin/python "
+                f"/home/{username}/labx_master/camera_code/src/CameraDataCollector.py "
+                f"--base_filename {base_filename} --capture_duration {capture_duration} "
+                f"--central_server_url {self.central_server_url} "
+                f"--deployed_sensor_id {deployed_sensor_id} "
+                f"--preview_server {self.get_lan_ip()}:{self.PREVIEW_PORT}"
+            )
+        elif sensor_type == "radar":
+            command = (
+                f"/home/{username}/labx_master/radar_code/labx_env/bin/python "
+                f"/home/{username}/labx_master/radar_code/src/RadarDataCollector.py "
+                f"--base_filename {base_filename} --capture_duration {capture_duration} "
+                f"--central_server_url {self.central_server_url} "
+                f"--deployed_sensor_id {deployed_sensor_id}"
+            )
+        elif sensor_type == "body_tracking":
+            command = (
+                f"/home/{username}/labx_master/ZED2i_code/labx_env/bin/python "
+                f"/home/{username}/labx_master/ZED2i_code/src/ZED2iDataCollector.py "
+                f"--base_filename {base_filename} --capture_duration {capture_duration} "
+                f"--central_server_url {self.central_server_url} "
+                f"--deployed_sensor_id {deployed_sensor_id}"
+            )
+        else:
+            return None
+        if metrics_port:
+            command += f" --metrics_port {metrics_port}"
+        return command + " --wait_for_start"
+
+    def arm_remote_capture(self, config, base_filename, capture_duration):
+        """Launch one collector armed; returns (RemoteCommand, ready event) or None if it could not start."""
+        ip_address = config["ip_address"]
+        logging.info(f"Arming remote capture for IP: {ip_address}, Username: {config['username']}, "
+                     f"Sensor Type: {config['sensor_type']}, Sensor ID: {config['deployed_sensor_id']}")
+        command = self.build_capture_command(config["username"], config["sensor_type"], config["deployed_sensor_id"],
+                                             base_filename, capture_duration,
+                                             self.COLLECTOR_METRICS_PORTS.get(config["sensor_type"])
+                                             if self.trickle_pull_enabled else None)
+        if command is None:
+            logging.error(f"Unsupported sensor type: {config['sensor_type']}")
+            return None
 
-        try:
-            private_key = paramiko.RSAKey.from_private_key_file(private_key_path)
-            ssh.connect(ip_address, username=username, pkey=private_key)
-
-            # Map sensor type to the correct command, including deployed_sensor_id
-            if sensor_type == "camera":
-                command = (
-                    f"/home/{username}/labx_master/camera_code/labx_env/bin/python "
-                    f"/home/{username}/labx_master/camera_code/src/CameraDataCollector.py "
-                    f"--base_filename {base_filename} --capture_duration {capture_duration} "
-                    f"--central_server_url {self.central_server_url} "
-                    f"--deployed_sensor_id {deployed_sensor_id}"
-                )
-            elif sensor_type == "radar":
-                command = (
-                    f"/home/{username}/labx_master/radar_code/labx_env/bin/python "
-                    f"/home/{username}/labx_master/radar_code/src/RadarDataCollector.py "
-                    f"--base_filename {base_filename} --capture_duration {capture_duration} "
-                    f"--central_server_url {self.central_server_url} "
-                    f"--deployed_sensor_id {deployed_sensor_id}"
-                )
-            elif sensor_type == "body_tracking":
-                command = (
-                    f"/home/{username}/labx_master/ZED2i_code/labx_env/bin/python "
-                    f"/home/{username}/labx_master/ZED2i_code/src/ZED2iDataCollector.py "
-                    f"--base_filename {base_filename} --capture_duration {capture_duration} "
-                    f"--central_server_url {self.central_server_url} "
-                    f"--deployed_sensor_id {deployed_sensor_id}"
-                )
-            else:
-                logging.error(f"Unsupported sensor type: {sensor_type}")
-                return
+        ready_event = threading.Event()
 
-            logging.info(f"Executing command on {ip_address}: {command}")
+        def on_stdout(line):
+            if line.strip() == READY_MESSAGE:
+                ready_event.set()
+            logging.info(f"STDOUT ({ip_address}): {line.strip()}")
 
-            # Start the command and handle timeout manually
-            stdin, stdout, stderr = ssh.exec_command(command)
-            start_time = time.time()
-
-            while True:
-                if stdout.channel.exit_status_ready():  # Check if command is done
-                    break
-                if time.time() - start_time > capture_duration + 2:  # Timeout logic
-                    logging.error(f"Command timed out on {ip_address}.")
-                    ssh.close()
-                    return
-                time.sleep(0.1)  # Avoid busy waiting
-
-            # Log stdout and stderr
-            for line in iter(stdout.readline, ""):
-                logging.info(f"STDOUT: {line.strip()}")
-            for line in iter(stderr.readline, ""):
-                logging.error(f"STDERR: {line.strip()}")
-
-            logging.info(f"Capture completed on {ip_address} for {sensor_type} with Sensor ID: {deployed_sensor_id}")
+        try:
+            logging.info(f"Executing command on {ip_address}: {command}")
+            remote = self.ssh_sessions.exec_command(
+                ip_address, config["username"], command, on_stdout=on_stdout,
+                on_stderr=lambda line: logging.error(f"STDERR ({ip_address}): {line.strip()}")
+            )
         except Exception as e:
             logging.error(f"Connection Error: Could not connect to {ip_address}: {e}")
+            return None
+        return remote, ready_event
+
+    def run_synchronized_capture(self, base_filename, capture_duration):
+        """
+        Two-phase start across all devices.
+
+        Arm: every collector is launched in parallel with --wait_for_start, opens its device and
+        prints READY. Commit: once all are ready (or ARM_TIMEOUT passes), one start timestamp
+        START_LEAD_S in the future is sent to every ready collector, which sleeps until it.
+        SSH handshakes, interpreter startup and SDK loading therefore no longer skew the start.
+        """
+        armed = []  # [(config, RemoteCommand, ready event)]
+        armed_lock = threading.Lock()
+
+        def arm(config):
+            result = self.arm_remote_capture(config, base_filename, capture_duration)
+            if result is not None:
+                with armed_lock:
+                    armed.append((config,) + result)
+
+        arm_threads = [threading.Thread(target=arm, args=(config,), daemon=True) for config in self.configurations]
+        for thread in arm_threads:
+            thread.start()
+        for thread in arm_threads:
+            thread.join()
+
+        arm_deadline = time.time() + self.ARM_TIMEOUT
+        ready = []
+        for config, remote, ready_event in armed:
+            # Stop waiting early if the collector exits instead of arming
+            while not ready_event.wait(0.5) and not remote.done and time.time() < arm_deadline:
+                pass
+            if ready_event.is_set():
+                ready.append((config, remote))
+            else:
+                logging.error(f"{config['deployed_sensor_id']} at {config['ip_address']} did not arm; leaving it out.")
+                try:
+                    remote.send_line(ABORT_COMMAND)
+                except Exception:
+                    pass
+                remote.cancel()
+        if not ready:
+            logging.error("No device armed, capture not started.")
+            return
+
+        start_timestamp = time.time() + self.START_LEAD_S
+        for config, remote in ready:
+            remote.send_line(f"{START_COMMAND} {start_timestamp:.6f}")
+        logging.info(f"Start {start_timestamp:.6f} sent to {len(ready)} of {len(self.configurations)} devices "
+                     f"({datetime.fromtimestamp(start_timestamp)}).")
+
+        trickle_puller = None
+        if self.trickle_pull_enabled:
+            jobs = AutoDataCollector(ssh_sessions=self.ssh_sessions).build_jobs([config for config, _ in ready], base_filename)
+            trickle_puller = TricklePullScheduler(self.ssh_sessions, jobs, status_provider=self.trickle_sync_status,
+                                                  metrics_ports=self.COLLECTOR_METRICS_PORTS)
+            trickle_puller.start()
+
+        # Collectors write their last segment after the capture duration
+        end_deadline = start_timestamp + capture_duration + self.COMPLETION_GRACE_S
+        try:
+            for config, remote in ready:
+                if remote.wait(timeout=max(0.0, end_deadline - time.time())):
+                    logging.info(f"Capture completed on {config['ip_address']} for {config['sensor_type']} with Sensor ID: "
+                                 f"{config['deployed_sensor_id']} (exit status {remote.exit_status})")
+                else:
+                    logging.error(f"Command timed out on {config['ip_address']}.")
+                    remote.cancel()
         finally:
-            ssh.close()
+            # The final 'Pull Collected Data' skips whatever was trickled already
+            if trickle_puller is not None:
+                trickle_puller.stop()
+
+    def trickle_sync_status(self):
+        """Latest time sync status per device IP, for the trickle pull's backoff."""
+        with self.metrics_lock:
+            sensor_status = dict(self.sensor_status)
+        return {
+            config['ip_address']: sensor_status[config['deployed_sensor_id']]
+            for config in self.configurations if config['deployed_sensor_id'] in sensor_status
+        }
 
 
     # --------------------------------------
@@ -525,34 +666,86 @@ class LabInABoxControlPanel:
     def start_plot(self):
         """Launch the live plot within the GUI."""
         self.plot_running = True
+        if self.metrics_stream_thread is None or not self.metrics_stream_thread.is_alive():
+            self.metrics_stream_thread = threading.Thread(target=self.consume_metrics_stream, daemon=True)
+            self.metrics_stream_thread.start()
         self.update_plot()  # Start the update loop
 
-    def update_plot(self):
-        """Update the live plot with data from the latest CSV file."""
-
-        self.current_csv_file = self.get_latest_csv_file()
-        if not self.current_csv_file:
-            self.root.after(1000, self.update_plot)  # Retry after 1 second
-            return
+    def reset_metrics(self, metrics_url):
+        """Point the plot at a newly started central server and drop the previous capture's data."""
+        with self.metrics_lock:
+            self.metrics_url = metrics_url
+            self.last_metrics_id = 0
+            self.pending_fleet_points = []
+            self.plot_reset = True
+            self.sensor_status = {}
+            self.metrics_updated = True
+
+    def apply_metrics_delta(self, delta, metrics_url):
+        """Append the fleet rows and sensor status from one /metrics response or stream event."""
+        with self.metrics_lock:
+            if metrics_url != self.metrics_url:
+                return  # Stale event from the previous capture's server
+            fields = delta['fields']
+            time_idx, offset_idx = fields.index('timestamp'), fields.index('max_offset_ms')
+            self.pending_fleet_points.extend((point[time_idx], point[offset_idx]) for point in delta['points'])
+            self.last_metrics_id = delta['cursor']
+            self.sensor_status = delta['sensors']
+            self.metrics_updated = True
+
+    def consume_metrics_stream(self):
+        """Follow the central server's /metrics/stream (server-sent events), reconnecting from the last cursor."""
+        while self.plot_running:
+            metrics_url = self.metrics_url
+            if not metrics_url:
+                time.sleep(1)
+                continue
+            try:
+                with requests.get(
+                    f"{metrics_url}/stream",
+                    params={'since': self.last_metrics_id, 'limit': self.PLOT_WINDOW},
+                    stream=True, timeout=(2, 30)
+                ) as response:
+                    response.raise_for_status()
+                    data_lines = []
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not self.plot_running or metrics_url != self.metrics_url:
+                            break
+                        if line.startswith('data:'):
+                            data_lines.append(line[5:].strip())
+                        elif not line and data_lines:
+                            self.apply_metrics_delta(json.loads(''.join(data_lines)), metrics_url)
+                            data_lines = []
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logging.warning(f"Metrics stream from {metrics_url} interrupted: {e}")
+                time.sleep(1)
 
+    def update_plot(self):
+        """Append the rows the metrics stream delivered since the last tick and blit the live plot."""
         try:
-            # Load the latest data from the CSV file
-            data = pd.read_csv(self.current_csv_file).tail(50)
-            if not data.empty:
-                # Process data for plotting
-                relative_times = (data['timestamp'] - data['timestamp'].iloc[0])  # Assuming timestamp in s
-                offsets = data['max_offset_ms']
-
-                # Update the plot
-                self.ax.clear()  # Clear the previous plot
-                self.ax.set_title("Live Max Offset")
-                self.ax.set_xlabel("Time (s)")
-                self.ax.set_ylabel("Max Offset (ms)")
-                self.ax.plot(relative_times, offsets, label="Max Offset (ms)")
-                self.ax.legend()
-
-                # Redraw the canvas
-                self.canvas.draw()
+            with self.metrics_lock:
+                updated = self.metrics_updated
+                self.metrics_updated = False
+                reset = self.plot_reset
+                self.plot_reset = False
+                fleet_points = self.pending_fleet_points
+                self.pending_fleet_points = []
+                sensor_status = dict(self.sensor_status)
+
+            if reset:
+                self.live_plot.reset()
+            if updated:
+                self.live_plot.add_fleet_points(fleet_points)
+                self.live_plot.add_sensor_status(sensor_status)
+                self.live_plot.redraw()
+
+            if updated:
+                self.sensor_status_label.configure(text="\n".join(
+                    f"{deployed_sensor_id}: offset {status['system_time_offset_ms']:+.3f} ms, "
+                    f"dispersion {status['root_dispersion_ms']:.3f} ms, {status['age_s']:.0f} s ago"
+                    + (f"  ALERT: {', '.join(status['alerts'])}" if status.get('alerts') else "")
+                    for deployed_sensor_id, status in sorted(sensor_status.items())
+                ))
 
         except Exception as e:
             logging.error(f"Error updating plot: {e}")
@@ -561,22 +754,36 @@ class LabInABoxControlPanel:
         if self.plot_running:
             self.root.after(1000, self.update_plot)
 
-    def get_latest_csv_file(self):
-        """Retrieve the most recent CSV file from the sync_metrics directory."""
-        try:
-            files = [
-                os.path.join(self.SYNC_METRICS_DIR, f)
-                for f in os.listdir(self.SYNC_METRICS_DIR)
-                if f.endswith(".csv")
-            ]
-            if not files:
-                logging.warning("No CSV files found in the sync_metrics directory.")
-                return None
-            return max(files, key=os.path.getctime)
-        except Exception as e:
-            logging.error(f"Error fetching latest CSV file: {e}")
-            return None
 
+    # --------------------------------------
+    # Live Camera Previews
+    # --------------------------------------
+
+    def update_previews(self):
+        """Show the newest preview frame received from each camera."""
+        for deployed_sensor_id, (timestamp, jpeg) in sorted(self.preview_server.get_latest_previews().items()):
+            if self.preview_timestamps.get(deployed_sensor_id) == timestamp:
+                continue
+            try:
+                image = Image.open(BytesIO(jpeg))
+                image.thumbnail((self.PREVIEW_WIDTH, self.PREVIEW_WIDTH))
+                photo = ImageTk.PhotoImage(image)
+            except Exception as e:
+                logging.error(f"Error decoding preview from {deployed_sensor_id}: {e}")
+                continue
+
+            if deployed_sensor_id not in self.preview_labels:
+                label = tk.Label(self.preview_frame, text=deployed_sensor_id, compound="top")
+                label.pack(pady=5)
+                self.preview_labels[deployed_sensor_id] = label
+            self.preview_labels[deployed_sensor_id].configure(
+                image=photo,
+                text=f"{deployed_sensor_id} @ {datetime.fromtimestamp(timestamp).strftime('%H:%M:%S')}"
+            )
+            self.preview_images[deployed_sensor_id] = photo
+            self.preview_timestamps[deployed_sensor_id] = timestamp
+
+        self.root.after(1000, self.update_previews)
 
 
 if __name__ == "__main__":
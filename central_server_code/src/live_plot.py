@@ -0,0 +1,171 @@
+# live_plot.py
+import numpy as np
+
+# Live time sync plots for the control panel.
+#
+# Points are appended to preallocated NumPy ring buffers and the line artists are created
+# once. An update restores the cached background, draws only the lines and blits the
+# figure, so its cost no longer includes axes, ticks, labels and legends. A full redraw
+# (which also refreshes the cached background) happens only when the axis limits must grow
+# or a new sensor appears.
+AXIS_HEADROOM = 0.25  # Fraction of the span added past the data when an axis has to grow
+MAX_LEGEND_SENSORS = 12  # Beyond this the per-sensor legends would cover the plots
+
+
+class RingBuffer:
+    """
+    Fixed-capacity (x, y) history in preallocated NumPy arrays.
+
+    Every point is written twice, at i and i + capacity, so the stored points are always one
+    contiguous slice and view() never copies or reorders.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros((2, 2 * capacity))  # Rows: x, y
+        self._next = 0
+        self.size = 0
+
+    def append(self, x, y):
+        i = self._next
+        self._data[:, i] = self._data[:, i + self.capacity] = (x, y)
+        self._next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def view(self):
+        """(x, y) arrays of the stored points, oldest first."""
+        start = (self._next - self.size) % self.capacity
+        window = self._data[:, start:start + self.size]
+        return window[0], window[1]
+
+    def clear(self):
+        self._next = 0
+        self.size = 0
+
+
+class LiveSyncPlot:
+    """Fleet max offset plus per-sensor offset and root dispersion, redrawn by blitting."""
+
+    def __init__(self, fig, canvas, fleet_window, sensor_window):
+        self.fig = fig
+        self.canvas = canvas
+        self.fleet_window = fleet_window
+        self.sensor_window = sensor_window
+
+        self.fleet_ax, self.offset_ax, self.dispersion_ax = fig.subplots(3, 1, sharex=True)
+        self.fleet_ax.set_title("Live Max Offset", fontsize=12)
+        self.fleet_ax.set_ylabel("Max Offset (ms)", fontsize=9)
+        self.offset_ax.set_ylabel("Offset (ms)", fontsize=9)
+        self.dispersion_ax.set_ylabel("Root Disp. (ms)", fontsize=9)
+        self.dispersion_ax.set_xlabel("Time (s)", fontsize=10)
+
+        self.fleet_data = RingBuffer(fleet_window)
+        self.fleet_line, = self.fleet_ax.plot([], [], lw=2, animated=True)
+        self.sensor_data = {}  # {deployed_sensor_id: (offset RingBuffer, dispersion RingBuffer)}
+        self.sensor_lines = {}  # {deployed_sensor_id: (offset line, dispersion line)}
+        self.last_report = {}  # {deployed_sensor_id: timestamp of the last report plotted}
+        self.start_time = None
+
+        self.background = None
+        self.needs_full_draw = True
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def reset(self):
+        """Forget the previous capture; artists are kept and reused."""
+        self.fleet_data.clear()
+        for offsets, dispersions in self.sensor_data.values():
+            offsets.clear()
+            dispersions.clear()
+        self.last_report = {}
+        self.start_time = None
+        self.needs_full_draw = True
+
+    def _relative(self, timestamp):
+        if self.start_time is None:
+            self.start_time = timestamp
+        return timestamp - self.start_time
+
+    def add_fleet_points(self, points):
+        """Append (timestamp, max offset ms) rows."""
+        for timestamp, max_offset_ms in points:
+            self.fleet_data.append(self._relative(timestamp), max_offset_ms)
+
+    def add_sensor_status(self, sensor_status):
+        """Append each sensor's latest report if it is newer than the last one plotted."""
+        for deployed_sensor_id, status in sensor_status.items():
+            if self.last_report.get(deployed_sensor_id) == status['timestamp']:
+                continue
+            self.last_report[deployed_sensor_id] = status['timestamp']
+            if deployed_sensor_id not in self.sensor_data:
+                self._add_sensor(deployed_sensor_id)
+            offsets, dispersions = self.sensor_data[deployed_sensor_id]
+            x = self._relative(status['timestamp'])
+            offsets.append(x, status['system_time_offset_ms'])
+            dispersions.append(x, status['root_dispersion_ms'])
+
+    def _add_sensor(self, deployed_sensor_id):
+        offset_line, = self.offset_ax.plot([], [], lw=1, label=deployed_sensor_id, animated=True)
+        dispersion_line, = self.dispersion_ax.plot([], [], lw=1, color=offset_line.get_color(), animated=True)
+        self.sensor_data[deployed_sensor_id] = (RingBuffer(self.sensor_window), RingBuffer(self.sensor_window))
+        self.sensor_lines[deployed_sensor_id] = (offset_line, dispersion_line)
+        if len(self.sensor_lines) <= MAX_LEGEND_SENSORS:
+            self.offset_ax.legend(fontsize=6, ncol=2, loc='upper left')
+        elif self.offset_ax.get_legend() is not None:
+            self.offset_ax.get_legend().remove()
+        self.needs_full_draw = True
+
+    def _artists(self):
+        yield self.fleet_line, self.fleet_data
+        for deployed_sensor_id, (offset_line, dispersion_line) in self.sensor_lines.items():
+            offsets, dispersions = self.sensor_data[deployed_sensor_id]
+            yield offset_line, offsets
+            yield dispersion_line, dispersions
+
+    def _grow_limits(self):
+        """Widen any axis the data no longer fits; returns True if a limit changed."""
+        changed = False
+        x_max = max((buffer.view()[0][-1] for _, buffer in self._artists() if buffer.size), default=None)
+        if x_max is None:
+            return False
+        if x_max > self.fleet_ax.get_xlim()[1] or self.needs_full_draw:
+            x_min = min((buffer.view()[0][0] for _, buffer in self._artists() if buffer.size), default=0.0)
+            span = max(x_max - x_min, 1.0)
+            self.fleet_ax.set_xlim(x_min, x_max + AXIS_HEADROOM * span)
+            changed = True
+
+        for ax, buffers in (
+            (self.fleet_ax, [self.fleet_data]),
+            (self.offset_ax, [offsets for offsets, _ in self.sensor_data.values()]),
+            (self.dispersion_ax, [dispersions for _, dispersions in self.sensor_data.values()]),
+        ):
+            values = [buffer.view()[1] for buffer in buffers if buffer.size]
+            if not values:
+                continue
+            low = min(v.min() for v in values)
+            high = max(v.max() for v in values)
+            bottom, top = ax.get_ylim()
+            if low < bottom or high > top or self.needs_full_draw:
+                margin = AXIS_HEADROOM * max(high - low, 1e-3)
+                ax.set_ylim(low - margin, high + margin)
+                changed = True
+        return changed
+
+    def _on_draw(self, event):
+        """After a full redraw, cache the static background and draw the lines on top."""
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_lines()
+
+    def _draw_lines(self):
+        for line, buffer in self._artists():
+            line.set_data(*buffer.view())
+            line.axes.draw_artist(line)
+
+    def redraw(self):
+        """Push new points to the screen: a blit, or a full draw if the axes changed."""
+        if self._grow_limits() or self.needs_full_draw or self.background is None:
+            self.needs_full_draw = False
+            self.canvas.draw()  # Fires draw_event, which refreshes the background
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_lines()
+        self.canvas.blit(self.fig.bbox)
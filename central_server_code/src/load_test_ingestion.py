@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+import argparse
+import statistics
+
+# Representative `chronyc tracking` output, as posted by shared_sensor_code/TimeSync.py
+CHRONYC_TEMPLATE = """Reference ID    : C0A84482 (192.168.68.130)
+Stratum         : 2
+Ref time (UTC)  : Thu Nov 21 15:04:05 2024
+System time     : {offset:.9f} seconds fast of NTP time
+Last offset     : +0.000001234 seconds
+RMS offset      : 0.000012345 seconds
+Frequency       : 3.456 ppm slow
+Residual freq   : +0.001 ppm
+Skew            : 0.012 ppm
+Root delay      : 0.000345678 seconds
+Root dispersion : {dispersion:.9f} seconds
+Update interval : 16.0 seconds
+Leap status     : Normal
+"""
+
+
+def build_request(host, port, deployed_sensor_id, sample_index):
+    payload = {
+        'deployed_sensor_id': deployed_sensor_id,
+        'data': {
+            'timestamp': time.time(),
+            'chronyc_output': CHRONYC_TEMPLATE.format(
+                offset=((sample_index % 200) - 100) * 1e-6,
+                dispersion=0.0001 + (sample_index % 50) * 1e-6
+            )
+        }
+    }
+    body = json.dumps(payload).encode()
+    head = (
+        f"POST /receive_data HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode()
+    return head + body
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def run_client(host, port, deployed_sensor_id, end_time, rate, latencies, stats):
+    """One simulated sensor posting over a single keep-alive connection (rate <= 0 means as fast as possible)."""
+    reader, writer = await asyncio.open_connection(host, port)
+    interval = 1.0 / rate if rate > 0 else 0.0
+    next_send = time.perf_counter()
+    sample_index = 0
+    try:
+        while time.perf_counter() < end_time:
+            if interval:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_send += interval
+            start = time.perf_counter()
+            writer.write(build_request(host, port, deployed_sensor_id, sample_index))
+            await writer.drain()
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            stats['ok' if status == 200 else 'failed'] += 1
+            sample_index += 1
+    finally:
+        writer.close()
+
+
+async def run_load_test(host, port, clients, duration, rate):
+    latencies = []
+    stats = {'ok': 0, 'failed': 0}
+    start = time.perf_counter()
+    end_time = start + duration
+    await asyncio.gather(*(
+        run_client(host, port, f"LOAD{i:03d}", end_time, rate, latencies, stats) for i in range(clients)
+    ))
+    elapsed = time.perf_counter() - start
+    return stats, latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the central server's /receive_data endpoint")
+    parser.add_argument("--ip_address", type=str, default="127.0.0.1", help="Central server IP address")
+    parser.add_argument("--port", type=int, default=5000, help="Central server port")
+    parser.add_argument("--clients", type=int, default=50, help="Number of simulated sensors (one connection each)")
+    parser.add_argument("--duration", type=float, default=10, help="Test duration in seconds")
+    parser.add_argument("--rate", type=float, default=0, help="Posts per second per client (0 = as fast as possible)")
+    args = parser.parse_args()
+
+    stats, latencies, elapsed = asyncio.run(
+        run_load_test(args.ip_address, args.port, args.clients, args.duration, args.rate)
+    )
+    total = stats['ok'] + stats['failed']
+    print(f"Sent {total} messages from {args.clients} clients in {elapsed:.1f} s: "
+          f"{total / elapsed:.0f} msgs/s ({stats['failed']} failed)")
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        print(f"Latency p50 {cuts[49] * 1000:.2f} ms, p99 {cuts[98] * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import csv
+import sqlite3
+import logging
+import argparse
+from collections import deque
+
+CSV_FIELDNAMES = ['timestamp', 'max_offset_ms', 'mean_offset_ms', 'jitter_ms', 'mean_root_dispersion_ms', 'max_root_dispersion_ms']
+SENSOR_FIELDNAMES = ['timestamp', 'deployed_sensor_id', 'system_time_offset_ms', 'root_dispersion_ms',
+                     'root_delay_ms', 'stratum', 'reference_id']
+
+RING_SIZE = 3600  # Most recent fleet rows and per-sensor samples kept in memory
+MAX_PENDING_ROWS = 100000  # Bound on unwritten fleet and sensor rows each while the database fails
+
+CREATE_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS fleet_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp REAL NOT NULL,
+        max_offset_ms REAL,
+        mean_offset_ms REAL,
+        jitter_ms REAL,
+        mean_root_dispersion_ms REAL,
+        max_root_dispersion_ms REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sensor_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp REAL NOT NULL,
+        deployed_sensor_id TEXT NOT NULL,
+        system_time_offset_ms REAL,
+        root_dispersion_ms REAL,
+        root_delay_ms REAL,
+        stratum INTEGER,
+        reference_id TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_fleet_metrics_timestamp ON fleet_metrics(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_sensor_metrics_sensor_time ON sensor_metrics(deployed_sensor_id, timestamp)",
+]
+
+
+def _to_ms(value):
+    return None if value is None else value * 1000
+
+
+class MetricsStore:
+    """
+    Sync metrics time series: bounded in-memory rings plus a SQLite database in WAL mode.
+
+    record_fleet/record_sensor only append to a ring and a pending list; flush() writes all
+    pending rows in one transaction. Fleet rows get their database id up front, so the id
+    doubles as the cursor for incremental reads (fleet_since). WAL lets other processes read
+    the database while the server is writing, and CSV is produced only when export_csv is called.
+    """
+
+    def __init__(self, db_path, ring_size=RING_SIZE, max_pending_rows=MAX_PENDING_ROWS):
+        self.db_path = db_path
+        self.max_pending_rows = max_pending_rows
+        self.fleet_ring = deque(maxlen=ring_size)  # (id, timestamp, max_offset_ms, ...)
+        self.sensor_rings = {}  # {deployed_sensor_id: deque of sensor rows}
+        self.ring_size = ring_size
+        self.pending_fleet = []
+        self.pending_sensor = []
+
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in CREATE_TABLES_SQL:
+            self.conn.execute(statement)
+        self.conn.commit()
+        self.last_fleet_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM fleet_metrics").fetchone()[0]
+        logging.info(f"Metrics store opened at {db_path}")
+
+    def record_fleet(self, row):
+        """Queue one fleet metrics row (a dict with CSV_FIELDNAMES keys) and return its id."""
+        self.last_fleet_id += 1
+        values = (self.last_fleet_id,) + tuple(row[name] for name in CSV_FIELDNAMES)
+        self.fleet_ring.append(values)
+        self.pending_fleet.append(values)
+        return self.last_fleet_id
+
+    def record_sensor(self, deployed_sensor_id, timestamp, chrony_data):
+        """Queue one sensor sample; offsets and delays are stored in ms."""
+        values = (
+            timestamp,
+            deployed_sensor_id,
+            _to_ms(chrony_data.get('system_time_offset')),
+            _to_ms(chrony_data.get('root_dispersion')),
+            _to_ms(chrony_data.get('root_delay')),
+            chrony_data.get('stratum'),
+            chrony_data.get('reference_id'),
+        )
+        ring = self.sensor_rings.get(deployed_sensor_id)
+        if ring is None:
+            ring = self.sensor_rings[deployed_sensor_id] = deque(maxlen=self.ring_size)
+        ring.append(values)
+        self.pending_sensor.append(values)
+
+    def flush(self):
+        """Write all pending rows in a single transaction. Returns the number of rows written."""
+        if not self.pending_fleet and not self.pending_sensor:
+            return 0
+        count = len(self.pending_fleet) + len(self.pending_sensor)
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    f"INSERT INTO fleet_metrics (id, {', '.join(CSV_FIELDNAMES)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self.pending_fleet
+                )
+                self.conn.executemany(
+                    f"INSERT INTO sensor_metrics ({', '.join(SENSOR_FIELDNAMES)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self.pending_sensor
+                )
+        except sqlite3.Error as e:
+            # Keep the rows pending so the next flush retries them, up to max_pending_rows each
+            logging.error(f"Error writing sync metrics to {self.db_path}: {e}")
+            self.pending_fleet = self._trim_pending(self.pending_fleet, 'fleet')
+            self.pending_sensor = self._trim_pending(self.pending_sensor, 'sensor')
+            return 0
+        self.pending_fleet = []
+        self.pending_sensor = []
+        return count
+
+    def _trim_pending(self, rows, kind):
+        """Drop the oldest pending rows beyond max_pending_rows so a failing database cannot exhaust memory."""
+        excess = len(rows) - self.max_pending_rows
+        if excess <= 0:
+            return rows
+        logging.warning(f"Dropped {excess} oldest unwritten {kind} metrics rows; {self.db_path} is not accepting writes")
+        return rows[excess:]
+
+    def recent_fleet(self, limit=None):
+        """Most recent (id, timestamp, max_offset_ms, ...) fleet rows from memory, oldest first."""
+        rows = list(self.fleet_ring)
+        return rows if limit is None else rows[-limit:]
+
+    def fleet_since(self, cursor, limit=None):
+        """
+        Fleet rows with id > cursor, oldest first, limited to the newest `limit` rows.
+
+        Served from the ring when it still covers the cursor, otherwise from the database.
+        """
+        if cursor >= self.last_fleet_id:
+            return []
+        if self.fleet_ring and cursor >= self.fleet_ring[0][0] - 1:
+            count = self.last_fleet_id - cursor
+            if limit is not None:
+                count = min(count, limit)
+            return [self.fleet_ring[i] for i in range(len(self.fleet_ring) - count, len(self.fleet_ring))]
+        self.flush()
+        return _query_fleet(self.conn, cursor, limit)
+
+    def recent_sensor(self, deployed_sensor_id, limit=None):
+        rows = list(self.sensor_rings.get(deployed_sensor_id, ()))
+        return rows if limit is None else rows[-limit:]
+
+    def export_csv(self, csv_path):
+        """Write the flushed fleet metrics to a CSV with the original sync metrics columns."""
+        self.flush()
+        return export_fleet_csv(self.conn, csv_path)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+        logging.info(f"Metrics store closed at {self.db_path}")
+
+
+def export_fleet_csv(conn, csv_path):
+    cursor = conn.execute(f"SELECT {', '.join(CSV_FIELDNAMES)} FROM fleet_metrics ORDER BY id")
+    count = 0
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_FIELDNAMES)
+        for rows in iter(lambda: cursor.fetchmany(1000), []):
+            writer.writerows(rows)
+            count += len(rows)
+    logging.info(f"Exported {count} sync metrics rows to {csv_path}")
+    return count
+
+
+def read_fleet_metrics(db_path, after_id=0, limit=None):
+    """
+    Read fleet rows with id > after_id from a database another process may be writing.
+
+    Returns:
+        List of (id, timestamp, max_offset_ms, ...) tuples, oldest first.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return _query_fleet(conn, after_id, limit)
+    finally:
+        conn.close()
+
+
+def _query_fleet(conn, after_id, limit):
+    query = f"SELECT id, {', '.join(CSV_FIELDNAMES)} FROM fleet_metrics WHERE id > ? ORDER BY id"
+    if limit is None:
+        return conn.execute(query, (after_id,)).fetchall()
+    # Only the newest `limit` rows, still returned oldest first
+    rows = conn.execute(query.replace("ORDER BY id", "ORDER BY id DESC LIMIT ?"), (after_id, limit)).fetchall()
+    return rows[::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export sync metrics from a metrics database to CSV")
+    parser.add_argument("db_path", type=str, help="Sync metrics .db written by central_server_v3.py")
+    parser.add_argument("--csv", type=str, default=None, help="Output CSV path (default: next to the database)")
+    args = parser.parse_args()
+
+    csv_path = args.csv or args.db_path.rsplit('.', 1)[0] + '.csv'
+    conn = sqlite3.connect(f"file:{args.db_path}?mode=ro", uri=True)
+    try:
+        count = export_fleet_csv(conn, csv_path)
+    finally:
+        conn.close()
+    print(f"Exported {count} rows to {csv_path}")
+
+
+if __name__ == '__main__':
+    main()
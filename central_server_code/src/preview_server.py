@@ -0,0 +1,82 @@
+# preview_server.py
+import socketserver
+import struct
+import threading
+import logging
+
+# Must match camera_code/src/PreviewPublisher.py
+PREVIEW_MAGIC = b'LXPV'
+PREVIEW_HEADER = struct.Struct('!4sHId')
+MAX_PREVIEW_BYTES = 2 * 1024 * 1024
+
+
+class _PreviewHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        peer = self.client_address[0]
+        logging.info(f"Preview stream connected from {peer}")
+        try:
+            while True:
+                header = self._recv_exact(PREVIEW_HEADER.size)
+                if header is None:
+                    break
+                magic, id_length, jpeg_length, timestamp = PREVIEW_HEADER.unpack(header)
+                if magic != PREVIEW_MAGIC or jpeg_length > MAX_PREVIEW_BYTES:
+                    logging.error(f"Invalid preview frame from {peer}, closing stream.")
+                    break
+                sensor_id = self._recv_exact(id_length)
+                jpeg = self._recv_exact(jpeg_length)
+                if sensor_id is None or jpeg is None:
+                    break
+                self.server.preview_server.update(sensor_id.decode(errors='replace'), timestamp, jpeg)
+        except OSError as e:
+            logging.warning(f"Preview stream from {peer} failed: {e}")
+        logging.info(f"Preview stream from {peer} closed.")
+
+    def _recv_exact(self, size):
+        chunks = []
+        while size:
+            chunk = self.request.recv(size)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+
+class _ThreadingPreviewTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class PreviewServer:
+    """Receives live JPEG previews from camera SBCs and keeps the newest one per sensor."""
+
+    def __init__(self, host="0.0.0.0", port=5001):
+        self.host = host
+        self.port = port
+        self.latest_previews = {}  # {deployed_sensor_id: (timestamp, jpeg_bytes)}
+        self.preview_lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = _ThreadingPreviewTCPServer((self.host, self.port), _PreviewHandler)
+        self.server.preview_server = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info(f"Preview server listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            logging.info("Preview server stopped.")
+
+    def update(self, deployed_sensor_id, timestamp, jpeg):
+        with self.preview_lock:
+            self.latest_previews[deployed_sensor_id] = (timestamp, jpeg)
+
+    def get_latest_previews(self):
+        """Return a snapshot of {deployed_sensor_id: (timestamp, jpeg_bytes)}."""
+        with self.preview_lock:
+            return dict(self.latest_previews)
@@ -0,0 +1,186 @@
+# segment_index.py
+import math
+import json
+import sqlite3
+import struct
+import zipfile
+import argparse
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from create_database import DEFAULT_DB_PATH
+from file_catalog import body_frame_times
+
+# Multimodal segment lookup over the file catalog.
+#
+# SegmentIndex loads the catalogued segments once and keeps, per sensor, the segments sorted
+# by start time together with the running maximum of their end times. That running maximum
+# is non-decreasing, so the segments overlapping [t0, t1) are found with two binary searches
+# (start < t1, running max end > t0) plus a filter of the few candidates in between: the
+# same answer as an interval tree for a catalog that is rebuilt rather than edited in place.
+# Each hit carries the frame range inside the file that falls in [t0, t1) and, for radar
+# .npz files (stored uncompressed by np.savez), the byte range of those frames, so a loader
+# can seek straight to them.
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')  # Fixed part of a zip local file header
+FRAME_TIMES_CACHE_SIZE = 32  # Segments whose frame times are kept for repeated --exact_frames queries
+
+
+@lru_cache(maxsize=FRAME_TIMES_CACHE_SIZE)
+def read_frame_times(path, sensor_type):
+    """Per-frame capture times (epoch seconds, ascending) of one segment file; ZED JSON is streamed."""
+    if sensor_type == 'radar':
+        with np.load(path, allow_pickle=True) as archive:  # Our own collectors' datetime list
+            return np.array([timestamp.timestamp() for timestamp in archive['frame_timestamps_list']])
+    if sensor_type == 'camera':
+        with open(path.rsplit('.', 1)[0] + '.json') as f:
+            return np.array(json.load(f)['frame_timestamps'])
+    return np.sort(body_frame_times(path))
+
+
+def radar_byte_range(path, first_frame, last_frame, frame_count):
+    """
+    (offset, length, dtype, frame_shape) of frames [first_frame, last_frame) of the 'data'
+    array in a radar .npz, or None if the member is compressed or frames are not equal-sized.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo('data.npy')
+    if info.compress_type != zipfile.ZIP_STORED or not frame_count:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+        f.seek(header[-2] + header[-1], 1)  # File name and extra field
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        array_offset = f.tell()
+    if fortran_order or dtype.hasobject or not shape or shape[0] % frame_count:
+        return None
+    frame_shape = (shape[0] // frame_count,) + tuple(shape[1:])
+    frame_bytes = math.prod(frame_shape) * dtype.itemsize
+    return array_offset + first_frame * frame_bytes, (last_frame - first_frame) * frame_bytes, dtype, frame_shape
+
+
+class SegmentIndex:
+    """
+    In-memory interval index over catalogued segments, queried by time window.
+
+    rows are (path, deployed_sensor_id, sensor_type, start_time, end_time, frame_count), as
+    stored in the catalog's files table. Build it with from_catalog() and rebuild it after
+    an ingest.
+    """
+
+    def __init__(self, rows):
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row[1], []).append(row)
+        self.sensors = {}  # {deployed_sensor_id: (rows by start, starts, ends, running max of ends)}
+        for deployed_sensor_id, sensor_rows in grouped.items():
+            sensor_rows.sort(key=lambda row: row[3])
+            starts = np.array([row[3] for row in sensor_rows], dtype=float)
+            ends = np.array([row[4] for row in sensor_rows], dtype=float)
+            self.sensors[deployed_sensor_id] = (sensor_rows, starts, ends, np.maximum.accumulate(ends))
+
+    @classmethod
+    def from_catalog(cls, db_path=DEFAULT_DB_PATH, base_filename=None):
+        """Index every catalogued segment, or only those of the capture recorded as base_filename."""
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        query = ("SELECT path, deployed_sensor_id, sensor_type, start_time, end_time, frame_count FROM files "
+                 "WHERE start_time IS NOT NULL")
+        params = ()
+        if base_filename is not None:
+            query += " AND capture_id IN (SELECT capture_id FROM data_captures WHERE base_filename = ?)"
+            params = (base_filename,)
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+        return cls(rows)
+
+    def overlapping(self, deployed_sensor_id, t0, t1):
+        """Rows of the sensor's segments that overlap [t0, t1), in start order."""
+        if deployed_sensor_id not in self.sensors:
+            return []
+        sensor_rows, starts, ends, max_ends = self.sensors[deployed_sensor_id]
+        last = np.searchsorted(starts, t1, side='left')  # Segments starting before t1
+        first = np.searchsorted(max_ends[:last], t0, side='right')  # Nothing earlier ends after t0
+        return [sensor_rows[i] for i in range(first, last) if ends[i] > t0]
+
+    def query(self, t0, t1, sensor_ids=None, sensor_types=None, exact_frames=False):
+        """
+        Segments overlapping [t0, t1) per sensor: {deployed_sensor_id: [hit, ...]}.
+
+        Each hit is a dict with the row's fields plus first_frame and last_frame (the
+        half-open frame range inside the file captured in [t0, t1)) and, for radar, byte_range
+        (see radar_byte_range). Frame ranges are estimated from the segment's time span and
+        frame count; exact_frames reads the file's own frame timestamps instead (the small
+        timestamp array or sidecar, not the frame data).
+        """
+        results = {}
+        for deployed_sensor_id in (self.sensors if sensor_ids is None else sensor_ids):
+            hits = []
+            for path, _, sensor_type, start, end, frame_count in self.overlapping(deployed_sensor_id, t0, t1):
+                if sensor_types is not None and sensor_type not in sensor_types:
+                    continue
+                first_frame, last_frame = self.frame_range(path, sensor_type, start, end, frame_count, t0, t1, exact_frames)
+                hit = {'path': path, 'sensor_type': sensor_type, 'start_time': start, 'end_time': end,
+                       'frame_count': frame_count, 'first_frame': first_frame, 'last_frame': last_frame}
+                if sensor_type == 'radar' and first_frame is not None:
+                    hit['byte_range'] = radar_byte_range(path, first_frame, last_frame, frame_count)
+                hits.append(hit)
+            if hits:
+                results[deployed_sensor_id] = hits
+        return results
+
+    @staticmethod
+    def frame_range(path, sensor_type, start, end, frame_count, t0, t1, exact_frames=False):
+        """Half-open range of frame indices captured in [t0, t1); (None, None) if the frame count is unknown."""
+        if exact_frames:
+            frame_times = read_frame_times(path, sensor_type)
+            return int(np.searchsorted(frame_times, t0, side='left')), int(np.searchsorted(frame_times, t1, side='left'))
+        if not frame_count:
+            return None, None
+        period = (end - start) / frame_count
+        if period <= 0:
+            return 0, frame_count
+        first_frame = min(frame_count, max(0, math.ceil((t0 - start) / period)))
+        last_frame = min(frame_count, max(0, math.ceil((t1 - start) / period)))
+        return first_frame, last_frame
+
+
+def parse_time(value):
+    """Epoch seconds, or an ISO date/time in local time."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the catalogued segments of every sensor between two times")
+    parser.add_argument("start", type=str, help="Window start, epoch seconds or ISO time (e.g. 2025-03-01T14:05:00)")
+    parser.add_argument("end", type=str, help="Window end, epoch seconds or ISO time")
+    parser.add_argument("--base_filename", type=str, default=None, help="Only segments of this capture")
+    parser.add_argument("--sensor_type", type=str, nargs='+', default=None, help="Only these sensor types (radar, camera, body_tracking)")
+    parser.add_argument("--exact_frames", action="store_true", help="Read each file's frame timestamps for exact frame ranges")
+    parser.add_argument("--db_path", type=str, default=DEFAULT_DB_PATH, help="Path of the SQLite database file")
+    args = parser.parse_args()
+
+    index = SegmentIndex.from_catalog(args.db_path, args.base_filename)
+    results = index.query(parse_time(args.start), parse_time(args.end), sensor_types=args.sensor_type,
+                          exact_frames=args.exact_frames)
+    for deployed_sensor_id, hits in sorted(results.items(), key=lambda item: str(item[0])):
+        print(f"{deployed_sensor_id}:")
+        for hit in hits:
+            frames = f"frames {hit['first_frame']}-{hit['last_frame']} of {hit['frame_count']}" \
+                if hit['first_frame'] is not None else "frames unknown"
+            byte_range = hit.get('byte_range')
+            extent = f", bytes {byte_range[0]}+{byte_range[1]}" if byte_range else ""
+            print(f"  {hit['path']}  {frames}{extent}")
+
+
+if __name__ == "__main__":
+    main()
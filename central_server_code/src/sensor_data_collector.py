@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import os
-import sys
-import paramiko
+import argparse
+
+from ssh_session_manager import SSHSessionManager
+from data_pull_engine import DataPullEngine, MAX_WORKERS
 
 # ------------------------------------------------------------------------------
 # SETTINGS
@@ -36,12 +38,6 @@ rpi_hosts = [
         'password': 'admin',
         'base_remote_path': '/home/user/labx_master/ZED2i_code/data'
     },
-    {
-        'host': '192.168.0.47',
-        'username': 'user',
-        'password': 'admin',  # or None if using keys
-        'base_remote_path': '/home/user/labx_master/ZED2i_code/data'
-    },
     # ... add more as needed
 ]
 
@@ -49,41 +45,6 @@ rpi_hosts = [
 DEST_ROOT = input("Enter the Local Root Destination Folder path: ").strip()
 
 
-# ------------------------------------------------------------------------------
-# HELPER FUNCTION: Recursively copy a remote directory via SFTP
-# ------------------------------------------------------------------------------
-def copy_directory(sftp, remote_path, local_path):
-    """
-    Recursively copy the contents of remote_path to local_path using the given sftp client.
-    """
-    # Ensure the local path exists
-    os.makedirs(local_path, exist_ok=True)
-
-    # List items in the remote directory
-    for item in sftp.listdir(remote_path):
-        remote_item_path = os.path.join(remote_path, item)
-        local_item_path = os.path.join(local_path, item)
-
-        # Use lstat to determine if it's a directory or file
-        attr = sftp.lstat(remote_item_path)
-        if is_directory(attr):
-            # Recursively copy the sub-directory
-            copy_directory(sftp, remote_item_path, local_item_path)
-        else:
-            # It's a file, copy it
-            print(f"Copying file: {remote_item_path} -> {local_item_path}")
-            sftp.get(remote_item_path, local_item_path)
-
-
-def is_directory(sftp_attr):
-    """
-    Return True if the SFTPAttributes object indicates a directory.
-    On many systems, paramiko uses stat S_IFDIR for directories.
-    """
-    import stat
-    return stat.S_ISDIR(sftp_attr.st_mode)
-
-
 # ------------------------------------------------------------------------------
 # MAIN SCRIPT
 # ------------------------------------------------------------------------------
@@ -91,54 +52,50 @@ def main():
     # ------------------------------------------------------------------------------
     # 1) Get the folder name to copy from the command line or input prompt
     # ------------------------------------------------------------------------------
-    if len(sys.argv) > 1:
-        folder_name = sys.argv[1]
-    else:
-        folder_name = input("Enter the folder name to copy from each RPi: ").strip()
+    parser = argparse.ArgumentParser(description="Pull a capture folder from every RPi host")
+    parser.add_argument('folder_name', nargs='?', help="Folder to copy from each RPi")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help="Hosts pulled in parallel")
+    parser.add_argument('--mode', choices=['sftp', 'archive'], default='sftp', help="Copy files over SFTP, or stream them as a tar | gzip archive (smaller for JSON and radar data)")
+    parser.add_argument('--verify_hashes', action='store_true', help="Compare SHA-256 hashes, not just sizes, after each transfer")
+    args = parser.parse_args()
+    folder_name = args.folder_name or input("Enter the folder name to copy from each RPi: ").strip()
 
     # ------------------------------------------------------------------------------
-    # 2) Iterate over the RPi hosts and copy the folder from each
+    # 2) One job per RPi host, each into a subfolder named after the host
     # ------------------------------------------------------------------------------
-    for rpi in rpi_hosts:
-        host = rpi['host']
-        username = rpi['username']
-        password = rpi['password']
-        base_remote_path = rpi['base_remote_path']
-
-        # Build the FULL remote folder path
-        remote_folder_path = os.path.join(base_remote_path, folder_name)
-
-        # Create a subfolder named after the host (or any unique identifier)
-        local_subfolder = os.path.join(DEST_ROOT, f"{host}_{folder_name}")
-
-        print(f"\nConnecting to {host} to copy: {remote_folder_path}")
-        try:
-            # ------------------------------------------------------------------------------
-            # 3) Set up SSH and SFTP
-            # ------------------------------------------------------------------------------
-            ssh = paramiko.SSHClient()
-            # Automatically add host keys from known_hosts
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(hostname=host, username=username, password=password)
-
-            sftp = ssh.open_sftp()
+    jobs = [
+        {
+            'host': rpi['host'],
+            'username': rpi['username'],
+            'password': rpi['password'],
+            'remote_path': os.path.join(rpi['base_remote_path'], folder_name),
+            'local_path': os.path.join(DEST_ROOT, f"{rpi['host']}_{folder_name}"),
+        }
+        for rpi in rpi_hosts
+    ]
 
-            # ------------------------------------------------------------------------------
-            # 4) Recursively copy the folder
-            # ------------------------------------------------------------------------------
-            print(f"Copying {remote_folder_path} -> {local_subfolder}")
-            copy_directory(sftp, remote_folder_path, local_subfolder)
-
-            # ------------------------------------------------------------------------------
-            # 5) Close SFTP and SSH connections
-            # ------------------------------------------------------------------------------
-            sftp.close()
-            ssh.close()
-            print(f"Finished copying from {host}.\n")
+    # ------------------------------------------------------------------------------
+    # 3) Pull the hosts in parallel, copying only new or changed files
+    # ------------------------------------------------------------------------------
+    # Hosts listed more than once share one SSH session
+    ssh_sessions = SSHSessionManager()
+    engine = DataPullEngine(ssh_sessions, max_workers=args.workers, verify_hashes=args.verify_hashes,
+                            transfer_mode=args.mode)
+    results, summary = engine.pull(jobs)
+
+    for result in results:
+        if result['error']:
+            print(f"ERROR copying from {result['host']}: {result['error']}")
+        else:
+            print(f"Finished copying from {result['host']}: {result['files']} copied, "
+                  f"{result['skipped']} up to date, {result['failed']} failed.")
+    print(f"\nCopied {summary['files']} files ({summary['bytes'] / 1e6:.1f} MB) in {summary['seconds']:.1f} s, "
+          f"{summary['mb_per_s']:.1f} MB/s aggregate.")
 
-        except Exception as e:
-            print(f"ERROR copying from {host}: {e}")
-            continue
+    # ------------------------------------------------------------------------------
+    # 4) Close the SSH connections
+    # ------------------------------------------------------------------------------
+    ssh_sessions.close_all()
 
 
 if __name__ == "__main__":
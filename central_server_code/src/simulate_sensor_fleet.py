@@ -0,0 +1,347 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+from load_test_ingestion import read_response
+
+# Add the repository root to sys.path to import shared modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, '..', '..'))
+sys.path.append(parent_dir)
+from shared_sensor_code.telemetry_protocol import (
+    ACK, ACK_OK, DEFAULT_TELEMETRY_PORT, encode_batch, encode_record, parse_chronyc_output
+)
+
+CENTRAL_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "central_server_v3.py")
+REQUEST_TIMEOUT = 5  # Seconds, as in shared_sensor_code/TimeSync.py
+STREAM_LINE_LIMIT = 16 * 1024 * 1024
+OFFSET_STEP_S = 2e-3  # Offset jump of 'offset_step' faulty sensors
+FAULTS = ('reference_loss', 'offset_step')  # Assigned to faulty sensors in turn
+
+CHRONYC_TRACKING = """Reference ID    : {reference_id}
+Stratum         : {stratum}
+Ref time (UTC)  : {ref_time}
+System time     : {offset:.9f} seconds {direction} of NTP time
+Last offset     : {last_offset:+.9f} seconds
+RMS offset      : {rms_offset:.9f} seconds
+Frequency       : {frequency:.3f} ppm {frequency_direction}
+Residual freq   : {residual:+.3f} ppm
+Skew            : {skew:.3f} ppm
+Root delay      : {root_delay:.9f} seconds
+Root dispersion : {root_dispersion:.9f} seconds
+Update interval : {update_interval:.1f} seconds
+Leap status     : {leap_status}
+"""
+
+
+class SimulatedClock:
+    """
+    A sensor's chrony state: a slowly wandering offset, with an optional fault.
+
+    'reference_loss' free-runs the clock at its frequency error with growing dispersion and
+    turns unsynchronised after 30 s; 'offset_step' jumps the offset by step_s, as when chrony
+    follows a bad source, which trips offset_drift.
+    """
+
+    def __init__(self, rng, fault=None, step_s=OFFSET_STEP_S):
+        self.rng = rng
+        self.offset = rng.gauss(0, 20e-6)
+        self.frequency = rng.uniform(-20, 20)
+        self.root_delay = rng.uniform(200e-6, 600e-6)
+        self.root_dispersion = rng.uniform(50e-6, 300e-6)
+        self.fault = fault
+        self.step_s = step_s
+        self.fault_started = None
+        self.fault_offset = self.offset
+
+    def chronyc_output(self, now, fault_after):
+        stratum, reference_id, leap_status = 2, "C0A84482 (192.168.68.130)", "Normal"
+        if self.fault == 'offset_step' and now >= fault_after:
+            # A bad source pulls the clock away by step_s; the reference itself stays healthy
+            self.offset = self.fault_offset + self.step_s + self.rng.gauss(0, 5e-6)
+        elif self.fault == 'reference_loss' and now >= fault_after:
+            # Lost the reference: the clock free-runs at its frequency error and dispersion grows
+            self.fault_started = self.fault_started or now
+            elapsed = now - self.fault_started
+            self.offset = self.fault_offset + self.frequency * 1e-6 * elapsed
+            self.root_dispersion += 1e-3
+            if elapsed > 30:
+                stratum, reference_id, leap_status = 16, "00000000 ()", "Not synchronised"
+        else:
+            # Normal operation: chrony keeps the offset as a small mean-reverting random walk
+            self.offset += -0.2 * self.offset + self.rng.gauss(0, 5e-6)
+            self.root_dispersion = max(20e-6, self.root_dispersion + self.rng.gauss(0, 5e-6))
+            self.fault_offset = self.offset
+
+        return CHRONYC_TRACKING.format(
+            reference_id=reference_id,
+            stratum=stratum,
+            ref_time=datetime.fromtimestamp(now, timezone.utc).strftime('%a %b %d %H:%M:%S %Y'),
+            offset=abs(self.offset),
+            direction="fast" if self.offset >= 0 else "slow",
+            last_offset=self.rng.gauss(0, 5e-6),
+            rms_offset=abs(self.rng.gauss(15e-6, 3e-6)),
+            frequency=abs(self.frequency),
+            frequency_direction="fast" if self.frequency >= 0 else "slow",
+            residual=self.rng.gauss(0, 0.01),
+            skew=abs(self.rng.gauss(0.02, 0.005)),
+            root_delay=self.root_delay,
+            root_dispersion=self.root_dispersion,
+            update_interval=16.0,
+            leap_status=leap_status,
+        )
+
+
+class FleetStats:
+    def __init__(self):
+        self.latencies = []
+        self.sent = 0
+        self.ok = 0
+        self.dropped = {}  # {reason: count}
+        self.freshness = []  # Seconds from the newest sensor report to its arrival in the metrics stream
+        self.stream_events = 0
+        self.bytes_sent = 0
+
+    def drop(self, reason):
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+
+
+async def post_report(host, port, payload, reader_writer):
+    """POST one report; opens a new connection unless an open (reader, writer) pair is given."""
+    body = json.dumps(payload).encode()
+    request = (
+        f"POST /receive_data HTTP/1.1\r\nHost: {host}:{port}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if reader_writer else 'close'}\r\n\r\n"
+    ).encode() + body
+    reader, writer = reader_writer or await asyncio.open_connection(host, port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        return await read_response(reader)
+    finally:
+        if not reader_writer:
+            writer.close()
+
+
+async def send_binary_report(deployed_sensor_id, now, chronyc_output, reader, writer):
+    """Send one report as a single-record telemetry batch; returns (accepted, frame bytes)."""
+    frame = encode_batch(deployed_sensor_id, [encode_record(now, parse_chronyc_output(chronyc_output))])
+    writer.write(frame)
+    await writer.drain()
+    status, accepted = ACK.unpack(await reader.readexactly(ACK.size))
+    return status == ACK_OK and accepted == 1, len(frame)
+
+
+async def run_sensor(index, args, stats, end_time, rng):
+    deployed_sensor_id = f"SIM{index:04d}"
+    clock = SimulatedClock(rng, fault=FAULTS[index % len(FAULTS)] if index < args.faulty_sensors else None)
+    fault_after = time.time() + args.fault_after
+    connection = None
+
+    # Sensors start at random points of their polling cycle, as they do in the field
+    await asyncio.sleep(rng.uniform(0, args.interval))
+    while time.time() < end_time:
+        cycle_start = time.perf_counter()
+        now = time.time()
+        chronyc_output = clock.chronyc_output(now, fault_after)
+        payload = {
+            'deployed_sensor_id': deployed_sensor_id,
+            'data': {'timestamp': now, 'chronyc_output': chronyc_output}
+        }
+
+        # One-way network delay before the request reaches the server
+        delay = max(0.0, rng.gauss(args.network_delay_ms, args.delay_jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        stats.sent += 1
+        start = time.perf_counter()
+        try:
+            if args.transport == 'binary':
+                # TimeSync's binary transport always keeps its connection open
+                if connection is None:
+                    connection = await asyncio.open_connection(args.host, args.telemetry_port)
+                accepted, size = await asyncio.wait_for(
+                    send_binary_report(deployed_sensor_id, now, chronyc_output, *connection), REQUEST_TIMEOUT
+                )
+                stats.bytes_sent += size
+                status = 200 if accepted else None
+            else:
+                if args.keep_alive and connection is None:
+                    connection = await asyncio.open_connection(args.host, args.port)
+                status = await asyncio.wait_for(post_report(args.host, args.port, payload, connection), REQUEST_TIMEOUT)
+                stats.bytes_sent += len(json.dumps(payload))
+            stats.latencies.append(time.perf_counter() - start + delay)
+            if status == 200:
+                stats.ok += 1
+            else:
+                stats.drop(f"http_{status}" if status else "nack")
+        except asyncio.TimeoutError:
+            stats.drop("timeout")
+            connection = None
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            stats.drop("connection")
+            connection = None
+
+        # Poll interval with jitter, measured from the start of this cycle like TimeSync's wait
+        interval = args.interval * (1 + rng.uniform(-args.jitter, args.jitter))
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - cycle_start)))
+
+    if connection is not None:
+        connection[1].close()
+
+
+async def watch_metrics(args, stats, end_time):
+    """Follow /metrics/stream and record how old the newest sensor report is when it is published."""
+    try:
+        # Each event carries every sensor's status, so lines grow with the fleet
+        reader, writer = await asyncio.open_connection(args.host, args.port, limit=STREAM_LINE_LIMIT)
+    except OSError as e:
+        print(f"Could not open metrics stream: {e}")
+        return
+    writer.write(f"GET /metrics/stream HTTP/1.1\r\nHost: {args.host}:{args.port}\r\n\r\n".encode())
+    await writer.drain()
+    try:
+        await reader.readuntil(b'\r\n\r\n')
+        newest_seen = 0.0
+        while time.time() < end_time:
+            try:
+                line = await asyncio.wait_for(reader.readline(), max(0.1, end_time - time.time()))
+            except asyncio.TimeoutError:
+                break
+            if not line:
+                break
+            if line.startswith(b'data:'):
+                event = json.loads(line[5:])
+                stats.stream_events += 1
+                received = time.time()
+                newest = max((status['timestamp'] for status in event['sensors'].values()), default=0.0)
+                if newest > newest_seen:
+                    stats.freshness.append(received - newest)
+                    newest_seen = newest
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def run_fleet(args):
+    stats = FleetStats()
+    end_time = time.time() + args.duration
+    rng = random.Random(args.seed)
+    tasks = [run_sensor(i, args, stats, end_time, random.Random(rng.random())) for i in range(args.sensors)]
+    tasks.append(watch_metrics(args, stats, end_time + 2))
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def launch_server(args, work_dir):
+    """Start central_server_v3.py on localhost with its outputs in work_dir."""
+    process = subprocess.Popen([
+        sys.executable, CENTRAL_SERVER_SCRIPT,
+        "--base_filename", "fleet_simulation",
+        "--duration", str(int(args.duration)),
+        "--log_file", os.path.join(work_dir, "central_server.log"),
+        "--ip_address", args.host,
+        "--port", str(args.port),
+        "--telemetry_port", str(args.telemetry_port),
+        "--sync_metrics_dir", work_dir,
+        "--database_path", os.path.join(work_dir, "lab_in_a_box.db"),
+    ])
+    # Wait until the port accepts connections
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((args.host, args.port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Central server did not start listening within 10 s")
+
+
+def percentile_summary(values, scale=1000, unit="ms"):
+    if len(values) < 2:
+        return "n/a"
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return (f"p50 {cuts[49] * scale:.2f} {unit}, p95 {cuts[94] * scale:.2f} {unit}, "
+            f"p99 {cuts[98] * scale:.2f} {unit}, max {max(values) * scale:.2f} {unit}")
+
+
+def print_report(args, stats, work_dir):
+    dropped = sum(stats.dropped.values())
+    print(f"\n--- Fleet simulation: {args.sensors} sensors, {args.interval:g} s interval, {args.duration:g} s ---")
+    print(f"Reports sent: {stats.sent}, accepted: {stats.ok}, dropped: {dropped} "
+          f"({100 * dropped / max(stats.sent, 1):.2f}%) {stats.dropped or ''}")
+    print(f"Offered load: {stats.sent / args.duration:.1f} reports/s, "
+          f"{stats.bytes_sent / max(stats.sent, 1):.0f} payload bytes/report ({args.transport})")
+    print(f"Request latency (incl. simulated network delay): {percentile_summary(stats.latencies)}")
+    print(f"Metric freshness (newest report -> metrics stream): {percentile_summary(stats.freshness)} "
+          f"over {stats.stream_events} stream events")
+    if work_dir:
+        print_alerts(os.path.join(work_dir, "lab_in_a_box.db"))
+        print(f"Server outputs kept in {work_dir}")
+
+
+def print_alerts(database_path):
+    """Summarise the alerts the launched server raised, per type."""
+    if not os.path.exists(database_path):
+        return
+    conn = sqlite3.connect(database_path)
+    try:
+        rows = conn.execute(
+            "SELECT alert_type, COUNT(*), COUNT(DISTINCT sensor_name) FROM alerts GROUP BY alert_type ORDER BY alert_type"
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Could not read alerts: {e}")
+        return
+    finally:
+        conn.close()
+    summary = ', '.join(f"{alert_type} {count} ({sensors} sensors)" for alert_type, count, sensors in rows)
+    print(f"Alerts raised: {summary or 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of TimeSync clients against the central server on localhost")
+    parser.add_argument("--sensors", type=int, default=200, help="Number of simulated sensors")
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between reports per sensor (TimeSync sync_polling_interval)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Random +/- fraction applied to each interval")
+    parser.add_argument("--network_delay_ms", type=float, default=2.0, help="Mean simulated one-way network delay")
+    parser.add_argument("--delay_jitter_ms", type=float, default=1.0, help="Std dev of the simulated network delay")
+    parser.add_argument("--duration", type=float, default=60, help="Simulation length in seconds")
+    parser.add_argument("--faulty_sensors", type=int, default=0, help="Sensors that fail after --fault_after seconds, alternately losing their reference and stepping their offset")
+    parser.add_argument("--fault_after", type=float, default=20, help="Seconds before faulty sensors start drifting")
+    parser.add_argument("--keep_alive", action="store_true", help="Reuse one connection per sensor (TimeSync opens a new one per report)")
+    parser.add_argument("--transport", choices=['json', 'binary'], default='json', help="TimeSync wire format to simulate")
+    parser.add_argument("--telemetry_port", type=int, default=DEFAULT_TELEMETRY_PORT, help="Central server binary telemetry port")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Central server address")
+    parser.add_argument("--port", type=int, default=5000, help="Central server port")
+    parser.add_argument("--launch_server", action="store_true", help="Start central_server_v3.py on localhost for the run")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for reproducible fleets")
+    args = parser.parse_args()
+
+    server_process = None
+    work_dir = None
+    if args.launch_server:
+        work_dir = tempfile.mkdtemp(prefix="labx_fleet_")
+        server_process = launch_server(args, work_dir)
+    try:
+        stats = asyncio.run(run_fleet(args))
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait(timeout=10)
+    print_report(args, stats, work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import socket
+import threading
+import logging
+import time
+
+import paramiko
+
+KEEPALIVE_INTERVAL = 15   # Seconds between SSH keepalive requests on idle transports
+CONNECT_TIMEOUT = 10      # Seconds allowed for TCP connect, banner and authentication
+EXEC_WINDOW_SIZE = 2**25  # Window for bulk exec streams (32 MiB); paramiko's 2 MiB default caps data in flight
+EXEC_MAX_PACKET_SIZE = 2**16
+
+
+class RemoteCommand:
+    """
+    A command running on one exec channel of a pooled transport.
+
+    stdout and stderr are drained by two daemon threads as the output arrives, so a chatty
+    command never stalls on a full channel window, and completion is signalled by paramiko's
+    exit status event instead of polling exit_status_ready().
+    """
+
+    def __init__(self, host, command, channel, on_stdout=None, on_stderr=None):
+        self.host = host
+        self.command = command
+        self.channel = channel
+        self.stdout_lines = []
+        self.stderr_lines = []
+        self.readers = [
+            threading.Thread(target=self._drain, args=(channel.makefile('r'), self.stdout_lines, on_stdout), daemon=True),
+            threading.Thread(target=self._drain, args=(channel.makefile_stderr('r'), self.stderr_lines, on_stderr), daemon=True),
+        ]
+        for reader in self.readers:
+            reader.start()
+
+    def _drain(self, stream, lines, callback):
+        try:
+            for line in stream:
+                line = line.rstrip('\n')
+                if callback is not None:
+                    callback(line)
+                else:
+                    lines.append(line)
+        except (OSError, EOFError, paramiko.SSHException) as e:
+            logging.debug(f"Output of '{self.command}' on {self.host} ended: {e}")
+
+    def wait(self, timeout=None):
+        """Block until the command exits; returns False if it is still running after timeout seconds."""
+        if not self.channel.status_event.wait(timeout):
+            return False
+        for reader in self.readers:
+            reader.join(timeout=5)
+        return True
+
+    @property
+    def done(self):
+        return self.channel.status_event.is_set()
+
+    @property
+    def exit_status(self):
+        """Remote exit code, or None while running (-1 if the channel closed without one)."""
+        return self.channel.exit_status if self.done else None
+
+    def send_line(self, text):
+        """Write one line to the command's stdin."""
+        self.channel.sendall((text + '\n').encode())
+
+    def cancel(self):
+        """Close the channel; the remote process gets SIGHUP only if it was started with a pty."""
+        self.channel.close()
+
+
+class SSHSessionManager:
+    """
+    One authenticated SSH transport per (host, username), shared by every remote operation.
+
+    The first call to a device pays for the TCP connect, key exchange and authentication;
+    later exec and SFTP calls only open a channel on the existing transport, which takes
+    one round trip. Transports send keepalives, so a device that went away is noticed and
+    reconnected on the next call instead of hanging on a dead socket. Safe to use from
+    several threads; each SFTP client should be used by one thread at a time.
+    """
+
+    def __init__(self, key_filename=None, keepalive_interval=KEEPALIVE_INTERVAL, connect_timeout=CONNECT_TIMEOUT, port=22):
+        self.key_filename = key_filename
+        self.port = port
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self.clients = {}  # {(host, username): paramiko.SSHClient}
+        self.sftp_clients = {}  # {(host, username): paramiko.SFTPClient}
+        self.locks = {}  # {(host, username): threading.Lock}, held while connecting
+        self.lock = threading.Lock()
+
+    def _host_lock(self, key):
+        with self.lock:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def get_client(self, host, username, password=None):
+        """Return a connected SSHClient for the device, reconnecting if its transport died."""
+        key = (host, username)
+        client = self.clients.get(key)
+        if client is not None and self._is_alive(client):
+            return client
+
+        with self._host_lock(key):
+            client = self.clients.get(key)
+            if client is not None and self._is_alive(client):
+                return client
+            if client is not None:
+                logging.warning(f"SSH transport to {username}@{host} is dead, reconnecting.")
+                self._close_key(key)
+
+            start = time.perf_counter()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(
+                host, port=self.port, username=username, password=password or None, key_filename=self.key_filename,
+                timeout=self.connect_timeout, banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout
+            )
+            transport = client.get_transport()
+            transport.set_keepalive(self.keepalive_interval)
+            # Commands are small request/response exchanges; don't let Nagle hold them back
+            transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.clients[key] = client
+            logging.info(f"SSH session to {username}@{host} established in {time.perf_counter() - start:.2f} s")
+            return client
+
+    def _is_alive(self, client):
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def warm_up(self, host, username, password=None):
+        """Connect in the background so the first real command does not pay for the handshake."""
+        def connect():
+            try:
+                self.get_client(host, username, password)
+            except Exception as e:
+                logging.warning(f"Could not pre-connect to {username}@{host}: {e}")
+        threading.Thread(target=connect, daemon=True).start()
+
+    def exec_command(self, host, username, command, password=None, on_stdout=None, on_stderr=None, get_pty=False):
+        """Start command on a new channel of the device's transport and return a RemoteCommand."""
+        transport = self.get_client(host, username, password).get_transport()
+        channel = transport.open_session(timeout=self.connect_timeout)
+        if get_pty:
+            channel.get_pty()
+        channel.exec_command(command)
+        return RemoteCommand(host, command, channel, on_stdout, on_stderr)
+
+    def run(self, host, username, command, password=None, timeout=None):
+        """Run command to completion; returns (exit_status, stdout_lines, stderr_lines)."""
+        remote = self.exec_command(host, username, command, password)
+        if not remote.wait(timeout):
+            remote.cancel()
+            raise TimeoutError(f"'{command}' on {host} did not finish within {timeout} s")
+        return remote.exit_status, remote.stdout_lines, remote.stderr_lines
+
+    def open_sftp(self, host, username, password=None):
+        """Return the device's SFTP client, reusing its channel while it stays open."""
+        key = (host, username)
+        client = self.get_client(host, username, password)
+        sftp = self.sftp_clients.get(key)
+        if sftp is not None and not sftp.get_channel().closed and sftp.get_channel().get_transport() is client.get_transport():
+            return sftp
+        sftp = client.open_sftp()
+        self.sftp_clients[key] = sftp
+        return sftp
+
+    def open_bulk_sftp(self, host, username, password=None):
+        """
+        New SFTP client for bulk transfers; the caller owns and closes it.
+
+        Unlike open_sftp() it is never shared, so several can stream files from one device
+        in parallel over the same transport. It keeps paramiko's default window and packet
+        size: a 32 MiB window measured slower with benchmark_data_pull.py.
+        """
+        transport = self.get_client(host, username, password).get_transport()
+        return paramiko.SFTPClient.from_transport(transport)
+
+    def open_exec_channel(self, host, username, command, password=None):
+        """
+        Start command on a large-window channel and return the raw paramiko Channel.
+
+        For binary streams (e.g. a tar archive) that the caller reads itself; use
+        exec_command() for line-oriented output.
+        """
+        transport = self.get_client(host, username, password).get_transport()
+        channel = transport.open_session(
+            window_size=EXEC_WINDOW_SIZE, max_packet_size=EXEC_MAX_PACKET_SIZE, timeout=self.connect_timeout
+        )
+        channel.exec_command(command)
+        return channel
+
+    def _close_key(self, key):
+        sftp = self.sftp_clients.pop(key, None)
+        client = self.clients.pop(key, None)
+        for connection in (sftp, client):
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+    def close(self, host, username):
+        with self._host_lock((host, username)):
+            self._close_key((host, username))
+
+    def close_all(self):
+        for key in list(self.clients):
+            self.close(*key)
+        logging.info("Closed all SSH sessions.")
@@ -0,0 +1,111 @@
+import math
+from bisect import bisect_left, insort
+
+EXACT_RECOMPUTE_INTERVAL = 10000  # Updates between exact recomputes of the running sums
+
+
+class SyncMetricsEngine:
+    """
+    Incremental synchronization metrics over the latest offset of every sensor.
+
+    Offsets are kept in a sorted list, so with n sensors sorted as x_0 <= ... <= x_{n-1}:
+      - max pairwise offset  = x_{n-1} - x_0
+      - sum of |x_i - x_j|   = sum_k x_k * (2k - n + 1)             (S1)
+      - sum of (x_i - x_j)^2 = n * sum(x^2) - sum(x)^2              (S2)
+    and the pairwise mean and population variance follow from S1 and S2 over n(n-1)/2 pairs,
+    matching the old all-pairs loops. When one sensor reports, its old value is removed and
+    the new one inserted; S1 is adjusted by the value's distance to all other offsets, which
+    needs the sum of the offsets below its rank. That slice sum and the list insert are O(n),
+    but both run in C over one contiguous list, so an update stays far cheaper than the old
+    O(n^2) pair loops. Running sums are recomputed exactly every EXACT_RECOMPUTE_INTERVAL
+    updates to stop floating point drift.
+    """
+
+    def __init__(self, exact_recompute_interval=EXACT_RECOMPUTE_INTERVAL):
+        self.exact_recompute_interval = exact_recompute_interval
+        self.latest = {}  # {deployed_sensor_id: (offset_s, root_dispersion_s)}
+        self.sorted_offsets = []
+        self.sorted_dispersions = []
+        self.offset_sum = 0.0
+        self.offset_square_sum = 0.0
+        self.pairwise_abs_sum = 0.0  # S1
+        self.dispersion_sum = 0.0
+        self.updates_since_recompute = 0
+
+    def __len__(self):
+        return len(self.latest)
+
+    def _distance_sum(self, value, rank):
+        """Sum of |value - x| over sorted_offsets, given value's insertion rank. O(n) slice sum."""
+        below_sum = sum(self.sorted_offsets[:rank])
+        above_sum = self.offset_sum - below_sum
+        above_count = len(self.sorted_offsets) - rank
+        return (value * rank - below_sum) + (above_sum - value * above_count)
+
+    def _remove_offset(self, value):
+        self.sorted_offsets.pop(bisect_left(self.sorted_offsets, value))
+        self.offset_sum -= value
+        self.offset_square_sum -= value * value
+        self.pairwise_abs_sum -= self._distance_sum(value, bisect_left(self.sorted_offsets, value))
+
+    def _insert_offset(self, value):
+        rank = bisect_left(self.sorted_offsets, value)
+        self.pairwise_abs_sum += self._distance_sum(value, rank)
+        self.sorted_offsets.insert(rank, value)
+        self.offset_sum += value
+        self.offset_square_sum += value * value
+
+    def update(self, deployed_sensor_id, offset, root_dispersion):
+        """Replace a sensor's latest offset and root dispersion (seconds). O(n) slice sums and list shifts."""
+        previous = self.latest.get(deployed_sensor_id)
+        if previous is not None:
+            old_offset, old_dispersion = previous
+            self._remove_offset(old_offset)
+            self.sorted_dispersions.pop(bisect_left(self.sorted_dispersions, old_dispersion))
+            self.dispersion_sum -= old_dispersion
+
+        self._insert_offset(offset)
+        insort(self.sorted_dispersions, root_dispersion)
+        self.dispersion_sum += root_dispersion
+        self.latest[deployed_sensor_id] = (offset, root_dispersion)
+
+        self.updates_since_recompute += 1
+        if self.updates_since_recompute >= self.exact_recompute_interval:
+            self.recompute()
+
+    def remove(self, deployed_sensor_id):
+        """Drop a sensor from the metrics, e.g. when it stops reporting."""
+        previous = self.latest.pop(deployed_sensor_id, None)
+        if previous is None:
+            return
+        old_offset, old_dispersion = previous
+        self._remove_offset(old_offset)
+        self.sorted_dispersions.pop(bisect_left(self.sorted_dispersions, old_dispersion))
+        self.dispersion_sum -= old_dispersion
+
+    def recompute(self):
+        """Rebuild the running sums exactly from the sorted lists in O(n)."""
+        n = len(self.sorted_offsets)
+        self.offset_sum = math.fsum(self.sorted_offsets)
+        self.offset_square_sum = math.fsum(x * x for x in self.sorted_offsets)
+        self.pairwise_abs_sum = math.fsum(x * (2 * k - n + 1) for k, x in enumerate(self.sorted_offsets))
+        self.dispersion_sum = math.fsum(self.sorted_dispersions)
+        self.updates_since_recompute = 0
+
+    def metrics(self, timestamp):
+        """Return the sync metrics CSV row in ms, or None with fewer than two sensors. O(1)."""
+        n = len(self.sorted_offsets)
+        if n < 2:
+            return None
+        pair_count = n * (n - 1) / 2
+        mean_offset = max(self.pairwise_abs_sum / pair_count, 0.0)
+        squared_sum = n * self.offset_square_sum - self.offset_sum * self.offset_sum
+        variance = max(squared_sum / pair_count - mean_offset * mean_offset, 0.0)
+        return {
+            'timestamp': timestamp,
+            'max_offset_ms': (self.sorted_offsets[-1] - self.sorted_offsets[0]) * 1000,
+            'mean_offset_ms': mean_offset * 1000,
+            'jitter_ms': math.sqrt(variance) * 1000,
+            'mean_root_dispersion_ms': self.dispersion_sum / n * 1000,
+            'max_root_dispersion_ms': self.sorted_dispersions[-1] * 1000
+        }
@@ -0,0 +1,213 @@
+# trickle_pull_scheduler.py
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from data_pull_engine import DataPullEngine
+
+HOST_RATE = 2e6  # Bytes/s each device may send while it is capturing
+GLOBAL_RATE = 6e6  # Bytes/s for all devices together, well below the LAN so chrony traffic keeps its latency
+POLL_INTERVAL = 20  # Seconds between health checks and pull rounds
+SETTLE_SECONDS = 30  # A segment is complete once it has not been modified for this long
+OFFSET_MARGIN_MS = 0.5  # Sync offset worse than the pre-pull baseline by this much counts as disturbed
+DISPERSION_MARGIN_MS = 1.0  # Same for root dispersion
+MIN_FACTOR = 0.05  # Below this share of its budget a device is paused instead of throttled
+RECOVERY_STEP = 0.1  # Budget share regained per healthy poll (additive increase, multiplicative decrease)
+
+# Collector counters whose increase means the capture itself is suffering
+DISTRESS_COUNTERS = (
+    'labx_radar_frame_gaps_total',
+    'labx_camera_read_errors_total',
+    'labx_zed_executable_error_lines_total',
+)
+# Collector gauges that show the saving thread falling behind (e.g. SD card contention)
+BACKLOG_GAUGES = ('labx_radar_save_queue_depth', 'labx_camera_save_queue_depth')
+
+
+class TokenBucket:
+    """Byte budget refilled at `rate` per second; consume() blocks while the bucket is in debt."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, amount, stop_event=None):
+        """Take amount bytes (going into debt if needed) and wait until the debt is repaid; False if stopped."""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 and self.rate > 0 else 0.0
+        if wait <= 0:
+            return True
+        if stop_event is not None:
+            return not stop_event.wait(wait)
+        time.sleep(wait)
+        return True
+
+
+class TricklePullScheduler:
+    """
+    Pull finished segments from the devices while a capture is still running.
+
+    Every POLL_INTERVAL seconds each device is checked and then delta-pulled with the
+    DataPullEngine (files untouched for SETTLE_SECONDS only), so the final pull after the
+    capture finds most data already here. Transfers draw from a per-device and a global
+    token bucket. A device whose sync offset or root dispersion drifts beyond its pre-pull
+    baseline, whose time sync alerts fire, or whose collector reports new frame gaps or a
+    growing save queue has its budget halved (paused below MIN_FACTOR) and regains it in
+    RECOVERY_STEP increments while healthy. If most devices are disturbed at once, the
+    global budget is cut the same way, since that points at the shared LAN.
+
+    jobs are DataPullEngine jobs, one per device. status_provider() returns the latest time
+    sync status per host ({host: {'system_time_offset_ms', 'root_dispersion_ms', 'alerts'}}),
+    and with metrics_ports ({sensor_type: port}) the /metrics endpoint of every collector on a
+    host is scraped as well; each sensor type has its own port so two collectors can share a host.
+    """
+
+    def __init__(self, ssh_sessions, jobs, status_provider=None, metrics_ports=None, host_rate=HOST_RATE,
+                 global_rate=GLOBAL_RATE, poll_interval=POLL_INTERVAL, settle_seconds=SETTLE_SECONDS):
+        self.jobs = list(jobs)
+        self.hosts = sorted({job['host'] for job in self.jobs})  # Devices with two sensors share one budget
+        self.status_provider = status_provider
+        self.host_metrics_ports = {host: sorted({metrics_ports[job['sensor_type']] for job in self.jobs
+                                                 if job['host'] == host and job['sensor_type'] in metrics_ports})
+                                   for host in self.hosts} if metrics_ports else {}
+        self.host_rate = host_rate
+        self.global_rate = global_rate
+        self.poll_interval = poll_interval
+
+        self.stop_event = threading.Event()
+        self.global_bucket = TokenBucket(global_rate)
+        self.host_buckets = {host: TokenBucket(host_rate) for host in self.hosts}
+        self.host_factors = {host: 1.0 for host in self.hosts}
+        self.global_factor = 1.0
+        self.baselines = {}  # {host: (abs offset ms, dispersion ms)} seen before the first pull
+        self.counters = {}  # {(host, port): {counter name: last value}}
+        self.bytes_pulled = 0
+        self.lock = threading.Lock()
+
+        self.engine = DataPullEngine(ssh_sessions, max_workers=1, files_per_host=1, prefetch=False,
+                                     min_age_s=settle_seconds, throttle=self.throttle)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.jobs)))
+        self.running = {}  # {job index: Future of the pull in progress}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        logging.info(f"Trickle pull started for {len(self.hosts)} devices "
+                     f"({self.host_rate / 1e6:.1f} MB/s per device, {self.global_rate / 1e6:.1f} MB/s total)")
+        self.thread.start()
+
+    def stop(self, timeout=10):
+        """Stop scheduling and interrupt transfers in progress; their '.part' files resume on the next pull."""
+        self.stop_event.set()
+        self.thread.join(timeout)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        logging.info(f"Trickle pull stopped after {self.bytes_pulled / 1e6:.1f} MB")
+
+    # --------------------------------------
+    # Bandwidth budget
+    # --------------------------------------
+
+    def throttle(self, host, nbytes):
+        """DataPullEngine hook: block until host and fleet budgets allow nbytes more."""
+        while self.host_factors.get(host, 1.0) < MIN_FACTOR:
+            if self.stop_event.wait(1.0):
+                raise InterruptedError("Trickle pull stopped")
+        if not (self.host_buckets[host].consume(nbytes, self.stop_event)
+                and self.global_bucket.consume(nbytes, self.stop_event)):
+            raise InterruptedError("Trickle pull stopped")
+        with self.lock:
+            self.bytes_pulled += nbytes
+
+    def apply_budgets(self):
+        for host, bucket in self.host_buckets.items():
+            bucket.set_rate(self.host_rate * self.host_factors[host])
+        self.global_bucket.set_rate(self.global_rate * self.global_factor)
+
+    # --------------------------------------
+    # Capture health
+    # --------------------------------------
+
+    def sync_disturbed(self, host, status):
+        """True if the host's sync is worse than before pulling started (or it raised alerts)."""
+        if status is None:
+            return False
+        offset = abs(status['system_time_offset_ms'])
+        dispersion = status['root_dispersion_ms']
+        baseline = self.baselines.setdefault(host, (offset, dispersion))
+        return bool(status.get('alerts')) or offset > baseline[0] + OFFSET_MARGIN_MS \
+            or dispersion > baseline[1] + DISPERSION_MARGIN_MS
+
+    def collector_distressed(self, host):
+        """True if any collector on the host grew its gap or error counters, or backed up its save queue, since the last poll."""
+        distressed = False
+        for port in self.host_metrics_ports.get(host, []):
+            try:
+                response = requests.get(f"http://{host}:{port}/metrics", timeout=2)
+                response.raise_for_status()
+            except requests.exceptions.RequestException:
+                continue  # No endpoint (yet); judge by sync alone
+            values = {}
+            for line in response.text.splitlines():
+                name, _, value = line.partition(' ')
+                if name in DISTRESS_COUNTERS or name in BACKLOG_GAUGES:
+                    values[name] = float(value)
+            previous = self.counters.get((host, port), {})
+            self.counters[(host, port)] = values
+            grew = any(values.get(name, 0) > previous[name] for name in DISTRESS_COUNTERS if name in previous)
+            backlog = any(values.get(name, 0) > 1 for name in BACKLOG_GAUGES)
+            distressed = distressed or grew or backlog
+        return distressed
+
+    def check_health(self):
+        statuses = self.status_provider() if self.status_provider else {}
+        disturbed = 0
+        for host in self.hosts:
+            factor = self.host_factors[host]
+            if self.sync_disturbed(host, statuses.get(host)) or self.collector_distressed(host):
+                disturbed += 1
+                self.host_factors[host] = factor / 2
+                if self.host_factors[host] >= MIN_FACTOR:
+                    logging.info(f"Trickle pull backing off for {host} to {self.host_factors[host]:.0%} of its budget")
+                elif factor >= MIN_FACTOR:
+                    logging.warning(f"Trickle pull paused for {host}: capture health degraded")
+            else:
+                self.host_factors[host] = min(1.0, factor + RECOVERY_STEP)
+        if self.hosts and disturbed > len(self.hosts) / 2:
+            self.global_factor = max(MIN_FACTOR, self.global_factor / 2)
+            logging.warning(f"Most devices disturbed; fleet pull budget cut to {self.global_factor:.0%}")
+        else:
+            self.global_factor = min(1.0, self.global_factor + RECOVERY_STEP)
+        self.apply_budgets()
+
+    # --------------------------------------
+    # Scheduling loop
+    # --------------------------------------
+
+    def run(self):
+        # Record the sync baselines before any data moves
+        self.check_health()
+        while not self.stop_event.is_set():
+            for index, job in enumerate(self.jobs):
+                future = self.running.get(index)
+                if (future is None or future.done()) and self.host_factors[job['host']] >= MIN_FACTOR:
+                    self.running[index] = self.executor.submit(self.engine.pull_job, job)
+            if self.stop_event.wait(self.poll_interval):
+                break
+            self.check_health()
@@ -21,6 +21,8 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, '..', '..'))
 sys.path.append(parent_dir)
 from shared_sensor_code.TimeSync import TimeSync
+from shared_sensor_code.metrics_registry import Counter, Gauge, Histogram, start_metrics_server
+from shared_sensor_code.start_sync import wait_for_start
 
 # -------------------------------------------------
 # Logging Setup
@@ -44,7 +46,7 @@ logging.info("Starting Radar Data Collector script.")
 
 class RadarDataCollector:
     def __init__(self, stop_event, deployed_sensor_id="RAD001", central_server_url='http://192.168.68.130:5000/receive_data',
-                 sync_polling_interval=10, base_filename='default_radar_data'):
+                 sync_polling_interval=10, base_filename='default_radar_data', time_sync_transport='json'):
         # Configuration
         self.deployed_sensor_id = deployed_sensor_id
         logging.info(f"Initializing RadarDataCollector with ID {self.deployed_sensor_id}")
@@ -52,6 +54,7 @@ class RadarDataCollector:
         self.central_server_url = central_server_url
         self.sync_polling_interval = sync_polling_interval
         self.base_filename = base_filename
+        self.time_sync_transport = time_sync_transport
         self.stop_event = stop_event  # Store the stop_event for graceful shutdown
         # Data storage
         self.collected_data = []
@@ -61,7 +64,8 @@ class RadarDataCollector:
         self.time_sync = TimeSync(
             deployed_sensor_id=self.deployed_sensor_id,
             central_server_url=self.central_server_url,
-            sync_polling_interval=self.sync_polling_interval
+            sync_polling_interval=self.sync_polling_interval,
+            transport=self.time_sync_transport
         )
 
     def start_time_sync(self):
@@ -100,6 +104,17 @@ class RadarDataCollector:
 # Radar Data Collection Code
 # -------------------------------------------------
 
+FRAMES_CAPTURED = Counter('labx_radar_frames_total', 'Radar frames read from the device.')
+FRAME_READ_SECONDS = Histogram('labx_radar_frame_read_seconds', 'Time spent in get_next_frame().',
+                               buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0))
+FRAME_GAPS = Counter('labx_radar_frame_gaps_total', 'Frame intervals longer than the gap threshold.')
+FRAME_GAP_SECONDS = Counter('labx_radar_frame_gap_seconds_total', 'Time beyond the expected frame interval lost in gaps.')
+BUFFERED_FRAMES = Gauge('labx_radar_buffered_frames', 'Frames in the current batch buffer.')
+SAVE_QUEUE_DEPTH = Gauge('labx_radar_save_queue_depth', 'Batches waiting for the saving thread.')
+FILES_WRITTEN = Counter('labx_radar_files_written_total', 'Radar .npz batch files written.')
+BYTES_WRITTEN = Counter('labx_radar_bytes_written_total', 'Bytes of radar batch files written.')
+SAVE_SECONDS = Histogram('labx_radar_save_seconds', 'Time to write one radar batch file.')
+
 def data_saving_thread(base_filename, data_queue, stop_event, data_output_directory):
     """Thread that saves data from the queue to disk."""
     while not stop_event.is_set() or not data_queue.empty():
@@ -112,7 +127,10 @@ def data_saving_thread(base_filename, data_queue, stop_event, data_output_direct
 
                 # Save data
                 file_path = os.path.join(data_output_directory, filename)
-                np.savez(file_path, data=np.concatenate(buffer, axis=0), frame_timestamps_list=np.array(frame_timestamps_list))
+                with SAVE_SECONDS.time():
+                    np.savez(file_path, data=np.concatenate(buffer, axis=0), frame_timestamps_list=np.array(frame_timestamps_list))
+                FILES_WRITTEN.inc()
+                BYTES_WRITTEN.inc(os.path.getsize(file_path))
                 logging.info(f"Saved {len(buffer)} frames to {filename}")
                 data_queue.task_done()
         except queue.Empty:
@@ -129,6 +147,9 @@ def main():
     parser.add_argument('--base_filename', type=str, default='radar_data.json', help="File to save radar data")
     parser.add_argument('--capture_duration', type=int, default=600, help="Duration for data capture in seconds")
     parser.add_argument('--central_server_url', type=str, default="http://192.168.68.130:5000/receive_data", help="Central Server Url for time sync monitoring")
+    parser.add_argument('--time_sync_transport', type=str, choices=['json', 'binary'], default='json', help="TimeSync wire format: JSON over HTTP or binary telemetry")
+    parser.add_argument('--wait_for_start', action='store_true', help="Open the radar, print READY and wait for 'START <timestamp>' on stdin")
+    parser.add_argument('--metrics_port', type=int, default=0, help="Port for the Prometheus metrics endpoint (0 disables it)")
     args = parser.parse_args()
 
     logging.info("Starting RadarDataCollector main function.")
@@ -200,6 +221,9 @@ def main():
     start_time = time.time()
 
     data_queue = queue.Queue()
+    SAVE_QUEUE_DEPTH.set_function(data_queue.qsize)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
     saving_thread = threading.Thread(target=data_saving_thread, args=(args.base_filename, data_queue, stop_event, data_output_directory))
     saving_thread.start()
 
@@ -208,7 +232,8 @@ def main():
         stop_event=stop_event,
         deployed_sensor_id=args.deployed_sensor_id,
         central_server_url=args.central_server_url,
-        sync_polling_interval=10
+        sync_polling_interval=10,
+        time_sync_transport=args.time_sync_transport
     )
 
     radar_data_collector.start_time_sync()
@@ -227,6 +252,12 @@ def main():
         sequence = device.create_simple_sequence(config)
         device.set_acquisition_sequence(sequence)
 
+        # Two-phase start: the device is configured, so report ready and start on the shared timestamp
+        if args.wait_for_start:
+            if wait_for_start(stop_event) is None:
+                stop_event.set()
+            start_time = time.time()
+
         last_frame_perf = None
         total_frame_gap_duration = 0.0
         expected_frame_interval = config.frame_repetition_time_s
@@ -251,6 +282,8 @@ def main():
 
                 frame_end_perf = time.perf_counter()  # Precise end time for calculations
                 frame_end_datetime = datetime.now()  # Human-readable end time
+                FRAMES_CAPTURED.inc()
+                FRAME_READ_SECONDS.observe(frame_end_perf - frame_start_perf)
 
                 # Calculate processing duration using perf_counter
                 frame_processing_duration = frame_end_perf - frame_start_perf
@@ -263,6 +296,7 @@ def main():
                 timestamp = frame_start_datetime
                 buffer.append(frame_contents)
                 frame_timestamps_list.append(timestamp)
+                BUFFERED_FRAMES.set(len(buffer))
 
                 # Set buffer_start_perf for the first frame in the buffer
                 if buffer_start_perf is None:
@@ -274,6 +308,8 @@ def main():
                     if time_gap_between_frames > frame_gap_threshold:
                         gap_duration = time_gap_between_frames - expected_frame_interval
                         total_frame_gap_duration += gap_duration
+                        FRAME_GAPS.inc()
+                        FRAME_GAP_SECONDS.inc(gap_duration)
                         print(f"Gap detected: {gap_duration:.6f} seconds "
                             f"(time_gap_between_frames = {time_gap_between_frames:.6f} seconds)")
                         logging.info(f"Gap detected: {gap_duration:.6f} seconds "
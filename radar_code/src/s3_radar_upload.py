@@ -1,76 +1,39 @@
 import argparse
-import pprint
 import numpy as np
 import signal
-import sys
 import time
-import json
 import os
+import queue
+import logging
 import threading
-from datetime import datetime, timedelta
-import boto3
-from botocore.exceptions import NoCredentialsError
+from datetime import datetime
 
-from ifxradarsdk import get_version_full
 from ifxradarsdk.fmcw import DeviceFmcw
-from ifxradarsdk.fmcw.types import create_dict_from_sequence, FmcwSimpleSequenceConfig, FmcwMetrics, FmcwSequenceChirp
+from ifxradarsdk.fmcw.types import FmcwSimpleSequenceConfig, FmcwSequenceChirp
 
-# Global duration for recording
+from upload_service import UploadService, add_backend_arguments, make_backend
+
+# Length of each output file; files rotate after this many seconds' worth of frames
 RECORDING_DURATION = 20  # seconds
-print(f"Recording for {RECORDING_DURATION} seconds in each thread.")
+
+DATA_ROOT = '/home/dcope_rpi5_32bit/LabX/data/radar'
 
 # AWS S3 bucket information
 S3_BUCKET_NAME = 'test-lab-in-a-box-storage'
 
-# Initialize AWS S3 client
-s3_client = boto3.client('s3')
+# Files are uploaded in the background from a persistent queue, so acquisition never waits on S3
+UPLOAD_QUEUE_DB = os.path.join(DATA_ROOT, 'upload_queue.db')
 
 # Global event to signal threads to stop
 stop_event = threading.Event()
+
 # -------------------------------------------------
 # Radar Helpers
 # -------------------------------------------------
 
-def upload_to_s3(file_path):
-    """Upload the file to S3 and delete it locally after successful upload."""
-    try:
-        s3_client.upload_file(file_path, S3_BUCKET_NAME, os.path.basename(file_path))
-        print(f"Uploaded {file_path} to S3 bucket {S3_BUCKET_NAME}.")
-        os.remove(file_path)
-        print(f"Local file {file_path} deleted after upload.")
-    except NoCredentialsError:
-        print("Credentials not available for S3 upload.")
-    except Exception as e:
-        print(f"Failed to upload {file_path} to S3: {e}")
-
-def save_data_to_buffer(data, buffer):
-    """Append data to the buffer."""
-    buffer.append(data)
-
-def save_buffer_to_file(buffer, folder_path):
-    """Save buffer data to an .npy file."""
-    filename = f"data_{datetime.now().strftime('%Y%m%d_%H%M%S%f')[:-3]}.npy"
-    file_path = os.path.join(folder_path, filename)
-    print(f"Shape of buffer: {np.concatenate(buffer, axis=0).shape}")
-    np.save(file_path, np.concatenate(buffer, axis=0))
-    print(f"Saved {len(buffer)} frames to {filename}")
-    buffer.clear()
-    return file_path
-
-
-
-def radar_data_recording(thread_id):
-    """Record radar data in 20-second intervals."""
-    folder_name = f"DATA_{datetime.now().strftime('%Y%m%d_%H%M%S%f')[:-3]}_thread{thread_id}"
-    full_folder_path = os.path.join('/home/dcope_rpi5_32bit/LabX/data/radar', folder_name)
-    os.makedirs(full_folder_path, exist_ok=True)
-
-    parser = argparse.ArgumentParser(description='''Derives raw data and saves to .npy file''')
-    parser.add_argument('-f', '--frate', type=float, default=1/1.28, help="frame rate in Hz, default 5")
-    args = parser.parse_args()
-
-    config = FmcwSimpleSequenceConfig(
-        frame_repetition_time_s=1 / args.frate,
+def build_config(frate):
+    return FmcwSimpleSequenceConfig(
+        frame_repetition_time_s=1 / frate,
         chirp_repetition_time_s=0.005,
         num_chirps=256,
         tdm_mimo=True,
@@ -88,62 +51,112 @@ def radar_data_recording(thread_id):
         )
     )
 
+
+def save_buffer_to_file(buffer, frame_timestamps, folder_path):
+    """Save frames to an .npz named after the first frame, with every frame's epoch timestamp."""
+    first_frame = datetime.fromtimestamp(frame_timestamps[0]).strftime('%Y%m%d_%H%M%S%f')[:-3]
+    filename = f"data_{first_frame}.npz"
+    file_path = os.path.join(folder_path, filename)
+    np.savez(file_path, data=np.concatenate(buffer, axis=0), frame_timestamps=np.array(frame_timestamps))
+    print(f"Saved {len(buffer)} frames to {filename}")
+    return file_path
+
+
+def data_saving_thread(save_queue, folder_path, upload_service):
+    """Write finished files and queue them for upload, off the acquisition thread."""
+    while not stop_event.is_set() or not save_queue.empty():
+        try:
+            buffer, frame_timestamps = save_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        file_path = save_buffer_to_file(buffer, frame_timestamps, folder_path)
+        upload_service.enqueue(file_path, os.path.basename(file_path))
+        save_queue.task_done()
+
+
+def acquire_continuously(device, frames_per_file, save_queue, on_rotate=None):
+    """
+    Read frames from the open device until stop_event is set, handing every frames_per_file
+    frames to the saving thread. Acquisition never pauses at a file boundary; on_rotate is
+    called with each finished file's frame timestamps.
+    """
     buffer = []
-    BUFFER_SIZE = int(np.round(20 / config.frame_repetition_time_s))  # 20 seconds of data
+    frame_timestamps = []
+    while not stop_event.is_set():
+        frame_time = time.time()  # When the read of this frame started
+        try:
+            frame_contents = device.get_next_frame()
+        except Exception as e:
+            print(f"Error capturing frame: {e}")
+            continue
+        buffer.append(frame_contents)
+        frame_timestamps.append(frame_time)
+
+        if len(buffer) >= frames_per_file:
+            save_queue.put((buffer, frame_timestamps))
+            if on_rotate is not None:
+                on_rotate(frame_timestamps)
+            buffer = []
+            frame_timestamps = []
+
+    if buffer:
+        save_queue.put((buffer, frame_timestamps))
+
+
+def build_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-f', '--frate', type=float, default=1/1.28, help="frame rate in Hz, default 5")
+    parser.add_argument('--frames_per_file', type=int, default=None,
+                        help=f"Frames per output file (default: {RECORDING_DURATION} s worth)")
+    add_backend_arguments(parser)
+    parser.set_defaults(bucket=S3_BUCKET_NAME, queue_db=UPLOAD_QUEUE_DB)
+    return parser
 
-    with DeviceFmcw() as device:
-        sequence = device.create_simple_sequence(config)
-        device.set_acquisition_sequence(sequence)
 
-        start_time = time.time()
-        while not stop_event.is_set() and (time.time() - start_time) < RECORDING_DURATION:
-            try:
-                frame_contents = device.get_next_frame()
-                save_data_to_buffer(frame_contents, buffer)
-            except Exception as e:
-                print(f"Error capturing frame: {e}")
+def radar_data_recording(args, on_rotate=None):
+    """Open the radar once and record until stopped, rotating files on frame-count boundaries."""
+    folder_name = f"DATA_{datetime.now().strftime('%Y%m%d_%H%M%S%f')[:-3]}"
+    full_folder_path = os.path.join(DATA_ROOT, folder_name)
+    os.makedirs(full_folder_path, exist_ok=True)
 
-            if len(buffer) >= BUFFER_SIZE:
-                file_path = save_buffer_to_file(buffer, full_folder_path)
-                upload_thread = threading.Thread(target=upload_to_s3, args=(file_path,))
-                upload_thread.start()
-                upload_thread.join()
+    config = build_config(args.frate)
+    frames_per_file = args.frames_per_file or int(np.round(RECORDING_DURATION / config.frame_repetition_time_s))
+    print(f"Recording {frames_per_file} frames ({frames_per_file * config.frame_repetition_time_s:.1f} s) per file.")
 
-        if buffer:
-            file_path = save_buffer_to_file(buffer, full_folder_path)
-            upload_thread = threading.Thread(target=upload_to_s3, args=(file_path,))
-            upload_thread.start()
-            upload_thread.join()
+    upload_service = UploadService(make_backend(args), args.queue_db, max_concurrency=args.upload_concurrency)
+    upload_service.start()
+    save_queue = queue.Queue()
+    saving_thread = threading.Thread(target=data_saving_thread, args=(save_queue, full_folder_path, upload_service))
+    saving_thread.start()
 
-    print(f"Thread {thread_id} completed recording and uploading.")
+    try:
+        with DeviceFmcw() as device:
+            sequence = device.create_simple_sequence(config)
+            device.set_acquisition_sequence(sequence)
+            acquire_continuously(device, frames_per_file, save_queue, on_rotate)
+    finally:
+        stop_event.set()
+        saving_thread.join()
+        upload_service.stop()  # Unfinished uploads stay queued and resume on the next start
+    print("Recording stopped.")
 
 
 def handle_termination(signum, frame):
     """Handle termination signals for graceful shutdown."""
-    print("Received termination signal. Cleaning up...")
+    print("Received termination signal. Saving the last file...")
     stop_event.set()
-    sys.exit(0)
 
-# Register the signal handler for SIGTERM (termination signal) and SIGINT (interrupt signal)
-signal.signal(signal.SIGTERM, handle_termination)
-signal.signal(signal.SIGINT, handle_termination)
 
-if __name__ == '__main__':
-    thread_id = 0
-    try:
-        while True:
-            if stop_event.is_set():
-                break
+def main():
+    args = build_parser('''Records radar data continuously to .npz files and uploads them to S3''').parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-            radar_thread = threading.Thread(target=radar_data_recording, args=(thread_id,))
-            radar_thread.start()
-            radar_thread.join()
+    # Register the signal handler for SIGTERM (termination signal) and SIGINT (interrupt signal)
+    signal.signal(signal.SIGTERM, handle_termination)
+    signal.signal(signal.SIGINT, handle_termination)
 
-            thread_id += 1
+    radar_data_recording(args)
 
-    except KeyboardInterrupt:
-        print("Interrupted. Cleaning up...")
-        stop_event.set()
-    except Exception as e:
-        print(f"An error occurred: {e}")
-        stop_event.set()
\ No newline at end of file
+
+if __name__ == '__main__':
+    main()
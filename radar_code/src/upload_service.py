@@ -0,0 +1,411 @@
+# upload_service.py
+import os
+import json
+import time
+import uuid
+import base64
+import random
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+
+PART_SIZE = 8 * 1024 * 1024  # Bytes per multipart part (S3 needs at least 5 MiB for all but the last)
+MAX_CONCURRENCY = 2  # Files uploaded at once; parts of one file go in order
+BASE_BACKOFF_S = 2.0  # First retry delay, doubled per failed attempt
+MAX_BACKOFF_S = 300.0  # Retries never stop, but wait at most this long
+RESTART_AFTER_ATTEMPTS = 3  # Failed attempts before a multipart upload is aborted and started over
+
+CREATE_QUEUE_SQL = """
+    CREATE TABLE IF NOT EXISTS uploads (
+        path TEXT PRIMARY KEY,
+        key TEXT NOT NULL,
+        size INTEGER,
+        enqueued_at REAL,
+        attempts INTEGER DEFAULT 0,
+        next_attempt REAL DEFAULT 0,
+        upload_id TEXT,
+        parts TEXT,
+        last_error TEXT
+    )
+"""
+
+
+def multipart_etag(part_md5s):
+    """S3 ETag of an object: MD5 of a single-part upload, or MD5 of the part digests plus '-<parts>'."""
+    if len(part_md5s) == 1:
+        return part_md5s[0]
+    combined = hashlib.md5(b''.join(bytes.fromhex(digest) for digest in part_md5s))
+    return f"{combined.hexdigest()}-{len(part_md5s)}"
+
+
+# --------------------------------------
+# Backends
+# --------------------------------------
+
+class LocalDirectoryBackend:
+    """
+    Object store stand-in that keeps objects as files under root, for offline tests.
+
+    Parts are staged under root/.multipart/<upload_id>/ and joined on completion, and each
+    object's size and S3-style ETag are kept in root/.meta/, so the service verifies against
+    it exactly as it does against S3.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, '.multipart'), exist_ok=True)
+        os.makedirs(os.path.join(root, '.meta'), exist_ok=True)
+
+    def _object_path(self, key):
+        return os.path.join(self.root, key)
+
+    def _meta_path(self, key):
+        return os.path.join(self.root, '.meta', key.replace('/', '%2F') + '.json')
+
+    def _write_object(self, key, chunks, etag):
+        path = self._object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        size = 0
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(temp_path, path)
+        with open(self._meta_path(key), 'w') as f:
+            json.dump({'size': size, 'etag': etag}, f)
+
+    def put(self, key, data):
+        self._write_object(key, [data], hashlib.md5(data).hexdigest())
+
+    def start_multipart(self, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root, '.multipart', upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, number, data):
+        staging = os.path.join(self.root, '.multipart', upload_id)
+        if not os.path.isdir(staging):
+            raise KeyError(f"No such upload: {upload_id}")
+        with open(os.path.join(staging, f"{number:05d}"), 'wb') as f:
+            f.write(data)
+        return hashlib.md5(data).hexdigest()
+
+    def complete_multipart(self, key, upload_id, parts):
+        staging = os.path.join(self.root, '.multipart', upload_id)
+
+        def chunks():
+            for number, _ in parts:
+                with open(os.path.join(staging, f"{number:05d}"), 'rb') as f:
+                    yield f.read()
+        self._write_object(key, chunks(), multipart_etag([etag for _, etag in parts]))
+        self.abort_multipart(key, upload_id)
+
+    def abort_multipart(self, key, upload_id):
+        staging = os.path.join(self.root, '.multipart', upload_id)
+        if os.path.isdir(staging):
+            for name in os.listdir(staging):
+                os.remove(os.path.join(staging, name))
+            os.rmdir(staging)
+
+    def head(self, key):
+        """(size, etag) of a stored object, or None."""
+        try:
+            with open(self._meta_path(key)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        return meta['size'], meta['etag']
+
+
+class S3Backend:
+    """
+    S3 or an S3-compatible server (e.g. MinIO on localhost via endpoint_url).
+
+    boto3 is imported here so the service and the local backend work without it.
+    Every part is sent with its Content-MD5, so the server rejects corrupted parts.
+    """
+
+    def __init__(self, bucket, endpoint_url=None):
+        import boto3
+        self.bucket = bucket
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+
+    @staticmethod
+    def _content_md5(data):
+        return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentMD5=self._content_md5(data))
+
+    def start_multipart(self, key):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+
+    def upload_part(self, key, upload_id, number, data):
+        response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                           Body=data, ContentMD5=self._content_md5(data))
+        return response['ETag'].strip('"')
+
+    def complete_multipart(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': f'"{etag}"'} for number, etag in parts]}
+        )
+
+    def abort_multipart(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+    def head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return response['ContentLength'], response['ETag'].strip('"')
+
+
+def add_backend_arguments(parser):
+    """Add the --backend options shared by the upload scripts."""
+    parser.add_argument('--backend', choices=['s3', 'local'], default='s3', help="Upload to S3, or copy into --target_dir (offline testing)")
+    parser.add_argument('--bucket', type=str, default='test-lab-in-a-box-storage', help="S3 bucket")
+    parser.add_argument('--endpoint_url', type=str, default=None, help="S3-compatible server, e.g. http://127.0.0.1:9000 for MinIO")
+    parser.add_argument('--target_dir', type=str, default=None, help="Destination folder of the local backend")
+    parser.add_argument('--queue_db', type=str, default=os.path.expanduser('~/labx_master/radar_code/data/upload_queue.db'),
+                        help="Persistent upload queue; pending uploads resume from it after a restart")
+    parser.add_argument('--upload_concurrency', type=int, default=MAX_CONCURRENCY, help="Files uploaded at once")
+
+
+def make_backend(args):
+    if args.backend == 'local':
+        if not args.target_dir:
+            raise ValueError("--backend local needs --target_dir")
+        return LocalDirectoryBackend(args.target_dir)
+    return S3Backend(args.bucket, args.endpoint_url)
+
+
+# --------------------------------------
+# Upload service
+# --------------------------------------
+
+class UploadService:
+    """
+    Background uploader with a persistent queue, so capture never waits on the network.
+
+    enqueue() records the file in a SQLite queue (WAL) and returns at once. max_concurrency
+    worker threads upload queued files: small files in one request, larger ones in
+    part_size parts whose progress (upload ID and part ETags) is saved after every part, so an
+    interrupted upload resumes where it stopped, even after a restart. Failed uploads are
+    retried with exponential backoff and jitter, without limit; a multipart upload that keeps
+    failing is aborted and started over every RESTART_AFTER_ATTEMPTS attempts. A local file is deleted only
+    after the stored object's size and ETag match what was read from disk.
+    """
+
+    def __init__(self, backend, queue_db, max_concurrency=MAX_CONCURRENCY, part_size=PART_SIZE,
+                 delete_after_upload=True):
+        self.backend = backend
+        self.queue_db = queue_db
+        self.max_concurrency = max_concurrency
+        self.part_size = part_size
+        self.delete_after_upload = delete_after_upload
+
+        os.makedirs(os.path.dirname(os.path.abspath(queue_db)), exist_ok=True)
+        self.conn = sqlite3.connect(queue_db, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(CREATE_QUEUE_SQL)
+        self.conn.commit()
+
+        self.lock = threading.Lock()  # Guards the connection and in_flight
+        self.changed = threading.Condition(self.lock)
+        self.in_flight = set()
+        self.stop_event = threading.Event()
+        self.workers = []
+        self.uploaded = 0
+
+    def start(self):
+        pending = self.pending_count()
+        if pending:
+            logging.info(f"Resuming {pending} queued uploads from {self.queue_db}")
+        self.workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.max_concurrency)]
+        for worker in self.workers:
+            worker.start()
+
+    def enqueue(self, path, key=None):
+        """Queue path for upload as key (default: its file name). Only touches local disk."""
+        key = key or os.path.basename(path)
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO uploads (path, key, size, enqueued_at) VALUES (?, ?, ?, ?)",
+                    (path, key, os.path.getsize(path), time.time())
+                )
+            self.changed.notify()
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+
+    def drain(self, timeout=None):
+        """Wait until the queue is empty; returns False if uploads are still pending after timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending_count():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+        return True
+
+    def stop(self, drain_timeout=0):
+        """Stop the workers, after waiting up to drain_timeout for the queue to empty. Pending rows stay queued."""
+        if drain_timeout:
+            self.drain(drain_timeout)
+        self.stop_event.set()
+        with self.lock:
+            self.changed.notify_all()
+        for worker in self.workers:
+            worker.join()
+        remaining = self.pending_count()
+        self.conn.close()
+        logging.info(f"Upload service stopped: {self.uploaded} uploaded, {remaining} left queued")
+
+    # --------------------------------------
+    # Workers
+    # --------------------------------------
+
+    def _claim(self):
+        """Next due row not being uploaded, waiting until one is due; None when stopping."""
+        with self.lock:
+            while not self.stop_event.is_set():
+                now = time.time()
+                rows = self.conn.execute(
+                    "SELECT next_attempt, path, key, size, attempts, upload_id, parts FROM uploads "
+                    "ORDER BY next_attempt, enqueued_at"
+                ).fetchall()
+                waiting = [row for row in rows if row[1] not in self.in_flight]
+                if waiting and waiting[0][0] <= now:
+                    self.in_flight.add(waiting[0][1])
+                    return waiting[0][1:]
+                wake = waiting[0][0] if waiting else None
+                self.changed.wait(None if wake is None else max(0.05, wake - now))
+        return None
+
+    def _worker(self):
+        while True:
+            row = self._claim()
+            if row is None:
+                return
+            path, key, size, attempts, upload_id, parts = row
+            try:
+                self._upload(path, key, size, upload_id, json.loads(parts) if parts else [])
+            except InterruptedError:
+                pass  # Stopping; progress is saved and resumes on the next start
+            except Exception as e:
+                self._retry_later(path, key, attempts + 1, e)
+            finally:
+                with self.lock:
+                    self.in_flight.discard(path)
+                    self.changed.notify()
+
+    def _save(self, sql, params):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(sql, params)
+
+    def _retry_later(self, path, key, attempts, error):
+        delay = min(MAX_BACKOFF_S, BASE_BACKOFF_S * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        logging.warning(f"Upload of {path} failed (attempt {attempts}), retrying in {delay:.0f} s: {error}")
+        self._save("UPDATE uploads SET attempts = ?, next_attempt = ?, last_error = ? WHERE path = ?",
+                   (attempts, time.time() + delay, str(error), path))
+        if attempts % RESTART_AFTER_ATTEMPTS == 0:
+            # The saved upload may have expired server-side; abort it and start over
+            with self.lock:
+                row = self.conn.execute("SELECT upload_id FROM uploads WHERE path = ?", (path,)).fetchone()
+            if row is not None and row[0] is not None:
+                self._discard_multipart(path, key, row[0])
+
+    def _discard_multipart(self, path, key, upload_id):
+        try:
+            self.backend.abort_multipart(key, upload_id)
+        except Exception as e:
+            logging.debug(f"Could not abort upload {upload_id} of {key}: {e}")
+        self._save("UPDATE uploads SET upload_id = NULL, parts = NULL WHERE path = ?", (path,))
+
+    def _upload(self, path, key, size, upload_id, parts):
+        """Upload one file (resuming saved multipart progress), verify it, then dequeue and delete it."""
+        if not os.path.exists(path):
+            logging.warning(f"Queued file {path} no longer exists; dropping it from the queue")
+            self._save("DELETE FROM uploads WHERE path = ?", (path,))
+            return
+        if os.path.getsize(path) != size:
+            raise IOError(f"{path} changed size since it was queued")
+
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            if size <= self.part_size:
+                data = f.read()
+                self.backend.put(key, data)
+                expected_etag = hashlib.md5(data).hexdigest()
+            else:
+                if upload_id is None:
+                    upload_id = self.backend.start_multipart(key)
+                    parts = []
+                    self._save("UPDATE uploads SET upload_id = ?, parts = ? WHERE path = ?", (upload_id, '[]', path))
+                done = {number: (etag, md5) for number, etag, md5 in parts}
+                part_md5s = []
+                for number in range(1, (size + self.part_size - 1) // self.part_size + 1):
+                    if self.stop_event.is_set():
+                        raise InterruptedError("Upload service stopping")
+                    if number in done:
+                        part_md5s.append(done[number][1])
+                        continue
+                    f.seek((number - 1) * self.part_size)
+                    data = f.read(self.part_size)
+                    md5 = hashlib.md5(data).hexdigest()
+                    etag = self.backend.upload_part(key, upload_id, number, data)
+                    parts.append([number, etag, md5])
+                    part_md5s.append(md5)
+                    self._save("UPDATE uploads SET parts = ? WHERE path = ?", (json.dumps(parts), path))
+                self.backend.complete_multipart(key, upload_id, sorted((number, etag) for number, etag, _ in parts))
+                expected_etag = multipart_etag(part_md5s)
+
+        stored = self.backend.head(key)
+        if stored != (size, expected_etag):
+            if upload_id is not None:
+                self._discard_multipart(path, key, upload_id)
+            raise IOError(f"Verification failed for {key}: stored {stored}, expected {(size, expected_etag)}")
+
+        self._save("DELETE FROM uploads WHERE path = ?", (path,))
+        if self.delete_after_upload:
+            os.remove(path)
+        self.uploaded += 1
+        elapsed = time.perf_counter() - start
+        logging.info(f"Uploaded {path} as {key}: {size / 1e6:.1f} MB in {elapsed:.1f} s "
+                     f"({size / 1e6 / elapsed if elapsed > 0 else 0.0:.1f} MB/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload files through the persistent upload queue")
+    parser.add_argument('files', nargs='*', help="Files to queue (already queued files are resumed as well)")
+    parser.add_argument('--key_prefix', type=str, default='', help="Prefix of the object keys, e.g. 'radar/<host>/'")
+    parser.add_argument('--keep_files', action='store_true', help="Keep local files after a verified upload")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    service = UploadService(make_backend(args), args.queue_db, max_concurrency=args.upload_concurrency,
+                            delete_after_upload=not args.keep_files)
+    for path in args.files:
+        service.enqueue(os.path.abspath(path), args.key_prefix + os.path.basename(path))
+    service.start()
+    try:
+        service.drain()
+    except KeyboardInterrupt:
+        print("Interrupted; unfinished uploads stay queued.")
+    service.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,54 @@
 import time
+import socket
 import subprocess
 import requests
 from threading import Thread, Event
 from datetime import datetime
+from urllib.parse import urlsplit
 import logging
 
+from shared_sensor_code.telemetry_protocol import (
+    ACK, ACK_OK, DEFAULT_TELEMETRY_PORT, MAX_BATCH_RECORDS, encode_batch, encode_record, parse_chronyc_output
+)
+
+from shared_sensor_code.metrics_registry import Counter, Gauge, Histogram
+
+TIME_SYNC_TRANSPORTS = ('json', 'binary')
+MAX_BUFFERED_REPORTS = 360  # Reports kept while the server is unreachable (1 h at 10 s polling)
+
+REPORTS_SENT = Counter('labx_timesync_reports_total', 'Time sync reports by transport and result.', ['transport', 'result'])
+SEND_SECONDS = Histogram('labx_timesync_send_seconds', 'Time to deliver one time sync report or batch.', ['transport'])
+OFFSET_SECONDS = Gauge('labx_timesync_offset_seconds', 'Latest chrony system time offset (positive = fast).')
+ROOT_DISPERSION_SECONDS = Gauge('labx_timesync_root_dispersion_seconds', 'Latest chrony root dispersion.')
+PENDING_REPORTS = Gauge('labx_timesync_pending_reports', 'Binary reports waiting for a full batch or a retry.')
+
+
 class TimeSync:
-    def __init__(self, deployed_sensor_id, central_server_url, sync_polling_interval=10):
+    def __init__(self, deployed_sensor_id, central_server_url, sync_polling_interval=10,
+                 transport='json', batch_size=1, telemetry_port=DEFAULT_TELEMETRY_PORT):
+        """
+        transport='json' posts the raw chronyc output to central_server_url for every poll.
+        transport='binary' parses it locally and sends packed records (see telemetry_protocol),
+        batch_size reports per frame, over one persistent TCP connection to telemetry_port on
+        the central server host. If that connection fails, the buffered reports are posted as
+        JSON instead, oldest first until one POST fails, and the rest stay buffered for the next
+        batch, which retries the binary connection.
+        """
+        if transport not in TIME_SYNC_TRANSPORTS:
+            raise ValueError(f"Unknown time sync transport '{transport}', expected one of {TIME_SYNC_TRANSPORTS}")
         self.deployed_sensor_id = deployed_sensor_id
         self.central_server_url = central_server_url
         self.sync_polling_interval = sync_polling_interval
+        self.transport = transport
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_RECORDS))
+        self.telemetry_address = (urlsplit(central_server_url).hostname, telemetry_port)
         self.stop_event = Event()
         self.last_tracking_output = None  # Store the last tracking output
+        self.pending_reports = []  # [(timestamp, chronyc_output, record)] waiting for a full batch
+        self.telemetry_socket = None
 
         # Log initialization
-        logging.info(f"TimeSync initialized for sensor ID {self.deployed_sensor_id}")
+        logging.info(f"TimeSync initialized for sensor ID {self.deployed_sensor_id} ({self.transport} transport)")
 
     def collect_and_send_time_sync_data(self):
         """Collects Chrony data and sends it to the server at regular intervals."""
@@ -25,29 +59,21 @@ class TimeSync:
                 # Fetch tracking information
                 tracking_result = subprocess.run(['chronyc', 'tracking'], stdout=subprocess.PIPE, text=True)
                 tracking_output = tracking_result.stdout
+                self.last_tracking_output = tracking_output
                 logging.info(f"Tracking information fetched.")
 
                 # Get current time
                 current_time = time.time()
+                chrony_data = parse_chronyc_output(tracking_output)
+                if chrony_data and 'system_time_offset' in chrony_data:
+                    offset = chrony_data['system_time_offset']
+                    OFFSET_SECONDS.set(-offset if chrony_data.get('system_time_slow') else offset)
+                    ROOT_DISPERSION_SECONDS.set(chrony_data.get('root_dispersion', float('nan')))
 
-                # Prepare payload
-                payload = {
-                    'deployed_sensor_id': self.deployed_sensor_id,
-                    'data': {
-                        'timestamp': current_time,
-                        'chronyc_output': tracking_output
-                    }
-                }
-                logging.info(f"Sending payload: {payload}")
-
-                try:
-                    response = requests.post(self.central_server_url, json=payload, timeout=5)
-                    if response.status_code == 200:
-                        logging.info(f"Successfully sent Chrony data to server at {datetime.fromtimestamp(current_time)}")
-                    else:
-                        logging.warning(f"Failed to send data: HTTP {response.status_code} - {response.text}")
-                except requests.exceptions.RequestException as e:
-                    logging.error(f"Exception during HTTP POST to {self.central_server_url}: {e}")
+                if self.transport == 'binary':
+                    self.queue_binary_report(current_time, tracking_output, chrony_data)
+                else:
+                    self.post_json(current_time, tracking_output)
             except Exception as e:
                 logging.error(f"Error collecting or sending Chrony data: {e}")
 
@@ -57,6 +83,101 @@ class TimeSync:
                 logging.info("Stop event set, exiting TimeSync polling loop.")
                 break
 
+        # Send whatever is left of a partial batch before exiting
+        if self.pending_reports:
+            self.send_pending_reports()
+        self.close_telemetry_socket()
+
+    # --------------------------------------
+    # JSON transport
+    # --------------------------------------
+
+    def post_json(self, current_time, tracking_output):
+        """POST one report to /receive_data; returns True on HTTP 200."""
+        payload = {
+            'deployed_sensor_id': self.deployed_sensor_id,
+            'data': {
+                'timestamp': current_time,
+                'chronyc_output': tracking_output
+            }
+        }
+        logging.info(f"Sending payload: {payload}")
+
+        try:
+            with SEND_SECONDS.labels('json').time():
+                response = requests.post(self.central_server_url, json=payload, timeout=5)
+            if response.status_code == 200:
+                logging.info(f"Successfully sent Chrony data to server at {datetime.fromtimestamp(current_time)}")
+                REPORTS_SENT.labels('json', 'ok').inc()
+                return True
+            logging.warning(f"Failed to send data: HTTP {response.status_code} - {response.text}")
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Exception during HTTP POST to {self.central_server_url}: {e}")
+        REPORTS_SENT.labels('json', 'failed').inc()
+        return False
+
+    # --------------------------------------
+    # Binary transport
+    # --------------------------------------
+
+    def queue_binary_report(self, current_time, tracking_output, chrony_data):
+        if not chrony_data or 'system_time_offset' not in chrony_data or 'root_dispersion' not in chrony_data:
+            # Let the server log the unparseable output, as it would for the JSON transport
+            logging.warning("Could not parse chronyc output locally, sending it as JSON.")
+            self.post_json(current_time, tracking_output)
+            return
+        self.pending_reports.append((current_time, tracking_output, encode_record(current_time, chrony_data)))
+        if len(self.pending_reports) >= self.batch_size:
+            self.send_pending_reports()
+        PENDING_REPORTS.set(len(self.pending_reports))
+
+    def send_pending_reports(self):
+        """Send the buffered reports as one binary frame, falling back to JSON if that fails."""
+        try:
+            with SEND_SECONDS.labels('binary').time():
+                self.send_binary_batch([record for _, _, record in self.pending_reports])
+            logging.info(f"Sent {len(self.pending_reports)} binary time sync report(s) to {self.telemetry_address}")
+            REPORTS_SENT.labels('binary', 'ok').inc(len(self.pending_reports))
+            self.pending_reports = []
+            return
+        except (OSError, ConnectionError, ValueError) as e:
+            logging.error(f"Binary telemetry to {self.telemetry_address} failed, falling back to JSON: {e}")
+            REPORTS_SENT.labels('binary', 'failed').inc(len(self.pending_reports))
+            self.close_telemetry_socket()
+
+        # Stop at the first failed POST: with the server unreachable every further POST would also
+        # wait out its timeout, stalling the polling loop for up to MAX_BUFFERED_REPORTS of them
+        delivered = 0
+        for current_time, tracking_output, _ in self.pending_reports:
+            if not self.post_json(current_time, tracking_output):
+                break
+            delivered += 1
+        # Keep what neither transport delivered for the next attempt, dropping the oldest reports first
+        self.pending_reports = self.pending_reports[delivered:][-MAX_BUFFERED_REPORTS:]
+
+    def send_binary_batch(self, records):
+        if self.telemetry_socket is None:
+            self.telemetry_socket = socket.create_connection(self.telemetry_address, timeout=5)
+            self.telemetry_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.telemetry_socket.sendall(encode_batch(self.deployed_sensor_id, records))
+
+        reply = b''
+        while len(reply) < ACK.size:
+            chunk = self.telemetry_socket.recv(ACK.size - len(reply))
+            if not chunk:
+                raise ConnectionError("Server closed the telemetry connection")
+            reply += chunk
+        status, accepted = ACK.unpack(reply)
+        if status != ACK_OK or accepted != len(records):
+            raise ConnectionError(f"Server accepted {accepted} of {len(records)} records (status {status})")
+
+    def close_telemetry_socket(self):
+        if self.telemetry_socket is not None:
+            try:
+                self.telemetry_socket.close()
+            except OSError:
+                pass
+            self.telemetry_socket = None
 
     def start(self):
         """Start the time sync data collection."""
@@ -0,0 +1,273 @@
+import os
+import math
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal Prometheus-style metrics for the collectors and the central server.
+#
+# Metrics are plain Python objects updated under a per-metric lock (a counter increment is
+# one lock round trip and an add), so they are cheap enough for per-frame hot paths. The
+# text exposition format (version 0.0.4) is rendered only when /metrics is scraped.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}  # {label values: child metric}
+        if registry is None:
+            registry = REGISTRY
+        if registry is not False:
+            registry.register(self)
+
+    def labels(self, *values, **labelvalues):
+        """Child metric for one combination of label values, created on first use."""
+        if labelvalues:
+            values = tuple(str(labelvalues[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """Drop one label combination, e.g. a sensor that left the fleet."""
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def _new_child(self):
+        return type(self)(self.name, self.documentation, registry=False)
+
+    def _samples(self):
+        """Yield (suffix, label pairs, value) for this unlabelled metric."""
+        raise NotImplementedError
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            children = list(self._children.items())
+        else:
+            children = [((), self)]
+        for values, child in children:
+            for suffix, extra, value in child._samples():
+                lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. frames captured or bytes written."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self._value = 0.0
+        super().__init__(name, documentation, labelnames, registry)
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def _samples(self):
+        yield '', (), self._value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down; set_function() samples a callable at scrape time instead."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self._value = 0.0
+        self._function = None
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value):
+        self._value = float(value)
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, function):
+        """Read the value from function() on every scrape, e.g. a queue's qsize."""
+        self._function = function
+
+    @property
+    def value(self):
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return math.nan
+        return self._value
+
+    def _samples(self):
+        yield '', (), self.value
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets, e.g. frame read or flush durations."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # Per bucket, not cumulative; last is +Inf
+        self._sum = 0.0
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets, registry=False)
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def _samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield '_bucket', (('le', _format_value(bound)),), cumulative
+        yield '_sum', (), total
+        yield '_count', (), cumulative
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    """Set of metrics rendered together in the text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# --------------------------------------
+# Process metrics
+# --------------------------------------
+
+def _resident_memory_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def register_process_metrics(registry=None):
+    """CPU time, resident memory, thread count and start time of this process."""
+    registry = registry or REGISTRY
+    if registry.get('process_cpu_seconds_total') is not None:
+        return
+    # Read from the OS at scrape time, so it is a gauge callback exposed with counter semantics
+    cpu = Gauge('process_cpu_seconds_total', 'User and system CPU time spent in seconds.', registry=registry)
+    cpu.kind = 'counter'
+    cpu.set_function(lambda: sum(os.times()[:2]))
+    Gauge('process_resident_memory_bytes', 'Resident memory size in bytes.',
+          registry=registry).set_function(_resident_memory_bytes)
+    Gauge('process_threads', 'Number of Python threads.', registry=registry).set_function(threading.active_count)
+    Gauge('process_start_time_seconds', 'Start time of the process since unix epoch in seconds.',
+          registry=registry).set(time.time())
+
+
+# --------------------------------------
+# Exposition server
+# --------------------------------------
+
+def start_metrics_server(port, host='0.0.0.0', registry=None):
+    """Serve GET /metrics from a daemon thread; returns the server (call shutdown() to stop it)."""
+    registry = registry or REGISTRY
+    register_process_metrics(registry)
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.expose().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logging.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,80 @@
+import sys
+import time
+import logging
+
+# Two-phase capture start shared by the collectors and the control panel.
+#
+# Arm:    the collector starts with --wait_for_start, opens its device and prints READY_MESSAGE.
+# Commit: once every device is ready, the control panel writes "START <unix timestamp>" to each
+#         collector's stdin. Every collector sleeps until that instant and begins capturing, so
+#         the start skew between sensors is bounded by their clock sync, not by SSH or startup time.
+# "ABORT" (or closing stdin) cancels an armed collector.
+READY_MESSAGE = "LABX_READY"
+START_COMMAND = "START"
+ABORT_COMMAND = "ABORT"
+SPIN_WINDOW_S = 0.002  # Final stretch before the start time that is busy-waited instead of slept
+
+
+def announce_ready(stream=None):
+    """Tell the control panel that the device is open and the collector is armed."""
+    stream = stream or sys.stdout
+    print(READY_MESSAGE, file=stream, flush=True)
+    logging.info("Collector armed, waiting for the start command.")
+
+
+def read_start_command(stream=None):
+    """Block until a START line arrives; returns its timestamp, or None on ABORT or end of input."""
+    stream = stream or sys.stdin
+    for line in stream:
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == START_COMMAND and len(parts) == 2:
+            try:
+                return float(parts[1])
+            except ValueError:
+                logging.error(f"Invalid start timestamp: {line.strip()}")
+        elif parts[0] == ABORT_COMMAND:
+            logging.info("Capture aborted before start.")
+            return None
+    logging.warning("Start command stream closed before START was received.")
+    return None
+
+
+def sleep_until(target_time, stop_event=None, spin_window=SPIN_WINDOW_S):
+    """
+    Sleep until the wall-clock time target_time with sub-millisecond precision.
+
+    Sleeps coarsely until spin_window before the target, then busy-waits the rest, since a
+    plain sleep can overshoot by a scheduler tick. Returns how late (seconds) the call
+    returned, or None if stop_event was set first.
+    """
+    while True:
+        remaining = target_time - time.time()
+        if remaining <= spin_window:
+            break
+        # Wake up at least every 0.5 s so a stop request is noticed
+        coarse = min(remaining - spin_window, 0.5)
+        if stop_event is not None:
+            if stop_event.wait(coarse):
+                return None
+        else:
+            time.sleep(coarse)
+    while time.time() < target_time:
+        pass
+    return time.time() - target_time
+
+
+def wait_for_start(stop_event=None):
+    """Arm, wait for the START command and sleep until its timestamp; returns the timestamp or None."""
+    announce_ready()
+    start_timestamp = read_start_command()
+    if start_timestamp is None:
+        return None
+    if start_timestamp < time.time():
+        logging.warning(f"Start time {start_timestamp:.6f} already passed by {time.time() - start_timestamp:.3f} s, starting now.")
+    lateness = sleep_until(start_timestamp, stop_event)
+    if lateness is None:
+        return None
+    logging.info(f"Synchronized start at {start_timestamp:.6f} (woke {lateness * 1e6:.0f} us late).")
+    return start_timestamp
@@ -0,0 +1,112 @@
+import math
+import struct
+import logging
+
+# Binary time sync telemetry, sent over one persistent TCP connection per sensor.
+#
+# Batch frame:  BATCH_HEADER (magic, version, sensor id length, record count)
+#               + sensor id (UTF-8) + count x RECORD
+# Record:       timestamp, system time offset, root dispersion, root delay (float64 seconds),
+#               reference ID (uint32, chrony's hex ID) and stratum (uint8). The offset is
+#               negative for clocks slow of NTP time; decode_records returns its magnitude plus
+#               system_time_slow, the same form as parse_chronyc_output.
+# Reply:        one ACK per batch (status, number of records accepted)
+#
+# A record is 37 bytes against roughly 700 bytes of JSON with the chronyc text, and the
+# server unpacks it with struct instead of parsing text.
+TELEMETRY_MAGIC = b'LXTS'
+TELEMETRY_VERSION = 1
+BATCH_HEADER = struct.Struct('!4sBBH')
+RECORD = struct.Struct('!ddddIB')
+ACK = struct.Struct('!BH')
+
+ACK_OK = 0
+ACK_ERROR = 1
+MAX_BATCH_RECORDS = 1024
+UNKNOWN_STRATUM = 255
+
+DEFAULT_TELEMETRY_PORT = 5002
+
+
+class TelemetryProtocolError(ValueError):
+    """Raised for frames that do not follow the telemetry protocol."""
+
+
+def _parse_number(text):
+    return float(''.join(filter(lambda c: c.isdigit() or c == '.' or c == '-' or c == '+', text)))
+
+
+def parse_chronyc_output(chronyc_output):
+    """Extract offset, root dispersion/delay, reference ID and stratum from `chronyc tracking` text."""
+    data = {}
+    try:
+        for line in chronyc_output.strip().split('\n'):
+            if "System time" in line:
+                # chronyc reports the magnitude with "fast"/"slow"; the offset stays a magnitude
+                # and the direction is kept beside it
+                data['system_time_offset'] = _parse_number(line.split()[3])
+                data['system_time_slow'] = "slow" in line
+            elif "Root dispersion" in line:
+                data['root_dispersion'] = _parse_number(line.split()[3])
+            elif "Root delay" in line:
+                data['root_delay'] = _parse_number(line.split()[3])
+            elif "Reference ID" in line:
+                data['reference_id'] = line.split(":")[1].strip()
+            elif "Stratum" in line:
+                data['stratum'] = int(line.split(":")[1].strip())
+    except Exception as e:
+        logging.error(f"Error parsing chronyc output: {e}")
+        return None
+    return data
+
+
+def encode_record(timestamp, chrony_data):
+    """Pack one parsed chronyc sample; missing values become NaN / UNKNOWN_STRATUM / 0."""
+    reference_id = chrony_data.get('reference_id') or ''
+    try:
+        reference_code = int(reference_id.split(' ', 1)[0], 16) & 0xFFFFFFFF
+    except ValueError:
+        reference_code = 0
+    stratum = chrony_data.get('stratum')
+    offset = chrony_data.get('system_time_offset', math.nan)
+    return RECORD.pack(
+        timestamp,
+        -offset if chrony_data.get('system_time_slow') else offset,
+        chrony_data.get('root_dispersion', math.nan),
+        chrony_data.get('root_delay', math.nan),
+        reference_code,
+        UNKNOWN_STRATUM if stratum is None else min(int(stratum), UNKNOWN_STRATUM)
+    )
+
+
+def encode_batch(deployed_sensor_id, records):
+    """Frame already-encoded records (see encode_record) for one sensor."""
+    if not 0 < len(records) <= MAX_BATCH_RECORDS:
+        raise TelemetryProtocolError(f"Batch must hold 1-{MAX_BATCH_RECORDS} records, got {len(records)}")
+    sensor_id = deployed_sensor_id.encode()
+    return BATCH_HEADER.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, len(sensor_id), len(records)) + sensor_id + b''.join(records)
+
+
+def decode_batch_header(header):
+    """Return (sensor id length, record count) from a BATCH_HEADER-sized frame start."""
+    magic, version, id_length, count = BATCH_HEADER.unpack(header)
+    if magic != TELEMETRY_MAGIC:
+        raise TelemetryProtocolError("Bad telemetry magic")
+    if version != TELEMETRY_VERSION:
+        raise TelemetryProtocolError(f"Unsupported telemetry version {version}")
+    if not 0 < count <= MAX_BATCH_RECORDS:
+        raise TelemetryProtocolError(f"Invalid record count {count}")
+    return id_length, count
+
+
+def decode_records(payload):
+    """Yield (timestamp, chrony_data) for each packed record, in the same dict form as parse_chronyc_output."""
+    for timestamp, offset, dispersion, delay, reference_code, stratum in RECORD.iter_unpack(payload):
+        chrony_data = {'system_time_offset': abs(offset), 'system_time_slow': offset < 0, 'root_dispersion': dispersion}
+        if not math.isnan(delay):
+            chrony_data['root_delay'] = delay
+        if reference_code:
+            chrony_data['reference_id'] = f"{reference_code:08X}"
+        if stratum != UNKNOWN_STRATUM:
+            chrony_data['stratum'] = stratum
+        yield timestamp, chrony_data